@@ -0,0 +1,143 @@
+"""
+Measure how many high-value pages a page-limited crawl reaches, for different frontier orderings.
+
+Usage (from the repository root):
+
+    python -m benchmarks.frontier_coverage [--budget 200] [--categories 20] [--pages 50] [--products 10]
+
+The synthetic shop has a home page linking to its categories and to a few featured products. Each
+category has a long paginated listing (?page=1, ?page=2, ...), and each listing page links to its
+products and to the next page. The high-value pages are the home page, the categories, the featured
+products, and the products on the first page of each listing; the deep pagination is low-value.
+Pages are generated in memory, so only the crawler's own work is measured.
+"""
+
+import argparse
+import random
+import time
+
+from do_crawler.budget import CrawlBudget
+from do_crawler.crawler import Crawler
+from do_crawler.frontier import Frontier
+from do_crawler.sitemap_xml import SitemapEntry
+
+
+ROOT = 'http://shop.test'
+
+
+class SyntheticShop(object):
+    """ The link structure of the synthetic shop. """
+
+    def __init__(self, categories: int, pages: int, products: int, featured: int = 40):
+        self.categories = categories
+        self.pages = pages
+        self.products = products
+        self.featured = ['/product/featured-' + str(i) for i in range(featured)]
+
+    def links(self, path: str) -> list:
+        """ The links of the page at a path. """
+
+        if path == '/':
+            return ['/category/' + str(c) for c in range(self.categories)] + self.featured
+        if path.startswith('/category/'):
+            category, _, query = path[len('/category/'):].partition('?page=')
+            page = int(query or 1)
+            links = ['/product/' + category + '-' + str(page) + '-' + str(i) for i in range(self.products)]
+            if page < self.pages:
+                links.append('/category/' + category + '?page=' + str(page + 1))
+            return links + self.featured + ['/']
+        return ['/']
+
+    def high_value(self) -> set:
+        """ The pages a good crawl order should reach first. """
+
+        pages = {'/'} | set(self.featured)
+        for c in range(self.categories):
+            pages.add('/category/' + str(c))
+            pages.update('/product/' + str(c) + '-1-' + str(i) for i in range(self.products))
+        return pages
+
+    def sitemap_entries(self) -> dict:
+        """ sitemap.xml entries for the shop: top pages get high priorities, pagination low ones. """
+
+        priorities = {'/': 1.0}
+        priorities.update((path, 0.9) for path in self.featured)
+        for c in range(self.categories):
+            category = '/category/' + str(c)
+            priorities[category] = 0.8
+            for page in range(1, self.pages + 1):
+                if page > 1:
+                    priorities[category + '?page=' + str(page)] = 0.1
+                for i in range(self.products):
+                    priorities['/product/' + str(c) + '-' + str(page) + '-' + str(i)] = 0.7 if page == 1 else 0.3
+
+        return {path: SitemapEntry(ROOT + path, priority=priority) for path, priority in priorities.items()}
+
+
+class ShopCrawler(Crawler):
+    """ A crawler that fetches pages from a SyntheticShop instead of the network. """
+
+    def __init__(self, shop: SyntheticShop, seed: bool, **kwargs):
+        super().__init__(ROOT, seed_sitemaps=seed, **kwargs)
+        self.shop = shop
+
+    def _get_page_content(self, url: str) -> bytes:
+        path = url[len(ROOT):]
+        html = '<html><body><h1>' + path + '</h1>'
+        html += ''.join("<a href='" + link + "'></a>" for link in self.shop.links(path))
+        return bytes(html + '</body></html>', 'utf-8')
+
+    def _seed_from_sitemaps(self):
+        self._add_seeds({path: entry for path, entry in self.shop.sitemap_entries().items() if path != '/'})
+
+
+STRATEGIES = [
+    ('random (unordered set)', False, None, None),
+    ('fifo', False, {}, None),
+    ('depth (breadth-first)', False, {'depth': 1.0}, None),
+    ('depth + inlinks', False, {'depth': 1.0, 'inlinks': 1.0}, None),
+    ('depth + path weights', False, {'depth': 1.0}, [('*page=*', -5.0)]),
+    ('sitemap seeds + priority', True, {'sitemap': 10.0, 'depth': 1.0}, None),
+]
+
+
+def run(shop: SyntheticShop, budget: int, seed: bool, priorities: dict, path_weights: list) -> tuple:
+    """ Crawl the shop within a page budget; return the crawler and the time taken. """
+
+    c = ShopCrawler(shop, seed, budget=CrawlBudget(max_pages=budget), priorities=priorities,
+                    path_weights=path_weights)
+    if priorities is None:
+        rng = random.Random(0)
+        c.links_to_visit = Frontier(lambda url, inlinks: rng.random())
+
+    start = time.perf_counter()
+    c.crawl()
+    return c, time.perf_counter() - start
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=int, default=200, help='Pages per crawl (default: %(default)s).')
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--pages', type=int, default=50, help='Listing pages per category.')
+    parser.add_argument('--products', type=int, default=10, help='Products per listing page.')
+    args = parser.parse_args()
+
+    shop = SyntheticShop(args.categories, args.pages, args.products)
+    high_value = shop.high_value()
+    print('%d high-value pages, budget of %d pages\n' % (len(high_value), args.budget))
+
+    print('%-26s %8s %12s %9s' % ('frontier', 'visited', 'high-value', 'time'))
+    for name, seed, priorities, path_weights in STRATEGIES:
+        c, elapsed = run(shop, args.budget, seed, priorities, path_weights)
+        covered = len(high_value & c.sitemap.pages.keys())
+        print('%-26s %8d %6d (%3d%%) %8.2fs' % (
+            name, len(c.sitemap.pages), covered, 100 * covered // len(high_value), elapsed
+        ))
+
+
+if __name__ == '__main__':
+    main()
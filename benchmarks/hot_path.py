@@ -0,0 +1,269 @@
+"""
+Micro-benchmark the page processing hot path on the bundled HTML corpus, and check for regressions.
+
+Usage (from the repository root):
+
+    python -m benchmarks.hot_path [--threshold 0.2] [--rounds 5] [--min-time 0.5] [--save-baseline]
+
+Each function is timed separately, on every page of benchmarks/corpus (see benchmarks.make_corpus),
+fed the way the crawler feeds it:
+
+    link_classifier   LinkClassifier(url, content).static_assets and .same_domain_links (per page)
+    unquote_link      _unquote_link() on each raw link of a page (per link)
+    absolutize_link   absolutize_link() on each unquoted link, against the page's base URL (per link)
+    canonicalize      the default UrlCanonicalizer on each absolute link (per link)
+    cleanup_links     Page._cleanup_links() on a page's absolute forward links (per page)
+    compute_page_hash compute_page_hash() on the page content (per page)
+
+Each round runs passes over the corpus for at least --min-time seconds (like timeit.autorange),
+with the garbage collector off, and the canonicalizer's URL cache is cleared before each pass, so
+cache hits within a page count but a warm cache doesn't hide canonicalizer regressions. The
+median rate of --rounds rounds is reported, in calls per second; allocations are the peak memory
+(tracemalloc) allocated while processing one page, averaged over the pages.
+
+The results are compared with benchmarks/hot_path_baseline.json: the run fails (exit status 1)
+if a function is slower than its baseline, or allocates more, by more than --threshold. A function
+that looks slower is measured again, up to --confirm times, and its best result counts, so one
+slow spell of the machine doesn't fail the run. Baselines are machine-specific; after a deliberate
+change, or on a new machine, record a new one with --save-baseline (which updates the baseline of
+the benchmarks that ran).
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from bs4 import BeautifulSoup
+from do_crawler.link_classifier import (
+    DEFAULT_CANONICALIZER,
+    LinkClassifier,
+    _unquote_link,
+    absolutize_link
+)
+from do_crawler.sitemap import (
+    Page,
+    compute_page_hash
+)
+
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+BASELINE = os.path.join(os.path.dirname(__file__), 'hot_path_baseline.json')
+
+
+class CorpusPage(object):
+    """ A corpus page, and the inputs of each hot path function derived from it. """
+
+    def __init__(self, url: str, body: bytes):
+        self.url = url
+        # The crawler hands the classifier and the hasher str() of the response body.
+        self.content = str(body)
+
+        classifier = LinkClassifier(url, self.content)
+        soup = BeautifulSoup(self.content, 'html.parser')
+        self.base_url = classifier.base_url
+        self.raw_links = [
+            tag[link_type[1]]
+            for link_type in LinkClassifier.FORWARD_LINK_TAGS + LinkClassifier.STATIC_ASSET_TAGS
+            for tag in soup.find_all(link_type[0])
+            if tag.get(link_type[1])
+        ]
+        self.unquoted_links = [_unquote_link(link) for link in self.raw_links]
+        self.absolute_links = [absolutize_link(self.base_url, link) for link in self.unquoted_links]
+        self.links = classifier.same_domain_links
+        self.page = Page(url, compute_page_hash(self.content), classifier.static_assets, self.links)
+
+
+def load_corpus(directory: str = CORPUS_DIR) -> list:
+    """ Load the corpus pages listed in the manifest. """
+
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    pages = []
+    for entry in manifest:
+        with open(os.path.join(directory, entry['file']), 'rb') as f:
+            pages.append(CorpusPage(entry['url'], f.read()))
+    return pages
+
+
+# --- Benchmarked functions (each processes one page, and returns the number of calls it made):
+
+
+def bench_link_classifier(page: CorpusPage) -> int:
+    classifier = LinkClassifier(page.url, page.content)
+    classifier.static_assets
+    classifier.same_domain_links
+    return 1
+
+
+def bench_unquote_link(page: CorpusPage) -> int:
+    for link in page.raw_links:
+        _unquote_link(link)
+    return len(page.raw_links)
+
+
+def bench_absolutize_link(page: CorpusPage) -> int:
+    base_url = page.base_url
+    for link in page.unquoted_links:
+        absolutize_link(base_url, link)
+    return len(page.unquoted_links)
+
+
+def bench_canonicalize(page: CorpusPage) -> int:
+    for link in page.absolute_links:
+        DEFAULT_CANONICALIZER(link)
+    return len(page.absolute_links)
+
+
+def bench_cleanup_links(page: CorpusPage) -> int:
+    page.page.links = page.links
+    page.page._cleanup_links()
+    return 1
+
+
+def bench_compute_page_hash(page: CorpusPage) -> int:
+    compute_page_hash(page.content)
+    return 1
+
+
+BENCHMARKS = {
+    'link_classifier': bench_link_classifier,
+    'unquote_link': bench_unquote_link,
+    'absolutize_link': bench_absolutize_link,
+    'canonicalize': bench_canonicalize,
+    'cleanup_links': bench_cleanup_links,
+    'compute_page_hash': bench_compute_page_hash,
+}
+
+
+def _clear_caches():
+    DEFAULT_CANONICALIZER.canonicalize.cache_clear()
+
+
+def _time_round(bench, pages: list, min_time: float) -> float:
+    """ Run passes over the corpus for at least min_time seconds (timed without gc); return calls per second. """
+
+    calls = 0
+    elapsed = 0.0
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        while elapsed < min_time:
+            _clear_caches()
+            start = time.perf_counter()
+            calls += sum(bench(page) for page in pages)
+            elapsed += time.perf_counter() - start
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return calls / elapsed
+
+
+def measure(bench, pages: list, rounds: int, min_time: float) -> dict:
+    """ Time a benchmark over the corpus (the median of a number of rounds), then measure its allocations. """
+
+    rates = [_time_round(bench, pages, min_time) for _ in range(rounds)]
+
+    allocated = 0
+    tracemalloc.start()
+    for page in pages:
+        _clear_caches()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        bench(page)
+        allocated += tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+
+    return {
+        'ops_per_sec': statistics.median(rates),
+        'bytes_per_page': allocated / len(pages),
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """ Return the names of the benchmarks that regressed against the baseline by more than the threshold. """
+
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if (result['ops_per_sec'] < expected['ops_per_sec'] * (1 - threshold) or
+                result['bytes_per_page'] > expected['bytes_per_page'] * (1 + threshold)):
+            regressions.append(name)
+    return regressions
+
+
+def _change(value: float, expected: float) -> str:
+    return '%+6.1f%%' % (100 * (value / expected - 1)) if expected else '     -'
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=CORPUS_DIR, help='The corpus directory (default: %(default)s).')
+    parser.add_argument('--baseline', default=BASELINE, help='The baseline file (default: %(default)s).')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='The allowed slowdown or allocation growth, as a fraction (default: %(default)s).')
+    parser.add_argument('--rounds', type=int, default=5, help='Timed rounds per benchmark (default: %(default)s).')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='The minimum duration of a round, in seconds (default: %(default)s).')
+    parser.add_argument('--confirm', type=int, default=2,
+                        help='Times to re-measure a function that looks slower (default: %(default)s).')
+    parser.add_argument('--only', choices=sorted(BENCHMARKS), action='append',
+                        help='Run only this benchmark (may be repeated).')
+    parser.add_argument('--save-baseline', action='store_true', help='Record the results as the new baseline.')
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['benchmarks']
+
+    print('%d pages, %d links\n' % (len(pages), sum(len(page.raw_links) for page in pages)))
+    print('%-18s %12s %8s %14s %8s' % ('benchmark', 'ops/sec', 'change', 'alloc/page', 'change'))
+    results = {}
+    for name in args.only or BENCHMARKS:
+        result = results[name] = measure(BENCHMARKS[name], pages, args.rounds, args.min_time)
+        expected = baseline.get(name, {})
+        print('%-18s %12.1f %8s %11.1f KB %8s' % (
+            name, result['ops_per_sec'], _change(result['ops_per_sec'], expected.get('ops_per_sec')),
+            result['bytes_per_page'] / 1e3, _change(result['bytes_per_page'], expected.get('bytes_per_page'))
+        ))
+
+    if args.save_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(),
+                       'benchmarks': baseline}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print('\nSaved the baseline to ' + args.baseline)
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    for _ in range(args.confirm):
+        if not regressions:
+            break
+        print('\nMeasuring again: ' + ', '.join(regressions))
+        for name in regressions:
+            result = measure(BENCHMARKS[name], pages, args.rounds, args.min_time)
+            results[name] = {key: (max if key == 'ops_per_sec' else min)(value, result[key])
+                             for key, value in results[name].items()}
+        regressions = compare(results, baseline, args.threshold)
+
+    if regressions:
+        print('\nRegressed by more than %d%%: %s' % (100 * args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
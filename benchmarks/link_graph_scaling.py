@@ -0,0 +1,64 @@
+"""
+Measure how the link graph analytics scale with the size of the site.
+
+Usage (from the repository root):
+
+    python -m benchmarks.link_graph_scaling [--sizes 10000 100000 1000000] [--links 10]
+
+Synthetic sites have a navigation hub linked from every page, plus random links with a preference
+for nearby pages (like section menus and pagination).
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from do_crawler.link_graph import LinkGraph
+
+
+def synthetic_graph(num_pages: int, links_per_page: int, seed: int = 0) -> LinkGraph:
+    """ Build a random site graph with the given number of pages and average out-degree. """
+
+    rng = np.random.default_rng(seed)
+    src = np.repeat(np.arange(num_pages), links_per_page)
+    offsets = rng.geometric(0.01, size=len(src)) * rng.choice([-1, 1], size=len(src))
+    dst = (src + offsets) % num_pages
+
+    # Every page links back to the home page.
+    src = np.concatenate([src, np.arange(num_pages)])
+    dst = np.concatenate([dst, np.zeros(num_pages, dtype=np.int64)])
+
+    urls = [['/'] if i == 0 else ['/p' + str(i)] for i in range(num_pages)]
+    return LinkGraph(urls, src, dst)
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--links', type=int, default=10, help='Links per page (default: %(default)s).')
+    args = parser.parse_args()
+
+    print('%10s %10s %9s %9s %9s %9s %9s' % ('pages', 'edges', 'build', 'degrees', 'pagerank', 'depths', 'scc'))
+    for size in args.sizes:
+        graph, t_build = _timed(synthetic_graph, size, args.links)
+        _, t_degrees = _timed(lambda: (graph.in_degree(), graph.out_degree()))
+        _, t_pagerank = _timed(graph.pagerank)
+        _, t_depths = _timed(graph.depths, '/')
+        _, t_scc = _timed(graph.strongly_connected_components)
+        print('%10d %10d %8.3fs %8.3fs %8.3fs %8.3fs %8.3fs' % (
+            size, graph.num_edges, t_build, t_degrees, t_pagerank, t_depths, t_scc
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""
+Generate the HTML corpus of the hot path micro-benchmarks (benchmarks/hot_path.py).
+
+Usage (from the repository root):
+
+    python -m benchmarks.make_corpus [--output benchmarks/corpus]
+
+The corpus is bundled with the repository, so this only needs to run when a page is added or
+changed; the pages are generated from a fixed seed, so the output is the same every time. Each
+page is written in its own encoding, and manifest.json lists the URL and encoding of each file.
+
+    small.html       a typical small page: a short menu, an article, a few assets
+    mega_menu.html   nested navigation menus with ~1,000 links on every page of a site
+    listing.html     a product listing with ~3,000 links: pagination, tracking parameters,
+                     fragments, protocol-relative and external links, mailto: and javascript:
+    assets.html      an image gallery with ~1,500 img, source, script and stylesheet tags
+    base_tag.html    a <base href> on another host, with ../ and ./ relative links
+    latin1.html      a windows-1252 page with accented text and raw and escaped non-ASCII links
+    shift_jis.html   a Shift JIS page with Japanese text and non-ASCII link paths
+"""
+
+import argparse
+import json
+import os
+import random
+
+
+SEED = 20161
+HOST = 'https://www.corpus.test'
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), 'corpus')
+
+WORDS = ('account', 'archive', 'blog', 'careers', 'catalog', 'contact', 'deals', 'docs', 'events', 'faq',
+         'gift-cards', 'help', 'kitchen', 'garden', 'men', 'news', 'outdoor', 'press', 'returns', 'sale',
+         'shoes', 'sports', 'stores', 'support', 'toys', 'women')
+
+
+# --- Page builders:
+
+
+def _page(title: str, body: str, head: str = '', charset: str = 'utf-8') -> str:
+    return ('<!DOCTYPE html>\n<html lang="en">\n<head>\n<meta charset="%s">\n<title>%s</title>\n%s</head>\n'
+            '<body>\n%s\n</body>\n</html>\n' % (charset, title, head, body))
+
+
+def _head_assets(rng: random.Random, count: int) -> str:
+    tags = []
+    for i in range(count):
+        if i % 3 == 0:
+            tags.append('<link rel="stylesheet" href="/static/css/bundle-%x.css">' % rng.getrandbits(32))
+        elif i % 3 == 1:
+            tags.append('<script src="https://cdn.corpus.test/js/chunk-%x.js" async></script>' % rng.getrandbits(32))
+        else:
+            tags.append('<link rel="prefetch" href="/static/fonts/font-%d.woff2">' % i)
+    tags.append('<link rel="icon" href="/favicon.ico">')
+    tags.append('<link rel="alternate" hreflang="de" href="/de/">')
+    return '\n'.join(tags) + '\n'
+
+
+def _paragraphs(rng: random.Random, count: int, words: tuple = WORDS) -> str:
+    return '\n'.join(
+        '<p>' + ' '.join(rng.choice(words) for _ in range(rng.randint(40, 80))) + '.</p>' for _ in range(count)
+    )
+
+
+def _menu(rng: random.Random, sections: int, groups: int, items: int) -> str:
+    """ Nested navigation menus: sections of groups of links. """
+
+    html = ['<nav class="mega-menu"><ul>']
+    for s in range(sections):
+        section = WORDS[s % len(WORDS)]
+        html.append('<li class="section"><a href="/%s/">%s</a><div class="panel">' % (section, section.title()))
+        for g in range(groups):
+            group = rng.choice(WORDS)
+            html.append('<ul class="group"><li><a href="/%s/%s/">%s</a></li>' % (section, group, group))
+            for i in range(items):
+                html.append('<li><a href="/%s/%s/%s-%d" data-track="nav-%d-%d-%d">%s %d</a></li>' % (
+                    section, group, rng.choice(WORDS), i, s, g, i, rng.choice(WORDS), i))
+            html.append('</ul>')
+        html.append('</div></li>')
+    html.append('</ul></nav>')
+    return '\n'.join(html)
+
+
+def small(rng: random.Random) -> str:
+    body = _menu(rng, 6, 1, 5) + '\n<article>' + _paragraphs(rng, 6) + '</article>\n'
+    body += '<img src="/static/img/hero.jpg" alt="">\n<footer><a href="/about">About</a> <a href="/contact">Contact</a>'
+    body += ' <a href="https://twitter.test/corpus">Twitter</a></footer>'
+    return _page('A small page', body, _head_assets(rng, 6))
+
+
+def mega_menu(rng: random.Random) -> str:
+    body = _menu(rng, 12, 8, 10) + '\n<article>' + _paragraphs(rng, 10) + '</article>\n'
+    body += '<footer>' + ' '.join('<a href="/%s">%s</a>' % (word, word) for word in WORDS) + '</footer>'
+    return _page('Mega menu', body, _head_assets(rng, 30))
+
+
+def listing(rng: random.Random) -> str:
+    items = []
+    for i in range(1000):
+        product = '/product/%s-%d' % (rng.choice(WORDS), rng.randint(1, 10 ** 6))
+        items.append(
+            '<div class="item"><a href="%s?utm_source=listing&amp;utm_medium=grid&amp;ref=%d">'
+            '<img src="//img.corpus.test/p/%d.jpg" alt="Item %d"></a>'
+            '<a href="%s#reviews">Reviews</a> <a href="%s">Buy</a></div>' % (
+                product, i, i, i, product, HOST + product + '?colour=' + rng.choice(WORDS))
+        )
+    pages = ''.join('<a href="?page=%d&amp;sort=price">%d</a> ' % (n, n) for n in range(1, 200))
+    other = ''.join([
+        '<a href="mailto:shop@corpus.test">Mail us</a>', '<a href="javascript:void(0)">Menu</a>',
+        '<a href="tel:+440000000">Call</a>', '<a href="https://partner.test/offer?id=7">Partner</a>',
+        '<a href="\\\'/quoted-link\\\'">Quoted</a>', '<a href="">Empty</a>', '<a name="top">Anchor</a>',
+        '<form action="/search"><input name="q"></form>', '<iframe src="/embed/map"></iframe>',
+    ])
+    body = _menu(rng, 8, 3, 6) + '\n<main>' + '\n'.join(items) + '\n<nav class="pages">' + pages + '</nav>'
+    body += other + '</main>'
+    return _page('Listing', body, _head_assets(rng, 12))
+
+
+def assets(rng: random.Random) -> str:
+    items = []
+    for i in range(500):
+        items.append(
+            '<figure><picture><source srcset="/img/%d.webp" src="/img/%d.webp" type="image/webp">'
+            '<img src="/img/%d.jpg?w=%d" alt="Photo %d"></picture>'
+            '<figcaption><a href="/photo/%d">Photo %d</a></figcaption></figure>' % (
+                i, i, i, rng.choice((320, 640, 1280)), i, i, i)
+        )
+    videos = ''.join('<video src="/video/%d.mp4" poster="/video/%d.jpg"></video>' % (i, i) for i in range(20))
+    scripts = ''.join('<script src="/js/widget-%d.js"></script>' % i for i in range(40))
+    body = '<div class="gallery">' + '\n'.join(items) + '</div>' + videos + scripts
+    return _page('Gallery', body, _head_assets(rng, 60))
+
+
+def base_tag(rng: random.Random) -> str:
+    head = '<base href="https://docs.corpus.test/manual/v2/">\n' + _head_assets(rng, 6)
+    links = []
+    for i in range(600):
+        chapter = rng.choice(WORDS)
+        links.append(rng.choice((
+            '<li><a href="%s/section-%d.html">%s</a></li>' % (chapter, i, chapter),
+            '<li><a href="../v1/%s/section-%d.html">v1</a></li>' % (chapter, i),
+            '<li><a href="./%s/#anchor-%d">%s</a></li>' % (chapter, i, chapter),
+            '<li><a href="/manual/%s?version=2&amp;section=%d">%s</a></li>' % (chapter, i, chapter),
+            '<li><a href="?search=%s">search</a></li>' % chapter,
+        )))
+    body = '<ul class="toc">' + '\n'.join(links) + '</ul>\n<article>' + _paragraphs(rng, 8) + '</article>'
+    return _page('Manual', body, head)
+
+
+def latin1(rng: random.Random) -> str:
+    words = ('café', 'crème', 'déjà', 'façade', 'garçon', 'naïve', 'résumé', 'über', 'señor', 'Æsir', '€uro')
+    links = []
+    for i in range(800):
+        word = rng.choice(words)
+        if i % 2:
+            links.append('<a href="/mot/%s-%d">%s</a>' % (word, i, word))
+        else:
+            links.append('<a href="/mot/%s-%d">%s</a>' % (
+                ''.join('%%%02X' % ord(c) if ord(c) > 127 and ord(c) < 256 else c for c in word), i, word))
+    body = _menu(rng, 6, 2, 6) + '\n<article>' + _paragraphs(rng, 12, words + WORDS) + '</article>\n'
+    body += '<div class="index">' + ' '.join(links) + '</div><img src="/images/façade.jpg">'
+    return _page('Lexique', body, _head_assets(rng, 10), charset='windows-1252')
+
+
+def shift_jis(rng: random.Random) -> str:
+    words = ('東京', '大阪', 'ニュース', '天気', 'スポーツ', '経済', '政治', '文化', '科学', '動画')
+    links = []
+    for i in range(800):
+        word = rng.choice(words)
+        links.append('<li><a href="/%s/記事-%d">%s %d</a></li>' % (word, i, word, i))
+    text = '\n'.join('<p>' + '、'.join(rng.choice(words) for _ in range(60)) + '。</p>' for _ in range(10))
+    body = '<ul>' + '\n'.join(links) + '</ul>\n<article>' + text + '</article>'
+    return _page('ニュース', body, _head_assets(rng, 10), charset='shift_jis')
+
+
+PAGES = [
+    ('small.html', '/', 'utf-8', small),
+    ('mega_menu.html', '/women/', 'utf-8', mega_menu),
+    ('listing.html', '/sale/shoes?page=1', 'utf-8', listing),
+    ('assets.html', '/gallery/', 'utf-8', assets),
+    ('base_tag.html', '/manual/', 'utf-8', base_tag),
+    ('latin1.html', '/lexique/', 'windows-1252', latin1),
+    ('shift_jis.html', '/news/', 'shift_jis', shift_jis),
+]
+
+
+def generate(directory: str = CORPUS_DIR) -> list:
+    """ Write the corpus pages and their manifest to a directory; return the manifest. """
+
+    os.makedirs(directory, exist_ok=True)
+    manifest = []
+    for name, path, encoding, build in PAGES:
+        html = build(random.Random(SEED + len(manifest)))
+        with open(os.path.join(directory, name), 'wb') as f:
+            f.write(html.encode(encoding))
+        manifest.append({'file': name, 'url': HOST + path, 'encoding': encoding})
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    return manifest
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=CORPUS_DIR, help='The corpus directory (default: %(default)s).')
+    args = parser.parse_args()
+
+    for entry in generate(args.output):
+        size = os.path.getsize(os.path.join(args.output, entry['file']))
+        print('%-16s %8d bytes  %-13s %s' % (entry['file'], size, entry['encoding'], entry['url']))
+
+
+if __name__ == '__main__':
+    main()
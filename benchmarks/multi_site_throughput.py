@@ -0,0 +1,118 @@
+"""
+Compare the total pages/sec of crawling many sites with one pool per site against one shared pool.
+
+Usage (from the repository root):
+
+    python -m benchmarks.multi_site_throughput [--sites 20] [--big 2000] [--small 50] [--workers 40]
+                                               [--latency 0.005]
+
+The sites are generated in memory, with a fixed fetch latency: one big site and many small ones, as
+in a fleet of properties of different sizes. Every strategy gets the same total number of workers:
+
+    - per-site pools: each site has its own crawler and pool of workers / sites threads (as when
+      running one process per site); the workers of the small sites sit idle once they're done.
+    - shared pool: one MultiSiteCrawler, whose workers go wherever there are links to fetch.
+"""
+
+import argparse
+import threading
+import time
+
+from do_crawler.crawler import Crawler
+from do_crawler.multi_site import MultiSiteCrawler
+from multiprocessing.dummy import Pool as ThreadPool
+
+
+FAN_OUT = 10
+
+
+class SimulatedCrawler(Crawler):
+    """ A crawler that fetches pages of a simulated site, a tree of `size` pages, instead of the network. """
+
+    sizes = {}
+    latency = 0.0
+
+    def _get_page_content(self, url: str) -> bytes:
+        time.sleep(self.latency)
+        n = int(url[len(self.root) + 1:] or 0)
+        children = range(FAN_OUT * n + 1, min(FAN_OUT * (n + 1), self.sizes[self.root] - 1) + 1)
+        html = '<html><body><h1>' + url + '</h1>'
+        html += ''.join("<a href='/" + str(child) + "'></a>" for child in children)
+        return bytes(html + '</body></html>', 'utf-8')
+
+
+class SimulatedMultiSiteCrawler(MultiSiteCrawler):
+
+    CRAWLER_CLASS = SimulatedCrawler
+
+
+def run_per_site_pools(roots: list, workers: int) -> list:
+    """ Crawl each site with its own crawler and pool, all at the same time. """
+
+    threads_per_site = max(1, workers // len(roots))
+    crawlers = []
+    for root in roots:
+        c = SimulatedCrawler(root, pool=ThreadPool(threads_per_site))
+        c.MAX_NUM_THREADS = threads_per_site
+        crawlers.append(c)
+
+    threads = [threading.Thread(target=c.parallel_crawl) for c in crawlers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for c in crawlers:
+        c.pool.terminate()
+    return crawlers
+
+
+def run_shared_pool(roots: list, workers: int, scheduling: str) -> list:
+    """ Crawl all the sites with a MultiSiteCrawler. """
+
+    c = SimulatedMultiSiteCrawler(roots, max_workers=workers, scheduling=scheduling)
+    try:
+        c.crawl()
+    finally:
+        c.close()
+    return list(c.crawlers.values())
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sites', type=int, default=20, help='Number of sites (default: %(default)s).')
+    parser.add_argument('--big', type=int, default=2000, help='Pages of the big site (default: %(default)s).')
+    parser.add_argument('--small', type=int, default=50, help='Pages of each small site (default: %(default)s).')
+    parser.add_argument('--workers', type=int, default=40, help='Total workers (default: %(default)s).')
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='Seconds per fetch (default: %(default)s).')
+    args = parser.parse_args()
+
+    roots = ['http://site' + str(i) + '.test' for i in range(args.sites)]
+    SimulatedCrawler.sizes = {root: args.small for root in roots}
+    SimulatedCrawler.sizes[roots[0]] = args.big
+    SimulatedCrawler.latency = args.latency
+    print('%d sites (%d + %d x %d pages), %d workers, %.0f ms per fetch\n' % (
+        args.sites, args.big, args.sites - 1, args.small, args.workers, 1000 * args.latency
+    ))
+
+    strategies = [
+        ('per-site pools', lambda: run_per_site_pools(roots, args.workers)),
+        ('shared pool, round-robin', lambda: run_shared_pool(roots, args.workers, 'round-robin')),
+        ('shared pool, deficit', lambda: run_shared_pool(roots, args.workers, 'deficit')),
+    ]
+
+    print('%-26s %8s %9s %10s' % ('strategy', 'pages', 'time', 'pages/sec'))
+    for name, run in strategies:
+        start = time.perf_counter()
+        crawlers = run()
+        elapsed = time.perf_counter() - start
+        pages = sum(len(c.sitemap.pages) for c in crawlers)
+        print('%-26s %8d %8.2fs %10.0f' % (name, pages, elapsed, pages / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Replay a recorded crawl offline, to benchmark the parser and scheduler on the same input every time.
+
+Usage (from the repository root):
+
+    python -m benchmarks.replay_crawl [--warc FILE.warc.gz] [--pages 10000] [--runs 2] [--serial]
+
+Without --warc, a synthetic site of --pages pages (each page linking to ten others and back to its
+parent) is written to a temporary WARC first; with --warc, a crawl recorded with `crawl --record` is
+replayed from its root. Responses are served without their recorded latency, so the time measured
+is the crawler's own, and each run is checked to produce the same sitemap.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from do_crawler.crawler import Crawler
+from do_crawler.warc import (
+    ReplaySession,
+    WarcIndex,
+    WarcWriter
+)
+from urllib.parse import urlsplit
+
+
+ROOT = 'http://replay.test'
+FAN_OUT = 10
+
+
+def write_synthetic_warc(path: str, pages: int):
+    """ Record a synthetic site: page n links to pages 10n+1 ... 10n+10 (those that exist) and to its parent. """
+
+    writer = WarcWriter(path)
+    for n in range(pages):
+        links = ['/' + str(child) for child in range(FAN_OUT * n + 1, min(FAN_OUT * (n + 1), pages - 1) + 1)]
+        links.append('/' + str((n - 1) // FAN_OUT) if n else '/')
+        body = '<html><head><title>Page %d</title></head><body><h1>Page %d</h1>' % (n, n)
+        body += ''.join("<p><a href='%s'>%s</a></p>" % (link, link) for link in links)
+        body += "<img src='/static/%d.png'></body></html>" % (n % 50)
+        writer.write_exchange(ROOT + ('/' + str(n) if n else '/'), {'User-Agent': 'do_crawler'}, 200, 'OK',
+                              [('Content-Type', 'text/html; charset=utf-8')], body.encode('utf-8'), 0.05)
+    writer.close()
+
+
+def replay(path: str, root: str, serial: bool) -> tuple:
+    """ Crawl a WARC from its root; return the crawler and the time taken. """
+
+    c = Crawler(root, session=ReplaySession(path))
+    start = time.perf_counter()
+    if serial:
+        c.crawl()
+    else:
+        c.parallel_crawl()
+    elapsed = time.perf_counter() - start
+    c.close()
+    return c, elapsed
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--warc', help='A recorded crawl to replay, instead of a synthetic one.')
+    parser.add_argument('--pages', type=int, default=10000, help='Synthetic site size (default: %(default)s).')
+    parser.add_argument('--runs', type=int, default=2, help='Replays to run (default: %(default)s).')
+    parser.add_argument('--serial', action='store_true', help='Crawl with one thread (the most repeatable).')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.warc
+        if path is None:
+            path = os.path.join(directory, 'synthetic.warc.gz')
+            start = time.perf_counter()
+            write_synthetic_warc(path, args.pages)
+            print('Recorded %d pages in %.2fs' % (args.pages, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        index = WarcIndex(path)
+        print('Indexed %d responses in %.2fs\n' % (len(index), time.perf_counter() - start))
+        root = ROOT if args.warc is None else '{0.scheme}://{0.netloc}'.format(urlsplit(min(index.entries, key=len)))
+
+        print('%-5s %8s %9s %10s  %s' % ('run', 'pages', 'time', 'pages/sec', 'sitemap'))
+        first = None
+        for run in range(1, args.runs + 1):
+            c, elapsed = replay(path, root, args.serial)
+            pages = {url: page.page_hash for url, page in c.sitemap.pages.items()}
+            first = first or pages
+            print('%-5d %8d %8.2fs %10.0f  %s' % (
+                run, len(pages), elapsed, len(pages) / elapsed, 'same' if pages == first else 'DIFFERENT'
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the memory and speed of deduplicating URLs with a set and with a scalable Bloom filter.
+
+Usage (from the repository root):
+
+    python -m benchmarks.seen_set_memory [--urls 1000000] [--error-rate 0.001]
+
+Each structure is filled with --urls distinct relative URLs (timed), filled again under tracemalloc
+(to measure its memory, including the URL strings a set keeps alive; a Bloom filter keeps none), then
+queried with as many unseen URLs to measure the false positive rate.
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from do_crawler.bloom import ScalableBloomFilter
+
+
+def urls(count: int, prefix: str):
+    for i in range(count):
+        yield '/%s/category-%d/item-%d?page=%d' % (prefix, i % 97, i, i % 13)
+
+
+def fill(make_seen, count: int):
+    """ Add the URLs to a new seen-set; return it and the time taken. """
+
+    seen = make_seen()
+    start = time.perf_counter()
+    for url in urls(count, 'seen'):
+        seen.add(url)
+    return seen, time.perf_counter() - start
+
+
+def measure(make_seen, count: int) -> tuple:
+    """ Return the memory, fill time and false positives of a seen-set. """
+
+    _, elapsed = fill(make_seen, count)
+
+    tracemalloc.start()
+    seen, _ = fill(make_seen, count)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    false_positives = sum(url in seen for url in urls(count, 'unseen'))
+    return memory, elapsed, false_positives
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--urls', type=int, default=1000000, help='Distinct URLs (default: %(default)s).')
+    parser.add_argument('--error-rate', type=float, default=0.001,
+                        help='Bloom filter false positive rate (default: %(default)s).')
+    args = parser.parse_args()
+
+    print('%-22s %12s %12s %16s' % ('seen-set', 'memory', 'ns/add', 'false positives'))
+    for name, make_seen in [('set', set),
+                            ('scalable bloom filter', lambda: ScalableBloomFilter(error_rate=args.error_rate))]:
+        memory, elapsed, false_positives = measure(make_seen, args.urls)
+        print('%-22s %9.1f MB %12.0f %9d (%.3f%%)' % (
+            name, memory / 1e6, 1e9 * elapsed / args.urls, false_positives, 100 * false_positives / args.urls
+        ))
+
+
+if __name__ == '__main__':
+    main()
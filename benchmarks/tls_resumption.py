@@ -0,0 +1,96 @@
+"""
+Compare the cost of fetching pages over HTTPS with and without TLS session resumption.
+
+Usage (from the repository root):
+
+    python -m benchmarks.tls_resumption [-n REQUESTS] [--url URL]
+
+Without --url, a local HTTPS server with the self-signed test certificate is started.
+"""
+
+import argparse
+import os
+import ssl
+import threading
+import time
+
+from do_crawler.page_fetcher import (
+    FetchSession,
+    PageFetcher,
+    create_ssl_context
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer
+)
+
+
+TEST_CERT = os.path.join(os.path.dirname(__file__), '..', 'do_crawler', 'tests', 'data', 'localhost.pem')
+
+
+class _HTMLHandler(BaseHTTPRequestHandler):
+
+    body = b'<html><body>' + b"<a href='/page'>page</a>" * 100 + b'</body></html>'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_local_server() -> HTTPServer:
+    server = HTTPServer(('127.0.0.1', 0), _HTMLHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(TEST_CERT)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(url: str, requests: int, resumption: bool, cafile: str = None) -> dict:
+    """ Fetch a URL repeatedly through one session and return the timings and TLS counters. """
+
+    session = FetchSession(ssl_context=create_ssl_context(cafile), tls_resumption=resumption)
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        if not PageFetcher(url, session).content:
+            raise RuntimeError('Failed to fetch ' + url)
+    elapsed = time.perf_counter() - start
+
+    result = dict(session.stats()['tls'])
+    result['ms_per_request'] = 1000.0 * elapsed / requests
+    return result
+
+
+# --- Main function:
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--requests', type=int, default=200)
+    parser.add_argument('--url', help='An HTTPS URL to fetch instead of the local test server.')
+    args = parser.parse_args()
+
+    cafile = None
+    if args.url:
+        url = args.url
+    else:
+        server = _start_local_server()
+        url = 'https://localhost:%d/' % server.server_address[1]
+        cafile = TEST_CERT
+
+    for resumption in (False, True):
+        result = run(url, args.requests, resumption, cafile)
+        print('resumption=%-5s  %7.3f ms/request  handshakes=%d  resumed=%d' % (
+            resumption, result['ms_per_request'], result['handshakes'], result['resumed']
+        ))
+
+
+if __name__ == '__main__':
+    main()
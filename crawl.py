@@ -3,14 +3,51 @@
 import argparse
 import logging
 
+from do_crawler.asset_probe import write_page_weight_report
+from do_crawler.bloom import ScalableBloomFilter
+from do_crawler.budget import CrawlBudget
+from do_crawler.canonical import (
+    TRAILING_SLASH_RULES,
+    UrlCanonicalizer
+)
 from do_crawler.crawler import Crawler
-from do_crawler.sitemap_viz import print_sitemap
+from do_crawler.exporters import (
+    EXPORTERS,
+    get_exporter
+)
+from do_crawler.frontier import SCORERS
+from do_crawler.page_fetcher import (
+    FetchSession,
+    Timeouts
+)
+from do_crawler.sitemap_diff import diff_states
+from do_crawler.sitemap_store import save_sitemap
+from do_crawler.traps import (
+    TRAP_POLICIES,
+    TrapDetector
+)
+from do_crawler.warc import (
+    REPLAY_LATENCY_MODES,
+    ReplaySession,
+    WarcWriter
+)
+from pprint import pformat
 
 
 __author__ = "Peter Zhivkov"
 __version__ = '1.0'
 
 
+def parse_weight(value: str) -> tuple:
+    """ Parse a NAME=WEIGHT command-line value. """
+
+    name, _, weight = value.rpartition('=')
+    try:
+        return name, float(weight)
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected NAME=WEIGHT, got ' + repr(value))
+
+
 def configure_logging(verbose: bool):
     """ Configure logging to console at level INFO. """
 
@@ -25,6 +62,15 @@ def configure_logging(verbose: bool):
         logger.setLevel(logging.INFO)
 
 
+def diff_crawls(old_state: str, new_state: str, output_file: str = None, compress: bool = False):
+    """ Diff two saved crawl states into an NDJSON change feed, and log the number of changes of each type. """
+
+    counts = diff_states(old_state, new_state, output_file, compress=compress)
+    logging.getLogger('do_crawler').info(
+        'Diff summary: ' + ', '.join(str(count) + ' ' + change for change, count in counts.items())
+    )
+
+
 # --- Main function:
 
 
@@ -40,9 +86,12 @@ def main():
         'lists of forward links, and static assets.\n\n'
         'Examples:\n'
         '\tcrawl http://www.cnn.com -o output.txt\n\n'
+        'To compare two crawls saved with --save-state, writing an NDJSON change feed (one record per\n'
+        'added, removed or changed page url, with its added and removed links and static assets):\n'
+        '\tcrawl --diff monday.bin tuesday.bin -o changes.ndjson\n\n'
     )
 
-    parser.add_argument('DOMAIN_ROOT')
+    parser.add_argument('DOMAIN_ROOT', nargs='?')
     parser.add_argument(
         '--version',
         action='version',
@@ -58,35 +107,348 @@ def main():
         dest='output_file',
         help='Specify a file to which the sitemap will be written.\n'
     )
+    parser.add_argument(
+        '-f', '--format',
+        choices=sorted(EXPORTERS),
+        default='text',
+        help='The output format of the sitemap (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--gzip',
+        action='store_true',
+        help='Gzip the output file(s) (needs -o).'
+    )
+    parser.add_argument(
+        '--probe-assets',
+        dest='asset_report',
+        metavar='REPORT_FILE',
+        help='Send a HEAD request to each distinct static asset, and write a page weight report (CSV).'
+    )
+    parser.add_argument(
+        '--save-state',
+        dest='save_state',
+        help='Also save the sitemap in the binary format, for loading with do_crawler.sitemap_store.'
+    )
+    parser.add_argument(
+        '--diff',
+        nargs=2,
+        metavar=('OLD_STATE', 'NEW_STATE'),
+        help='Instead of crawling, compare two crawls saved with --save-state, and write the change feed '
+             'to the output file (or stdout).'
+    )
+    parser.add_argument(
+        '--scheme',
+        choices=['https', 'http'],
+        default='https',
+        help='The scheme to use for a DOMAIN_ROOT given without one (default: https).'
+    )
+    parser.add_argument(
+        '--prefetch-dns',
+        dest='prefetch_dns',
+        action='store_true',
+        help="Resolve the site's host in the background, before the first fetch needs it."
+    )
+    parser.add_argument(
+        '--seed-sitemaps',
+        dest='seed_sitemaps',
+        action='store_true',
+        help='Seed the crawl with the URLs in the site\'s sitemap.xml files (found through robots.txt).'
+    )
+    parser.add_argument(
+        '--keep-params',
+        dest='keep_params',
+        help='A comma-separated whitelist of query parameters; all others are removed from URLs.'
+    )
+    parser.add_argument(
+        '--drop-params',
+        dest='drop_params',
+        help='A comma-separated list of query parameters (or patterns, e.g. utm_*) to remove from URLs.'
+    )
+    parser.add_argument(
+        '--drop-tracking-params',
+        dest='drop_tracking',
+        action='store_true',
+        help='Remove the usual tracking parameters (utm_*, gclid, fbclid, ...) from URLs.'
+    )
+    parser.add_argument(
+        '--drop-session-ids',
+        dest='drop_session_ids',
+        action='store_true',
+        help='Remove session id parameters (jsessionid, phpsessid, ...) from URLs.'
+    )
+    parser.add_argument(
+        '--sort-query',
+        dest='sort_query',
+        action='store_true',
+        help='Sort the query parameters of URLs by name.'
+    )
+    parser.add_argument(
+        '--strip-index',
+        dest='strip_index',
+        action='store_true',
+        help='Treat /path/index.html (and similar index pages) as /path/.'
+    )
+    parser.add_argument(
+        '--trailing-slash',
+        dest='trailing_slash',
+        choices=TRAILING_SLASH_RULES,
+        help='Add or strip the trailing slash of URL paths.'
+    )
+    parser.add_argument(
+        '--priority',
+        dest='priorities',
+        metavar='SIGNAL=WEIGHT',
+        type=parse_weight,
+        action='append',
+        help='Visit links best-first, scoring them by a weighted signal: ' + ', '.join(SCORERS) +
+             ' (repeatable; default: depth=1, i.e. breadth-first).'
+    )
+    parser.add_argument(
+        '--path-weight',
+        dest='path_weights',
+        metavar='PATTERN=WEIGHT',
+        type=parse_weight,
+        action='append',
+        help='Add a weight to the score of links matching a glob pattern, e.g. \'/products/*=2\' (repeatable).'
+    )
+    parser.add_argument(
+        '--trap-cap',
+        dest='trap_cap',
+        type=int,
+        help='Detect crawler traps: follow at most this many links per URL template '
+             '(e.g. /calendar/{date}), and suppress the rest.'
+    )
+    parser.add_argument(
+        '--trap-policy',
+        dest='trap_policy',
+        choices=TRAP_POLICIES,
+        default='cap',
+        help='Suppress all the links of a capped template, or sample them (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--trap-sample-rate',
+        dest='trap_sample_rate',
+        type=float,
+        default=0.01,
+        help='The fraction of links of a capped template to follow, with --trap-policy sample '
+             '(default: %(default)s).'
+    )
+    parser.add_argument(
+        '--max-path-depth',
+        dest='max_path_depth',
+        type=int,
+        default=16,
+        help='With --trap-cap, suppress links with more path segments than this (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--seen-filter-error-rate',
+        dest='seen_filter_error_rate',
+        type=float,
+        help='Deduplicate links with a Bloom filter at this false positive rate (e.g. 0.001), '
+             'instead of exact sets. The sitemap, and its index of links between pages, still '
+             'grow with every page crawled.'
+    )
+    parser.add_argument(
+        '--seen-filter-max-bytes',
+        dest='seen_filter_max_bytes',
+        type=int,
+        help='The memory budget of the Bloom filter; its false positive rate rises once it is reached.'
+    )
+    parser.add_argument(
+        '--max-pages',
+        dest='max_pages',
+        type=int,
+        help='Stop after fetching this many pages.'
+    )
+    parser.add_argument(
+        '--max-depth',
+        dest='max_depth',
+        type=int,
+        help='Do not follow links more than this many hops away from the root page.'
+    )
+    parser.add_argument(
+        '--max-bytes',
+        dest='max_bytes',
+        type=int,
+        help='Stop after downloading this many bytes of page content.'
+    )
+    parser.add_argument(
+        '--deadline',
+        type=float,
+        help='Stop scheduling new fetches after this many seconds.'
+    )
+    parser.add_argument(
+        '--grace-period',
+        dest='grace_period',
+        type=float,
+        default=CrawlBudget.DEFAULT_GRACE_PERIOD,
+        help='Seconds to let in-flight fetches finish once a budget runs out (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--connect-timeout',
+        dest='connect_timeout',
+        type=float,
+        default=10.0,
+        help='Seconds to wait for a connection, including the TLS handshake (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--read-timeout',
+        dest='read_timeout',
+        type=float,
+        default=30.0,
+        help='Seconds to wait for each read from a connection (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--total-timeout',
+        dest='total_timeout',
+        type=float,
+        default=120.0,
+        help='Seconds to allow for a whole fetch, including retries (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--min-rate',
+        dest='min_rate',
+        type=float,
+        help='Abort page downloads slower than this many bytes/s.'
+    )
+    parser.add_argument(
+        '--record',
+        metavar='FILE.warc.gz',
+        help='Record every request and response in WARC files (FILE-00000.warc.gz, ...), with an index.'
+    )
+    parser.add_argument(
+        '--record-max-size',
+        dest='record_max_size',
+        type=int,
+        default=1 << 30,
+        help='Start a new WARC file after this many bytes (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--replay',
+        metavar='FILE.warc.gz',
+        help='Serve responses from a recorded crawl instead of the network (not with --probe-assets).'
+    )
+    parser.add_argument(
+        '--replay-latency',
+        dest='replay_latency',
+        choices=REPLAY_LATENCY_MODES,
+        default='none',
+        help='Replay responses with their recorded latency, or without any (default: %(default)s).'
+    )
+    parser.add_argument(
+        '--frontier-file',
+        dest='frontier_file',
+        help='Specify a file to which the unvisited links will be written.'
+    )
 
     args = parser.parse_args()
-    domain_root = str(args.DOMAIN_ROOT)
-    domain_root.strip()
-    if not domain_root.startswith('http://'):
-        domain_root = 'http://' + domain_root
+    if args.gzip and args.output_file is None:
+        parser.error('--gzip needs an output file (-o)')
+    if args.diff:
+        if args.DOMAIN_ROOT is not None:
+            parser.error('--diff compares two saved crawls, and takes no DOMAIN_ROOT')
+        configure_logging(args.verbose)
+        diff_crawls(*args.diff, output_file=args.output_file, compress=args.gzip)
+        return
+    if args.DOMAIN_ROOT is None:
+        parser.error('the following arguments are required: DOMAIN_ROOT')
+    for signal, _ in args.priorities or ():
+        if signal not in SCORERS:
+            parser.error('unknown --priority signal ' + repr(signal) + ' (choose from ' + ', '.join(SCORERS) + ')')
+    if args.seen_filter_error_rate is not None and not 0 < args.seen_filter_error_rate < 1:
+        parser.error('--seen-filter-error-rate must be between 0 and 1')
+    if args.replay and args.asset_report:
+        # Recordings only hold the crawled pages, not the HEAD requests of the asset probe.
+        parser.error('--probe-assets sends its HEAD requests over the network, and cannot be used with --replay')
+    domain_root = str(args.DOMAIN_ROOT).strip()
+    if '://' not in domain_root:
+        domain_root = args.scheme + '://' + domain_root
 
     configure_logging(args.verbose)
 
     # Start a parallel crawl.
-    c = Crawler(domain_root)
+    budget = CrawlBudget(
+        max_pages=args.max_pages,
+        max_depth=args.max_depth,
+        max_bytes=args.max_bytes,
+        deadline=args.deadline,
+        grace_period=args.grace_period
+    )
+    timeouts = Timeouts(
+        connect=args.connect_timeout,
+        read=args.read_timeout,
+        total=args.total_timeout,
+        min_rate=args.min_rate
+    )
+    canonicalizer = UrlCanonicalizer(
+        keep_params=args.keep_params.split(',') if args.keep_params else None,
+        drop_params=args.drop_params.split(',') if args.drop_params else (),
+        drop_tracking=args.drop_tracking,
+        drop_session_ids=args.drop_session_ids,
+        sort_query=args.sort_query,
+        strip_index=args.strip_index,
+        trailing_slash=args.trailing_slash
+    )
+    trap_detector = None
+    if args.trap_cap is not None:
+        trap_detector = TrapDetector(
+            max_per_template=args.trap_cap,
+            max_depth=args.max_path_depth,
+            policy=args.trap_policy,
+            sample_rate=args.trap_sample_rate
+        )
+    recorder = WarcWriter(args.record, max_size=args.record_max_size) if args.record else None
+    if args.replay:
+        session = ReplaySession(args.replay, latency=args.replay_latency, timeouts=timeouts, recorder=recorder)
+    else:
+        session = FetchSession(timeouts=timeouts, recorder=recorder)
+    seen_filter = None
+    if args.seen_filter_error_rate is not None:
+        seen_filter = ScalableBloomFilter(
+            error_rate=args.seen_filter_error_rate,
+            max_bytes=args.seen_filter_max_bytes
+        )
+    c = Crawler(domain_root, session=session, prefetch_dns=args.prefetch_dns,
+                budget=budget, seed_sitemaps=args.seed_sitemaps, canonicalizer=canonicalizer,
+                priorities=dict(args.priorities) if args.priorities else None, path_weights=args.path_weights,
+                trap_detector=trap_detector, seen_filter=seen_filter)
     try:
         c.parallel_crawl()
     except (KeyboardInterrupt, SystemExit) as _:
-        c.links_to_visit = set()
+        # The crawl was drained, so links_to_visit still holds the unvisited links for --frontier-file.
         c.pool.close()
         c.pool.terminate()
         c.pool.join()
 
     # If we're done (or were interrupted), then output the result so far.
-    if args.output_file:
-        with open(args.output_file, 'w') as f:
-            print_sitemap(c.sitemap, f)
-    else:
-        print_sitemap(c.sitemap)
+    exporter = get_exporter(args.format, base_url=domain_root, compress=args.gzip)
+    exporter.export(c.sitemap, args.output_file)
+
+    if args.asset_report:
+        c.probe_assets()
+        with open(args.asset_report, 'w', newline='') as f:
+            write_page_weight_report(c.sitemap, c.asset_info, f)
 
-    if args.verbose and c.links_to_visit:
+    if args.save_state:
+        save_sitemap(c.sitemap, args.save_state)
+
+    if args.frontier_file:
+        with open(args.frontier_file, 'w') as f:
+            for link in sorted(c.links_to_visit):
+                print(link, file=f)
+    elif args.verbose and c.links_to_visit:
         print(c.links_to_visit)
 
+    if args.verbose:
+        logger = logging.getLogger('do_crawler')
+        for url, referrers in sorted(c.failed_link_referrers().items()):
+            logger.info('Failed: ' + url + ' (linked from: ' + ', '.join(sorted(referrers)) + ')')
+        for url in sorted(c.timed_out_links):
+            logger.info('Timed out: ' + url)
+        logger.info('Crawl summary:\n' + pformat(c.summary()))
+
+    session.close()
+
 
 if __name__ == '__main__':
     main()
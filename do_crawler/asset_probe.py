@@ -0,0 +1,148 @@
+import csv
+import logging
+import threading
+
+from do_crawler import page_fetcher
+from do_crawler.sitemap import SiteMap
+from multiprocessing.dummy import Pool as ThreadPool
+from urllib.error import (
+    HTTPError,
+    URLError
+)
+from urllib.request import Request
+
+
+logger = logging.getLogger(__name__)
+
+
+# --- AssetInfo:
+
+
+class AssetInfo(object):
+    """ What a HEAD request told us about a static asset. Any field may be None if unknown. """
+
+    __slots__ = ('status', 'size', 'content_type', 'error')
+
+    def __init__(self, status: int = None, size: int = None, content_type: str = None, error: str = None):
+        self.status = status
+        self.size = size
+        self.content_type = content_type
+        self.error = error
+
+    def __repr__(self):
+        return 'AssetInfo(status=%r, size=%r, content_type=%r, error=%r)' % (
+            self.status, self.size, self.content_type, self.error
+        )
+
+
+# --- Asset probe helper functions:
+
+
+def _content_length(headers) -> int:
+    """ Parse the Content-Length header; None, if it's missing or malformed. """
+
+    try:
+        return int(headers.get('Content-Length'))
+    except (TypeError, ValueError):
+        return None
+
+
+# --- AssetProber:
+
+
+class AssetProber(object):
+    """
+    Issues one HEAD request per distinct static asset url through a bounded worker pool,
+    and records the status, size and content type of each asset.
+    """
+
+    MAX_NUM_THREADS = 8
+
+    def __init__(self, session: page_fetcher.FetchSession = None, max_workers: int = MAX_NUM_THREADS,
+                 results: dict = None):
+        """
+        :param session: the fetch session to use; the default session, if None
+        :type session: FetchSession
+        :param max_workers: the maximum number of concurrent HEAD requests
+        :type max_workers: int
+        :param results: earlier results (url to AssetInfo) to add to; those assets aren't probed again
+        :type results: dict
+        """
+        self.session = session or page_fetcher.default_session()
+        self.max_workers = max_workers
+        self.results = results if results is not None else {}
+        self._lock = threading.Lock()
+
+    def _head(self, url: str) -> AssetInfo:
+        """ Send a HEAD request for a single asset. """
+
+        req = Request(url, method='HEAD', headers={'User-Agent': 'do_crawler'})
+        try:
+            with self.session.open(req) as response:
+                return AssetInfo(response.status, _content_length(response.headers),
+                                 response.headers.get_content_type())
+        except HTTPError as e:
+            return AssetInfo(e.code, error=str(e.reason))
+        except (URLError, ValueError, OSError) as e:
+            return AssetInfo(error=str(getattr(e, 'reason', e)))
+
+    def _probe_one(self, url: str):
+        """ Probe a single asset and record the result. """
+
+        info = self._head(url)
+        with self._lock:
+            self.results[url] = info
+
+    def probe(self, urls) -> dict:
+        """
+        Probe every asset url that hasn't been probed yet, and wait for all the probes to finish.
+
+        :param urls: an iterable of absolute asset urls (duplicates are ignored)
+        :return: the results so far, as a dictionary of url to AssetInfo
+        :rtype: dict
+        """
+        with self._lock:
+            todo = set(urls) - self.results.keys()
+
+        if todo:
+            logger.info('Probing ' + str(len(todo)) + ' static assets')
+            pool = ThreadPool(min(self.max_workers, len(todo)))
+            try:
+                for _ in pool.imap_unordered(self._probe_one, todo):
+                    pass
+            finally:
+                pool.close()
+                pool.join()
+
+        return self.results
+
+
+# --- Page weight report:
+
+
+def page_weights(sitemap: SiteMap, results: dict):
+    """
+    Compute the static asset weight of each distinct page.
+
+    :return: an iterator of (url, number of assets, total known asset bytes, number of assets of unknown size)
+    """
+    for url, page in sitemap.pages.items():
+        if page.urls[0] != url:
+            continue
+
+        total = unknown = 0
+        for asset in page.static_assets:
+            info = results.get(asset)
+            if info is None or info.size is None:
+                unknown += 1
+            else:
+                total += info.size
+        yield url, len(page.static_assets), total, unknown
+
+
+def write_page_weight_report(sitemap: SiteMap, results: dict, file):
+    """ Write the page weights as CSV. """
+
+    writer = csv.writer(file)
+    writer.writerow(['url', 'assets', 'asset_bytes', 'unknown_size_assets'])
+    writer.writerows(page_weights(sitemap, results))
@@ -0,0 +1,239 @@
+import logging
+import math
+import sys
+
+from hashlib import blake2b
+
+
+logger = logging.getLogger(__name__)
+
+
+# --- BloomFilter:
+
+
+def _hash_pair(item: str) -> tuple:
+    """ Two independent 64-bit hashes of an item, for double hashing. """
+
+    digest = blake2b(item.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+
+class BloomFilter(object):
+    """
+    A fixed-size Bloom filter of strings on a bytearray, sized for `capacity` items at a false
+    positive rate of `error_rate`. The k bit positions of an item are h1 + i * h2 (mod the number of
+    bits), from the two halves of a blake2b digest.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, max_bits: int = None):
+        """
+        :param capacity: the number of items the filter is sized for
+        :type capacity: int
+        :param error_rate: the false positive rate at capacity, in (0, 1)
+        :type error_rate: float
+        :param max_bits: the most bits the filter may use (at least 8); its error rate at capacity is
+            then higher than error_rate. Unbounded, if None
+        :type max_bits: int
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+
+        self.capacity = max(1, capacity)
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2)))
+        if max_bits is not None:
+            self.num_bits = max(8, min(self.num_bits, max_bits))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, hashes: tuple) -> list:
+        """ The bit positions of an item, from its hash pair. """
+
+        num_bits = self.num_bits
+        position = hashes[0] % num_bits
+        step = hashes[1] % num_bits
+        positions = [position]
+        for _ in range(self.num_hashes - 1):
+            position += step
+            if position >= num_bits:
+                position -= num_bits
+            positions.append(position)
+        return positions
+
+    def _add_hashed(self, hashes: tuple) -> bool:
+        bits = self.bits
+        present = True
+        for position in self._positions(hashes):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                present = False
+
+        if not present:
+            self.count += 1
+        return present
+
+    def _contains_hashed(self, hashes: tuple) -> bool:
+        # Inlines _positions, to stop at the first unset bit (after two, on average, for a new item).
+        bits = self.bits
+        num_bits = self.num_bits
+        position = hashes[0] % num_bits
+        step = hashes[1] % num_bits
+        for _ in range(self.num_hashes):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+            if position >= num_bits:
+                position -= num_bits
+        return True
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item.
+
+        :return: whether the item was (probably) already in the filter
+        """
+        return self._add_hashed(_hash_pair(item))
+
+    def __contains__(self, item: str) -> bool:
+        return self._contains_hashed(_hash_pair(item))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.bits)
+
+    def estimated_error_rate(self) -> float:
+        """ The false positive rate at the current number of items. """
+
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+
+# --- ScalableBloomFilter:
+
+
+class ScalableBloomFilter(object):
+    """
+    A Bloom filter that grows with the number of items (Almeida et al., "Scalable Bloom Filters"):
+    when the current filter is full, a new one with `growth` times the capacity, and a `tightening`
+    times lower error rate, is added. The overall false positive rate stays below
+    error_rate / (1 - tightening).
+
+    With `max_bytes`, no filter is added that would exceed the memory budget: the last filter takes
+    all further items, and its false positive rate rises past its target (see estimated_error_rate).
+    If even the first filter would exceed it, that filter gets only max_bytes.
+    """
+
+    def __init__(self, error_rate: float = 0.001, initial_capacity: int = 1 << 16, growth: int = 2,
+                 tightening: float = 0.5, max_bytes: int = None):
+        """
+        :param error_rate: the target overall false positive rate
+        :type error_rate: float
+        :param initial_capacity: the capacity of the first filter
+        :type initial_capacity: int
+        :param growth: the capacity ratio of consecutive filters
+        :type growth: int
+        :param tightening: the error rate ratio of consecutive filters, in (0, 1)
+        :type tightening: float
+        :param max_bytes: the memory budget of the bit arrays; unbounded, if None
+        :type max_bytes: int
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError('error_rate must be between 0 and 1')
+        if max_bytes is not None and max_bytes < 1:
+            raise ValueError('max_bytes must be at least 1')
+
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.max_bytes = max_bytes
+        self.saturated = False
+
+        self.filters = [BloomFilter(initial_capacity, error_rate * (1 - tightening))]
+        if max_bytes is not None and self.nbytes > max_bytes:
+            # The first filter alone is over the budget: shrink it to fit, and make it the only one.
+            self.filters = [BloomFilter(initial_capacity, error_rate * (1 - tightening), max_bits=8 * max_bytes)]
+            self._saturate()
+
+    def _grow(self):
+        """ Add the next filter, if it fits in the memory budget. """
+
+        last = self.filters[-1]
+        candidate = BloomFilter(last.capacity * self.growth, last.error_rate * self.tightening)
+        if self.max_bytes is not None and self.nbytes + candidate.nbytes > self.max_bytes:
+            self._saturate()
+            return
+        self.filters.append(candidate)
+
+    def _saturate(self):
+        """ Stop adding filters: the last one takes all further items. """
+
+        self.saturated = True
+        logger.warning('Seen-set memory budget reached (' + str(self.nbytes) + ' bytes); the false '
+                       'positive rate will rise with more links')
+
+    def add(self, item: str) -> bool:
+        """
+        Add an item, unless it's (probably) already in the filter.
+
+        :return: whether the item was (probably) already in the filter
+        """
+        hashes = _hash_pair(item)
+        filters = self.filters
+        for bloom in filters[:-1]:
+            if bloom._contains_hashed(hashes):
+                return True
+
+        last = filters[-1]
+        if last.count >= last.capacity and not self.saturated:
+            if last._contains_hashed(hashes):
+                return True
+            self._grow()
+            last = self.filters[-1]
+        return last._add_hashed(hashes)
+
+    def __contains__(self, item: str) -> bool:
+        hashes = _hash_pair(item)
+        return any(bloom._contains_hashed(hashes) for bloom in self.filters)
+
+    def __len__(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bloom.nbytes for bloom in self.filters)
+
+    def estimated_error_rate(self) -> float:
+        """ The probability that a new item is reported as already seen, at the current fill. """
+
+        miss = 1.0
+        for bloom in self.filters:
+            miss *= 1 - bloom.estimated_error_rate()
+        return 1 - miss
+
+    def stats(self) -> dict:
+        """ Return the number of items, the memory used, and the estimated false positive rate. """
+
+        return {
+            'items': len(self),
+            'bytes': self.nbytes,
+            'filters': len(self.filters),
+            'estimated_error_rate': self.estimated_error_rate(),
+            'saturated': self.saturated,
+        }
+
+
+# --- Main function:
+
+
+def main():
+    seen = ScalableBloomFilter(error_rate=float(sys.argv[1]) if len(sys.argv) > 1 else 0.001)
+    duplicates = sum(seen.add(line.rstrip('\n')) for line in sys.stdin)
+    print(duplicates, seen.stats())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import threading
+import time
+
+
+# --- CrawlBudget:
+
+
+class CrawlBudget(object):
+    """
+    Limits on how much a crawl may do. Any limit left as None is unbounded:
+
+        - max_pages: the number of page fetches to dispatch.
+        - max_depth: the link depth from '/' beyond which links aren't followed.
+        - max_bytes: the total size of downloaded page content.
+        - deadline: wall-clock seconds from the start of the crawl.
+
+    Once a budget runs out, the crawler stops scheduling and gives in-flight fetches
+    `grace_period` seconds to finish.
+    """
+
+    DEFAULT_GRACE_PERIOD = 5.0
+
+    def __init__(self, max_pages: int = None, max_depth: int = None, max_bytes: int = None,
+                 deadline: float = None, grace_period: float = DEFAULT_GRACE_PERIOD, clock=time.monotonic):
+        self.max_pages = max_pages
+        self.max_depth = max_depth
+        self.max_bytes = max_bytes
+        self.deadline = deadline
+        self.grace_period = grace_period
+        self._clock = clock
+
+        self._lock = threading.Lock()
+        self._start = None
+        self.pages = 0
+        self.bytes = 0
+
+    def start(self):
+        """ Start the wall-clock deadline (a no-op if already started). """
+
+        with self._lock:
+            if self._start is None:
+                self._start = self._clock()
+
+    def elapsed(self) -> float:
+        """ Seconds since the budget was started. """
+
+        return self._clock() - self._start if self._start is not None else 0.0
+
+    def time_left(self) -> float:
+        """ Seconds left until the deadline; None, if there is no deadline. """
+
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - self.elapsed())
+
+    def charge_page(self):
+        """ Account for one dispatched page fetch. """
+
+        with self._lock:
+            self.pages += 1
+
+    def charge_bytes(self, count: int):
+        """ Account for downloaded page content. """
+
+        with self._lock:
+            self.bytes += count
+
+    def allows_depth(self, depth: int) -> bool:
+        """ Check whether links at a given depth from '/' may be followed. """
+
+        return self.max_depth is None or depth <= self.max_depth
+
+    def exhausted(self) -> str:
+        """
+        Check whether any limit has been reached.
+        :return: the name of the exhausted limit; None, if the budget isn't exhausted
+        :rtype: str
+        """
+        if self.max_pages is not None and self.pages >= self.max_pages:
+            return 'max_pages'
+        if self.max_bytes is not None and self.bytes >= self.max_bytes:
+            return 'max_bytes'
+        if self.deadline is not None and self.time_left() <= 0:
+            return 'deadline'
+        return None
+
+    def stats(self) -> dict:
+        """ Return how much of the budget was used. """
+
+        return {
+            'pages': self.pages,
+            'bytes': self.bytes,
+            'elapsed': round(self.elapsed(), 3),
+            'exhausted': self.exhausted(),
+        }
@@ -0,0 +1,186 @@
+import re
+import sys
+
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from urllib.parse import (
+    unquote_plus,
+    urlsplit,
+    urlunsplit
+)
+
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Query parameters that only track where a visit came from.
+TRACKING_PARAMS = (
+    'utm_*', 'gclid', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid', '_ga', '_gl',
+    'ref', 'ref_src',
+)
+
+# Query (and ;path) parameters that carry a session id.
+SESSION_PARAMS = ('jsessionid', 'phpsessid', 'aspsessionid*', 'sessionid', 'sid', 'cfid', 'cftoken')
+
+INDEX_PAGES = ('index.html', 'index.htm', 'index.php', 'default.aspx', 'default.asp')
+
+TRAILING_SLASH_RULES = ('add', 'strip')
+
+_PATH_SESSION_ID = re.compile(r';(?:jsessionid|phpsessid|sessionid|sid)=[^/?#]*', re.IGNORECASE)
+
+
+# --- UrlCanonicalizer:
+
+
+class UrlCanonicalizer(object):
+    """
+    Rewrites URLs to a canonical form, so that the different spellings of a page are fetched once.
+
+    These rules always apply to http(s) URLs:
+
+        - The scheme and host are lowercased.
+        - Default ports (:80 for http, :443 for https) are removed.
+        - Fragments are removed.
+        - An empty path becomes '/'.
+
+    These are opt-in, because they can merge URLs that a site serves differently:
+
+        - keep_params: a whitelist of query parameters (all others are dropped).
+        - drop_params: query parameter names (or glob patterns, e.g. 'utm_*') to drop.
+        - drop_tracking: drop the TRACKING_PARAMS.
+        - drop_session_ids: drop the SESSION_PARAMS, from the query and from ;jsessionid= style path
+          parameters.
+        - sort_query: sort the query parameters by name (keeping the order of repeated names).
+        - strip_index: remove a trailing index page (INDEX_PAGES) from the path.
+        - trailing_slash: 'add' a slash to paths whose last segment has no extension, or 'strip' it
+          from all paths except the root.
+
+    Query parameters are rewritten as they appear in the URL, without re-encoding them.
+    """
+
+    def __init__(self, keep_params=None, drop_params=(), drop_tracking: bool = False,
+                 drop_session_ids: bool = False, sort_query: bool = False, strip_index: bool = False,
+                 trailing_slash: str = None, cache_size: int = 1 << 16):
+        """
+        :param keep_params: the query parameter names to keep; all of them, if None
+        :param drop_params: the query parameter names or glob patterns to drop
+        :param drop_tracking: drop the usual tracking parameters
+        :type drop_tracking: bool
+        :param drop_session_ids: drop the usual session id parameters
+        :type drop_session_ids: bool
+        :param sort_query: sort the query parameters by name
+        :type sort_query: bool
+        :param strip_index: remove trailing index pages (e.g. /about/index.html -> /about/)
+        :type strip_index: bool
+        :param trailing_slash: 'add', 'strip', or None to leave trailing slashes alone
+        :type trailing_slash: str
+        :param cache_size: the number of recent URLs to memoize (links repeat a lot across pages)
+        :type cache_size: int
+        """
+        if trailing_slash not in TRAILING_SLASH_RULES + (None,):
+            raise ValueError('trailing_slash must be one of: ' + ', '.join(TRAILING_SLASH_RULES))
+
+        self.keep_params = None if keep_params is None else {name.lower() for name in keep_params}
+        self.drop_params = [pattern.lower() for pattern in drop_params]
+        if drop_tracking:
+            self.drop_params.extend(TRACKING_PARAMS)
+        self.drop_session_ids = drop_session_ids
+        if drop_session_ids:
+            self.drop_params.extend(SESSION_PARAMS)
+        self.sort_query = sort_query
+        self.strip_index = strip_index
+        self.trailing_slash = trailing_slash
+
+        self._rewrites_query = self.keep_params is not None or bool(self.drop_params) or sort_query
+        self.canonicalize = lru_cache(maxsize=cache_size)(self._canonicalize)
+
+    def __call__(self, url: str) -> str:
+        return self.canonicalize(url)
+
+    def _netloc(self, scheme: str, parts) -> str:
+        """ The lowercased host, with any user info, and the port unless it's the default one. """
+
+        host = parts.hostname or ''
+        if ':' in host:
+            host = '[' + host + ']'
+
+        port = parts.port
+        if port is not None and port != DEFAULT_PORTS.get(scheme):
+            host += ':' + str(port)
+
+        userinfo, at, _ = parts.netloc.rpartition('@')
+        return userinfo + at + host
+
+    def _path(self, path: str) -> str:
+        """ Apply the path rules. """
+
+        if self.drop_session_ids:
+            path = _PATH_SESSION_ID.sub('', path)
+
+        if not path:
+            return '/'
+
+        head, _, last = path.rpartition('/')
+        if self.strip_index and last.lower() in INDEX_PAGES:
+            path, last = head + '/', ''
+
+        if self.trailing_slash == 'strip' and len(path) > 1:
+            path = path.rstrip('/') or '/'
+        elif self.trailing_slash == 'add' and last and '.' not in last:
+            path += '/'
+
+        return path
+
+    def _is_dropped(self, name: str) -> bool:
+        """ Check a (decoded, lowercased) query parameter name against the keep and drop rules. """
+
+        if self.keep_params is not None and name not in self.keep_params:
+            return True
+        return any(fnmatchcase(name, pattern) for pattern in self.drop_params)
+
+    def _query(self, query: str) -> str:
+        """ Apply the query rules. """
+
+        if not query or not self._rewrites_query:
+            return query
+
+        params = []
+        for param in query.split('&'):
+            if not param:
+                continue
+            name = unquote_plus(param.partition('=')[0]).lower()
+            if not self._is_dropped(name):
+                params.append((name, param))
+
+        if self.sort_query:
+            params.sort(key=lambda item: item[0])
+
+        return '&'.join(param for _, param in params)
+
+    def _canonicalize(self, url: str) -> str:
+        """ Rewrite an absolute http(s) URL to its canonical form; other URLs are returned as is. """
+
+        try:
+            parts = urlsplit(url)
+            scheme = parts.scheme.lower()
+            if scheme not in DEFAULT_PORTS or not parts.netloc:
+                return url
+            netloc = self._netloc(scheme, parts)
+        except ValueError:
+            # A malformed port or IPv6 address: leave the URL for the fetcher to reject.
+            return url
+
+        return urlunsplit((scheme, netloc, self._path(parts.path), self._query(parts.query), ''))
+
+
+# --- Main function:
+
+
+def main():
+    canonicalizer = UrlCanonicalizer(drop_tracking=True, drop_session_ids=True, sort_query=True,
+                                     strip_index=True)
+    for url in sys.argv[1:]:
+        print(canonicalizer(url))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,35 +1,216 @@
+import asyncio
 import logging
+import queue
+import threading
+import time
 
 from do_crawler import (
+    asset_probe,
     link_classifier,
     page_fetcher,
-    sitemap
+    sitemap,
+    sitemap_xml
 )
+from do_crawler.bloom import ScalableBloomFilter
+from do_crawler.budget import CrawlBudget
+from do_crawler.canonical import UrlCanonicalizer
+from do_crawler.frontier import (
+    Frontier,
+    build_scorer
+)
+from do_crawler.traps import TrapDetector
 from multiprocessing.dummy import Pool as ThreadPool
+from urllib.parse import urlparse
 
 
 logger = logging.getLogger(__name__)
 
 
+# --- CrawledPage:
+
+
+class CrawledPage(object):
+    """
+    A page as it was committed to the sitemap, with its fetch metadata (see Crawler.iter_pages):
+
+        - url: the absolute URL that was fetched.
+        - page: the sitemap's Page for the URL (for a duplicate, the original page it's an alias of).
+        - depth: the link depth of the URL.
+        - size: the size of the content, in bytes.
+        - fetch_time: the time it took to fetch the content, in seconds.
+        - duplicate: whether the content was already in the sitemap under another URL.
+    """
+
+    __slots__ = ('url', 'page', 'depth', 'size', 'fetch_time', 'duplicate')
+
+    def __init__(self, url: str, page: sitemap.Page, depth: int, duplicate: bool = False,
+                 size: int = None, fetch_time: float = None):
+        self.url = url
+        self.page = page
+        self.depth = depth
+        self.duplicate = duplicate
+        self.size = size
+        self.fetch_time = fetch_time
+
+    def __repr__(self):
+        return 'CrawledPage(%r, depth=%r, size=%r, duplicate=%r)' % (self.url, self.depth, self.size, self.duplicate)
+
+
+class _PageStream(object):
+    """
+    Hands the pages committed by a crawl running on a background thread to a consumer, through a
+    bounded queue. Workers block while the queue is full, so a slow consumer throttles the crawl.
+    """
+
+    _END = object()
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, crawler: 'Crawler', max_buffered: int):
+        self.crawler = crawler
+        self.queue = queue.Queue(max_buffered)
+        self.cancelled = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='crawl-stream', daemon=True)
+
+    def _run(self):
+        try:
+            self.crawler.parallel_crawl()
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.put(self._END)
+
+    def start(self):
+        self.crawler._page_sink = self.put
+        self.thread.start()
+
+    def put(self, item):
+        """ Queue an item, waiting for space; gives up if the stream is cancelled. Called by the crawl. """
+
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(item, timeout=self.POLL_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def get(self):
+        """ Wait for the next page; None, at the end of the crawl (or if the stream is cancelled). """
+
+        while not self.cancelled.is_set():
+            try:
+                item = self.queue.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                continue
+
+            if item is self._END:
+                if self.error is not None:
+                    raise self.error
+                return None
+            return item
+
+        return None
+
+    def close(self):
+        """ Stop the crawl (if it's still running) and wait for it to wind down. """
+
+        finished = not self.thread.is_alive()
+        self.cancelled.set()
+        self.crawler.stop()
+        self.thread.join()
+        self.crawler._page_sink = None
+        if not finished:
+            self.crawler.close()
+
+
 # --- Crawler:
 
 
 class Crawler(object):
     """ The main crawler class implementing the traversal logic. """
     MAX_NUM_THREADS = 8
-
-    def __init__(self, domain: str):
-        self.pool = ThreadPool(self.MAX_NUM_THREADS)
+    SEED_BATCH_SIZE = 10000
+    # Seconds after which a partial batch of sitemap links is handed to the frontier anyway.
+    SEED_FLUSH_INTERVAL = 0.1
+
+    def __init__(self, domain: str, session: page_fetcher.FetchSession = None, prefetch_dns: bool = False,
+                 budget: CrawlBudget = None, seed_sitemaps: bool = False,
+                 canonicalizer: UrlCanonicalizer = None, priorities: dict = None, path_weights: list = None,
+                 pool: ThreadPool = None, trap_detector: TrapDetector = None,
+                 seen_filter: ScalableBloomFilter = None):
+        """
+        :param domain: the domain root URL to start crawling from
+        :type domain: str
+        :param session: the fetch session (DNS cache, connections) to use; a new one, if None
+        :type session: FetchSession
+        :param prefetch_dns: resolve the site's host in the background, before the first fetch needs it
+        :type prefetch_dns: bool
+        :param budget: the limits on pages, depth, bytes and time; unbounded, if None
+        :type budget: CrawlBudget
+        :param seed_sitemaps: seed the frontier with the URLs in the site's sitemap.xml files (read on a
+            background thread, while the crawl runs)
+        :type seed_sitemaps: bool
+        :param canonicalizer: the rules discovered URLs are rewritten with before they are queued
+            (lowercase scheme and host, no default ports or fragments, if None)
+        :type canonicalizer: UrlCanonicalizer
+        :param priorities: the weights of the frontier signals (see frontier.build_scorer), which decide
+            the order links are visited in; breadth-first, if None
+        :type priorities: dict
+        :param path_weights: (glob pattern, weight) pairs that raise or lower the priority of matching links
+        :type path_weights: list
+        :param pool: a worker pool shared with other crawlers; a new pool of MAX_NUM_THREADS, if None
+        :type pool: ThreadPool
+        :param trap_detector: suppresses discovered links that look like crawler traps; no detection, if None
+        :type trap_detector: TrapDetector
+        :param seen_filter: a probabilistic seen-set that links are checked against (and added to) before
+            they are queued, instead of the sitemap and the frontier; links are then queued once, so
+            in-link counts aren't kept, and a false positive skips a page. Only the memory of the seen-set
+            is bounded: the sitemap (and its reverse link index) still grows with every page
+        :type seen_filter: ScalableBloomFilter
+        """
+        self._owns_pool = pool is None
+        self.pool = pool or ThreadPool(self.MAX_NUM_THREADS)
 
         self.root = domain
-        self.links_to_visit = set()
+        self._host = urlparse(domain).hostname
         self.failed_links = set()
+        self.timed_out_links = set()
 
         self.sitemap = sitemap.SiteMap()
 
+        self.budget = budget or CrawlBudget()
+        self._depths = {}
+        self._in_flight = set()
+        # Links taken from the frontier (visited, failed or in flight), which aren't queued again.
+        self._dequeued = set()
+        self._pending_hashes = set()
+        self.skipped_parses = 0
+        self._closed = False
+        self._stopping = False
+        self._page_sink = None
+        self._lock = threading.Lock()
+        self._work_done = threading.Condition(self._lock)
+
+        self.canonicalizer = canonicalizer or link_classifier.DEFAULT_CANONICALIZER
+        self.trap_detector = trap_detector
+        self.seen_filter = seen_filter
+        self.seed_sitemaps = seed_sitemaps
+        self.seed_entries = {}
+        self._seeding = False
+        self._seeder = None
+        self.asset_info = {}
+
+        self.links_to_visit = Frontier(build_scorer(priorities, path_weights, self._depths, self.seed_entries))
+
+        self.session = session or page_fetcher.FetchSession()
+        self.prefetch_dns = prefetch_dns
+        if self.prefetch_dns:
+            self.session.prefetch([self.root])
+
     def _visit_link(self, url: str):
         """ Visit a link and add it to the sitemap. """
 
+        depth = self._depths.get(url, 0)
         url = link_classifier.absolutize_link(self.root, url)
         logger.info('Visiting ' + url)
 
@@ -37,51 +218,399 @@ class Crawler(object):
         if self.sitemap.has_page(url):
             return
 
+        started = time.monotonic()
         page_content = self._get_page_content(url)
+        fetch_time = time.monotonic() - started
         if page_content:
-            self._add_page_record(url, page_content)
+            self.budget.charge_bytes(len(page_content))
+            crawled = self._add_page_record(url, page_content, depth)
+
+            if crawled and self._page_sink:
+                crawled.size = len(page_content)
+                crawled.fetch_time = fetch_time
+                self._page_sink(crawled)
 
-    def _add_page_record(self, url: str, page_content: bytes):
-        """ Build a page and add it to the current sitemap. """
+    def _add_page_record(self, url: str, page_content: bytes, depth: int = 0) -> CrawledPage:
+        """
+        Build a page and add it to the current sitemap.
 
+        The content hash is looked up first: a page whose content is already in the sitemap is added as
+        an alias of it without being parsed. While a page is being parsed, its hash is claimed, so
+        concurrent fetches of the same content wait for it instead of parsing it again.
+
+        :return: the committed page; None, if the crawl was already closed
+        """
         page_hash = sitemap.compute_page_hash(page_content)
-        cl = link_classifier.LinkClassifier(url, page_content)
-        page = sitemap.Page(url, page_hash, cl.static_assets, cl.same_domain_links)
 
-        self.sitemap.add_page(page)
-        self.links_to_visit |= page.links - self.sitemap.pages.keys()
+        with self._lock:
+            while True:
+                # Results that arrive after the crawl was drained are dropped, to keep the sitemap consistent.
+                if self._closed:
+                    return None
+                if self.sitemap.has_hash(page_hash):
+                    return self._add_alias(url, page_hash, depth)
+                if page_hash not in self._pending_hashes:
+                    self._pending_hashes.add(page_hash)
+                    break
+                self._work_done.wait()
+
+        try:
+            cl = link_classifier.LinkClassifier(url, page_content, self.canonicalizer)
+            page = sitemap.Page(url, page_hash, cl.static_assets, cl.same_domain_links)
+        finally:
+            with self._lock:
+                self._pending_hashes.discard(page_hash)
+                self._work_done.notify_all()
+
+        with self._lock:
+            if self._closed:
+                return None
+
+            self.sitemap.add_page(page)
+            committed = self.sitemap.pages[page.urls[0]]
+            crawled = CrawledPage(url, committed, depth, duplicate=committed is not page)
+            self._queue_links(page.links, depth + 1)
+
+        return crawled
+
+    def _add_alias(self, url: str, page_hash: str, depth: int) -> CrawledPage:
+        """ Add a url as an alias of the page with the same content, skipping the parse. Needs self._lock. """
+
+        committed = self.sitemap.add_alias(url, page_hash)
+        self.skipped_parses += 1
+
+        # The alias may be shallower than the page, so its links may be followable from here.
+        self._queue_links(committed.links, depth + 1)
+        return CrawledPage(url, committed, depth, duplicate=True)
+
+    def _queue_links(self, links: set, depth: int):
+        """ Add the links that weren't seen yet to the frontier, at a given depth. Needs self._lock. """
+
+        if not self.budget.allows_depth(depth):
+            return
+
+        if self.seen_filter is not None:
+            new_links = [link for link in links if not self.seen_filter.add(link)]
+        else:
+            new_links = links - self.sitemap.pages.keys() - self._dequeued
+        if self.trap_detector:
+            # Only links the frontier doesn't have yet are counted by the detector; queued ones are still
+            # added, to count their in-links.
+            queued = [link for link in new_links if link in self.links_to_visit]
+            new_links = self.trap_detector.filter(link for link in new_links if link not in self.links_to_visit)
+            new_links.update(queued)
+        for link in new_links:
+            self._depths.setdefault(link, depth)
+        self.links_to_visit |= new_links
 
     def _get_page_content(self, url: str) -> bytes:
         """ Get the page content for a given URL. """
 
-        pf = page_fetcher.PageFetcher(url)
+        pf = page_fetcher.PageFetcher(url, self.session)
 
-        # Store invalid/failed links for future inspection.
+        # Store invalid/failed links for future inspection, keeping timeouts apart.
         if not pf.is_valid() or not pf.content:
-            self.failed_links.add(url)
+            if pf.timed_out():
+                self.timed_out_links.add(url)
+            else:
+                self.failed_links.add(url)
             return None
 
         return pf.content
 
+    def _start(self):
+        """ Start the budget clock and seed the crawl with the root page (and its sitemaps, if requested). """
+
+        self.budget.start()
+        self._closed = False
+        self._stopping = False
+        if not self.sitemap.pages:
+            self._depths.setdefault('/', 0)
+            self.links_to_visit.add('/')
+            if self.seen_filter is not None:
+                self.seen_filter.add('/')
+            if self.seed_sitemaps and self._seeder is None:
+                self._seeding = True
+                self._seeder = threading.Thread(target=self._run_seeder, name='sitemap-seeder', daemon=True)
+                self._seeder.start()
+
+    def _run_seeder(self):
+        """ Seed the frontier on the seeder thread, and signal the end of seeding however it ends. """
+
+        try:
+            self._seed_from_sitemaps()
+        except Exception:
+            logger.exception('Failed to seed from the sitemaps of ' + self.root)
+        finally:
+            with self._lock:
+                self._seeding = False
+                self._work_done.notify_all()
+
+    def _seed_from_sitemaps(self):
+        """
+        Stream the same-domain URLs from the site's sitemaps into the frontier in batches, while the
+        crawl fetches pages (runs on its own thread). Their entries (with <lastmod> and <priority>) are
+        kept in self.seed_entries. Seeding stops when the crawl's budget runs out, or the crawl stops.
+        """
+        # Compare canonical hosts, so a differently cased host or an explicit default port still matches.
+        domain = link_classifier._get_domain(self.canonicalizer(self.root))
+
+        batch = {}
+        flushed = time.monotonic()
+        for entry in sitemap_xml.iter_site_urls(self.root, self.session):
+            if self.budget.exhausted() or self._stopping or self._closed:
+                break
+            loc = self.canonicalizer(entry.loc)
+            if link_classifier._get_domain(loc) != domain:
+                continue
+
+            batch[sitemap._get_relative_url(loc)] = entry
+            if len(batch) >= self.SEED_BATCH_SIZE or time.monotonic() - flushed >= self.SEED_FLUSH_INTERVAL:
+                self._add_seeds(batch)
+                batch = {}
+                flushed = time.monotonic()
+
+        self._add_seeds(batch)
+        logger.info('Seeded ' + str(len(self.seed_entries)) + ' links from sitemaps')
+
+    def _add_seeds(self, entries: dict):
+        """ Add a batch of sitemap links (with their entries) to the frontier, at depth 1, and wake the dispatcher. """
+
+        with self._lock:
+            if self._closed:
+                return
+            self.seed_entries.update(entries)
+            self._queue_links(entries.keys(), 1)
+            self._work_done.notify_all()
+
+    def _log_exhausted_budget(self):
+        """ Log which budget ran out, if any (and the state of the seen-set, if there is one). """
+
+        reason = self.budget.exhausted()
+        if reason:
+            logger.info('Crawl budget exhausted (' + reason + '), ' +
+                        str(len(self.links_to_visit)) + ' links left unvisited')
+
+        if self.seen_filter is not None:
+            stats = self.seen_filter.stats()
+            logger.info('Seen-set: %d links in %d bytes, estimated false positive rate %.2g' % (
+                stats['items'], stats['bytes'], stats['estimated_error_rate']
+            ))
+
     def crawl(self):
         """ Start the crawling process. """
 
-        self.links_to_visit.add('/')
+        self._start()
+
+        while not self.budget.exhausted() and not self._stopping:
+            with self._lock:
+                if not self.links_to_visit:
+                    if not self._seeding:
+                        break
+                    # Wait for the next batch of sitemap links.
+                    self._work_done.wait(self.budget.time_left())
+                    continue
+
+            pause = self._circuit_pause()
+            if pause:
+                time.sleep(pause)
+                continue
+
+            with self._lock:
+                link = self._pop_link()
+            self.budget.charge_page()
+            self._visit_link(link)
+            with self._lock:
+                self._forget_depth(link)
+
+        self._log_exhausted_budget()
+
+    def _circuit_pause(self) -> float:
+        """
+        Seconds to hold off dispatching links while the site's circuit breaker is open (or a probe
+        request is in flight), bounded by the time left in the budget.
+        """
+        pause = self.session.breakers.wait_time(self._host)
+        time_left = self.budget.time_left()
+        return pause if time_left is None else min(pause, time_left)
+
+    def _visit_link_task(self, link: str):
+        """ Visit a link on a worker thread, and signal the dispatcher when done. """
 
-        while self.links_to_visit:
-            link = self.links_to_visit.pop()
+        try:
             self._visit_link(link)
+        except Exception:
+            logger.exception('Failed to visit ' + link)
+        finally:
+            with self._lock:
+                self._in_flight.discard(link)
+                self._forget_depth(link)
+                self._work_done.notify_all()
 
     def parallel_crawl(self):
-        """ Start a parallel crawl (multi-threaded version). """
-
-        self.links_to_visit.add('/')
-        while self.links_to_visit:
-            # Move the existing links_to_visit set to a temp var, and empty it,
-            # so that it can be processed in parallel without interference.
-            links = self.links_to_visit
-            self.links_to_visit = set()
-            self.pool.map(self._visit_link, links)
+        """
+        Start a parallel crawl (multi-threaded version).
+
+        Links are dispatched to the worker pool as soon as a worker is free. When the budget runs out,
+        no more links are dispatched, and in-flight fetches get the budget's grace period to finish;
+        anything still in flight after that is returned to links_to_visit. While the site's circuit
+        breaker is open, dispatching pauses instead of failing every link in the frontier. An interrupted
+        crawl (KeyboardInterrupt) is drained the same way before the exception propagates.
+        """
+        self._start()
+
+        with self._lock:
+            try:
+                while not self.budget.exhausted() and not self._stopping:
+                    if self.links_to_visit and len(self._in_flight) < self.MAX_NUM_THREADS:
+                        pause = self._circuit_pause()
+                        if pause:
+                            self._work_done.wait(pause)
+                            continue
+
+                        self.pool.apply_async(self._visit_link_task, (self._take_link(),))
+                    elif self._in_flight or self._seeding:
+                        self._work_done.wait(self.budget.time_left())
+                    else:
+                        break
+            finally:
+                # Also when interrupted (e.g. by Ctrl-C), so the links in flight go back to the frontier.
+                self._drain()
+
+        self._log_exhausted_budget()
+
+    def _pop_link(self) -> str:
+        """
+        Pop the best link from the frontier, and remember it so it isn't queued again (a seen-filter
+        already remembers it). Needs self._lock.
+        """
+        link = self.links_to_visit.pop()
+        if self.seen_filter is None:
+            self._dequeued.add(link)
+        return link
+
+    def _take_link(self) -> str:
+        """ Pop the best link from the frontier and mark it in flight, charging it to the budget. Needs self._lock. """
+
+        link = self._pop_link()
+        self._in_flight.add(link)
+        self.budget.charge_page()
+        return link
+
+    def _forget_depth(self, link: str):
+        """
+        Drop the depth of a visited link, unless it was queued again (e.g. by _drain()), so the depths
+        kept are only those of the frontier's links. Needs self._lock.
+        """
+        if link not in self.links_to_visit:
+            self._depths.pop(link, None)
+
+    def _drain(self):
+        """ Wait for in-flight fetches within the grace period, then close the crawl. Needs self._lock. """
+
+        if self._in_flight:
+            self._work_done.wait_for(lambda: not self._in_flight, self.budget.grace_period)
+
+        self._closed = True
+        # Links whose pages were committed, but whose workers were still handing them to a stream.
+        returned = self._in_flight - self.sitemap.pages.keys()
+        self.links_to_visit |= returned
+        self._dequeued -= returned
+        self._in_flight = set()
+
+    def stop(self):
+        """
+        Ask a running crawl to stop dispatching links (from another thread). In-flight fetches get the
+        budget's grace period to finish, as when a budget runs out.
+        """
+        with self._lock:
+            self._stopping = True
+            self._work_done.notify_all()
+
+    def close(self):
+        """ Terminate the worker pool (unless it's shared). The crawler can't crawl in parallel any more. """
+
+        if self._owns_pool:
+            self.pool.terminate()
+            self.pool.join()
+
+    def iter_pages(self, max_buffered: int = 100):
+        """
+        Crawl in parallel on a background thread, and yield each page as soon as it is committed to the
+        sitemap, as a CrawledPage.
+
+        At most `max_buffered` pages are buffered for the consumer; beyond that, workers wait for the
+        consumer to catch up, so fetching never runs far ahead of processing. Closing the generator
+        early (e.g. breaking out of the loop) stops the crawl and terminates the worker pool.
+
+        :param max_buffered: the maximum number of committed pages waiting to be consumed
+        :type max_buffered: int
+        """
+        stream = _PageStream(self, max_buffered)
+        stream.start()
+        try:
+            while True:
+                crawled = stream.get()
+                if crawled is None:
+                    return
+                yield crawled
+        finally:
+            stream.close()
+
+    async def aiter_pages(self, max_buffered: int = 100):
+        """
+        The async version of iter_pages(): the crawl runs on its own threads, and the event loop only
+        waits for committed pages. Cancelling the consuming task, or closing the generator early,
+        stops the crawl and terminates the worker pool.
+        """
+        loop = asyncio.get_running_loop()
+        stream = _PageStream(self, max_buffered)
+        stream.start()
+        try:
+            while True:
+                crawled = await loop.run_in_executor(None, stream.get)
+                if crawled is None:
+                    return
+                yield crawled
+        finally:
+            stream.cancelled.set()
+            await loop.run_in_executor(None, stream.close)
+
+    def probe_assets(self, max_workers: int = asset_probe.AssetProber.MAX_NUM_THREADS) -> dict:
+        """
+        Send one HEAD request to each distinct static asset in the sitemap (through a bounded pool),
+        and store the results in self.asset_info.
+        """
+        prober = asset_probe.AssetProber(self.session, max_workers, self.asset_info)
+        return prober.probe(self.sitemap.asset_urls())
+
+    def failed_link_referrers(self) -> dict:
+        """ Return each failed link together with the urls of the pages that link to it. """
+
+        return {
+            url: self.sitemap.referrers(sitemap._get_relative_url(url) or '/')
+            for url in self.failed_links
+        }
+
+    def summary(self) -> dict:
+        """ Return a summary of the crawl so far, including fetch-layer statistics. """
+
+        return {
+            'pages': len(self.sitemap.pages),
+            'skipped_parses': self.skipped_parses,
+            'failed_links': len(self.failed_links),
+            'timed_out_links': len(self.timed_out_links),
+            'links_to_visit': len(self.links_to_visit),
+            'budget': self.budget.stats(),
+            'assets': {
+                'distinct': len(self.sitemap.asset_urls()),
+                'probed': len(self.asset_info),
+                'bytes': sum(info.size or 0 for info in self.asset_info.values()),
+            },
+            'fetch': self.session.stats(),
+            'traps': self.trap_detector.stats() if self.trap_detector else None,
+            'seen_filter': self.seen_filter.stats() if self.seen_filter is not None else None,
+        }
 
 
 # --- Main function:
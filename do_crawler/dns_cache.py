@@ -0,0 +1,206 @@
+import logging
+import socket
+import threading
+import time
+
+from multiprocessing.dummy import Pool as ThreadPool
+
+
+logger = logging.getLogger(__name__)
+
+
+# --- DNS cache helper functions:
+
+
+def _system_resolver(host: str, port: int) -> list:
+    """ Resolve a host with the system resolver, restricted to TCP stream addresses. """
+
+    return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+
+# --- DNSCache:
+
+
+class _Entry(object):
+    """ A single cache slot: the resolved addresses (or the error) and its expiry time. """
+
+    __slots__ = ('addresses', 'error', 'expires')
+
+    def __init__(self, addresses: list, error: Exception, expires: float):
+        self.addresses = addresses
+        self.error = error
+        self.expires = expires
+
+
+class DNSCache(object):
+    """
+    A thread-safe resolver cache shared by all fetches of a crawl:
+
+        - Successful resolutions are kept for `ttl` seconds.
+        - Failed resolutions are kept for `negative_ttl` seconds (negative caching).
+        - Concurrent lookups of the same host wait for a single in-flight resolution.
+        - Hosts can be prefetched asynchronously before they are first fetched.
+    """
+
+    DEFAULT_TTL = 300.0
+    DEFAULT_NEGATIVE_TTL = 30.0
+    MAX_PREFETCH_THREADS = 4
+
+    def __init__(self, resolver=_system_resolver, ttl: float = DEFAULT_TTL,
+                 negative_ttl: float = DEFAULT_NEGATIVE_TTL, clock=time.monotonic):
+        """
+        :param resolver: a callable (host, port) -> getaddrinfo-style list; raises OSError on failure
+        :param ttl: seconds to keep successful resolutions
+        :type ttl: float
+        :param negative_ttl: seconds to keep failed resolutions
+        :type negative_ttl: float
+        :param clock: a monotonic clock, replaceable in tests
+        """
+        self._resolver = resolver
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._clock = clock
+
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._prefetch_pool = None
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.resolutions = 0
+        self.resolution_time = 0.0
+
+    def resolve(self, host: str, port: int) -> list:
+        """
+        Return the getaddrinfo-style address list for a host, resolving it at most once per TTL.
+
+        :raises OSError: if the host can't be resolved (the error is cached for `negative_ttl`)
+        """
+        key = (host, port)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if self._is_fresh(key):
+                    if entry.error:
+                        self.negative_hits += 1
+                        raise entry.error
+                    self.hits += 1
+                    return entry.addresses
+
+                # Wait for another thread that's already resolving this host.
+                pending = self._in_flight.get(key)
+                if pending is None:
+                    pending = self._in_flight[key] = threading.Event()
+                    self.misses += 1
+                    break
+
+            pending.wait()
+
+        try:
+            entry = self._resolve_entry(host, port)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            pending.set()
+
+        if entry.error:
+            raise entry.error
+        return entry.addresses
+
+    def _resolve_entry(self, host: str, port: int) -> _Entry:
+        """ Call the underlying resolver and store the outcome in the cache. """
+
+        start = self._clock()
+        try:
+            addresses = self._resolver(host, port)
+        except OSError as e:
+            addresses, error, ttl = None, e, self._negative_ttl
+        else:
+            error, ttl = None, self._ttl
+        end = self._clock()
+
+        entry = _Entry(addresses, error, end + ttl)
+        with self._lock:
+            self._entries[(host, port)] = entry
+            self.resolutions += 1
+            self.resolution_time += end - start
+
+        return entry
+
+    def is_cached(self, host: str, port: int) -> bool:
+        """ Check whether a host has a fresh (positive or negative) cache entry. """
+
+        with self._lock:
+            return self._is_fresh((host, port))
+
+    def prefetch(self, hosts, port: int = 80):
+        """
+        Resolve hosts asynchronously so that their first fetch finds a warm cache.
+        Hosts that are already cached or being resolved are skipped.
+
+        :param hosts: an iterable of host names
+        :param port: the port the hosts will be connected on
+        """
+        with self._lock:
+            todo = {
+                host for host in hosts
+                if (host, port) not in self._in_flight and not self._is_fresh((host, port))
+            }
+            if not todo:
+                return
+            if not self._prefetch_pool:
+                self._prefetch_pool = ThreadPool(self.MAX_PREFETCH_THREADS)
+
+        for host in todo:
+            self._prefetch_pool.apply_async(self._prefetch_one, (host, port))
+
+    def _is_fresh(self, key: tuple) -> bool:
+        """ Check for an unexpired entry; the caller must hold the lock. """
+
+        entry = self._entries.get(key)
+        return bool(entry) and entry.expires > self._clock()
+
+    def _prefetch_one(self, host: str, port: int):
+        """ Resolve a single prefetched host, logging (but not raising) failures. """
+
+        try:
+            self.resolve(host, port)
+        except OSError as e:
+            logger.info('Prefetch of ' + host + ' failed: ' + str(e))
+
+    def close(self):
+        """ Stop the prefetch workers, if any were started. """
+
+        if self._prefetch_pool:
+            self._prefetch_pool.close()
+            self._prefetch_pool.join()
+            self._prefetch_pool = None
+
+    def stats(self) -> dict:
+        """ Return the cache hit/miss counters and the average resolution latency (in ms). """
+
+        with self._lock:
+            avg_ms = 1000.0 * self.resolution_time / self.resolutions if self.resolutions else 0.0
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'resolutions': self.resolutions,
+                'avg_resolution_ms': round(avg_ms, 3),
+            }
+
+
+# --- Main function:
+
+
+def main():
+    cache = DNSCache()
+    for _ in range(3):
+        print(cache.resolve('www.cnn.com', 80)[0][4])
+    print(cache.stats())
+
+
+if __name__ == '__main__':
+    main()
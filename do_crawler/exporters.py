@@ -0,0 +1,228 @@
+import gzip
+import io
+import json
+import os
+import sys
+
+from itertools import islice
+
+from do_crawler.link_classifier import absolutize_link
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+from do_crawler.sitemap_viz import print_sitemap
+from xml.sax.saxutils import escape
+
+
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+# --- Exporter helper functions:
+
+
+def _distinct_pages(sitemap: SiteMap):
+    """ Iterate over the distinct pages of a sitemap (aliases share a Page), in insertion order. """
+
+    for url, page in sitemap.pages.items():
+        if page.urls[0] == url:
+            yield page
+
+
+def _page_record(page: Page) -> dict:
+    """ The JSON representation of a page. """
+
+    return {
+        'urls': page.urls,
+        'hash': page.page_hash,
+        'links': sorted(page.links),
+        'static_assets': sorted(page.static_assets),
+    }
+
+
+def open_output(path: str, compress: bool = False):
+    """ Open an output file for buffered text writing, gzipping it if requested. """
+
+    if compress:
+        return io.TextIOWrapper(
+            io.BufferedWriter(gzip.open(path, 'wb'), WRITE_BUFFER_SIZE), encoding='utf-8'
+        )
+    return open(path, 'w', encoding='utf-8', buffering=WRITE_BUFFER_SIZE)
+
+
+def _dot_id(url: str) -> str:
+    """ Quote a url as a Graphviz DOT node id. """
+
+    return '"' + url.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+# --- Exporters:
+
+
+class Exporter(object):
+    """
+    Base class for sitemap exporters. Subclasses implement write(), which streams a sitemap to an
+    open text file; export() takes care of opening the output (buffered, and gzipped if requested).
+    """
+
+    def __init__(self, base_url: str = None, compress: bool = False):
+        """
+        :param base_url: the domain root, used by formats that need absolute urls
+        :type base_url: str
+        :param compress: gzip the output file(s)
+        :type compress: bool
+        """
+        self.base_url = base_url
+        self.compress = compress
+
+    def _open(self, path: str):
+        """ Open an output file for buffered text writing, compressing it if requested. """
+
+        return open_output(path, self.compress)
+
+    def export(self, sitemap: SiteMap, path: str = None):
+        """ Export a sitemap to a file; to stdout, if no path is given. """
+
+        if path is None:
+            self.write(sitemap, sys.stdout)
+            return
+
+        with self._open(path) as f:
+            self.write(sitemap, f)
+
+    def write(self, sitemap: SiteMap, file):
+        """ Stream a sitemap to an open text file. """
+
+        raise NotImplementedError
+
+
+class TextExporter(Exporter):
+    """ The human-readable console dump (see sitemap_viz). """
+
+    def write(self, sitemap: SiteMap, file):
+        print_sitemap(sitemap, file)
+
+
+class NDJSONExporter(Exporter):
+    """ One JSON object per distinct page, per line. """
+
+    def write(self, sitemap: SiteMap, file):
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        for page in _distinct_pages(sitemap):
+            file.write(encode(_page_record(page)) + '\n')
+
+
+class JSONExporter(Exporter):
+    """ A single JSON document: {"pages": [...]}, streamed one page at a time. """
+
+    def write(self, sitemap: SiteMap, file):
+        encode = json.JSONEncoder(ensure_ascii=False).encode
+        file.write('{"pages": [')
+        separator = '\n'
+        for page in _distinct_pages(sitemap):
+            file.write(separator + encode(_page_record(page)))
+            separator = ',\n'
+        file.write('\n]}\n')
+
+
+class DOTExporter(Exporter):
+    """ The link graph in Graphviz DOT format. Links to aliases point to the original page. """
+
+    def write(self, sitemap: SiteMap, file):
+        file.write('digraph sitemap {\n')
+        for page in _distinct_pages(sitemap):
+            src = _dot_id(page.urls[0])
+            file.write(src + ';\n')
+            for link in sorted(page.links):
+                target = sitemap.pages.get(link)
+                file.write(src + ' -> ' + _dot_id(target.urls[0] if target else link) + ';\n')
+        file.write('}\n')
+
+
+class XMLSitemapExporter(Exporter):
+    """
+    Files in the sitemaps.org protocol, with one <url> per distinct page.
+
+    The protocol limits a sitemap file to 50,000 urls, so larger sitemaps are split into numbered
+    files next to the output path (e.g. sitemap-1.xml, sitemap-2.xml), and the output path itself
+    becomes a sitemap index that lists them (assuming they'll be served from the base url).
+    """
+
+    MAX_URLS_PER_FILE = 50000
+    XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+    def _loc(self, url: str) -> str:
+        """ The escaped absolute url for a <loc> element. """
+
+        if not self.base_url:
+            return escape(url)
+        # Sitemap urls are root-relative paths, so joining them is a plain concatenation.
+        if url.startswith('/'):
+            return escape(self.base_url.rstrip('/') + url)
+        return escape(absolutize_link(self.base_url, url))
+
+    def write(self, sitemap: SiteMap, file):
+        """ Write a single sitemap file (only valid for sitemaps of up to MAX_URLS_PER_FILE pages). """
+
+        self._write_urlset(_distinct_pages(sitemap), file)
+
+    def _write_urlset(self, pages, file):
+        """ Write up to MAX_URLS_PER_FILE pages from an iterator as a <urlset>. """
+
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="' + self.XMLNS + '">\n')
+        for page in islice(pages, self.MAX_URLS_PER_FILE):
+            file.write('<url><loc>' + self._loc(page.urls[0]) + '</loc></url>\n')
+        file.write('</urlset>\n')
+
+    def export(self, sitemap: SiteMap, path: str = None):
+        """ Export a sitemap to a single file, or to a sitemap index and its numbered parts. """
+
+        num_pages = len({id(page) for page in sitemap.pages.values()})
+        if num_pages <= self.MAX_URLS_PER_FILE:
+            super().export(sitemap, path)
+            return
+
+        if path is None:
+            raise ValueError('Sitemaps of more than ' + str(self.MAX_URLS_PER_FILE) +
+                             ' pages are split into several files, and need an output file.')
+
+        root = os.path.splitext(path[:-len('.gz')] if path.endswith('.gz') else path)[0]
+        ext = '.xml.gz' if self.compress else '.xml'
+
+        pages = _distinct_pages(sitemap)
+        num_parts = (num_pages + self.MAX_URLS_PER_FILE - 1) // self.MAX_URLS_PER_FILE
+        part_paths = [root + '-' + str(part) + ext for part in range(1, num_parts + 1)]
+        for part_path in part_paths:
+            with self._open(part_path) as f:
+                self._write_urlset(pages, f)
+
+        with self._open(path) as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="' + self.XMLNS + '">\n')
+            for part_path in part_paths:
+                f.write('<sitemap><loc>' + self._loc(os.path.basename(part_path)) + '</loc></sitemap>\n')
+            f.write('</sitemapindex>\n')
+
+
+EXPORTERS = {
+    'text': TextExporter,
+    'json': JSONExporter,
+    'ndjson': NDJSONExporter,
+    'xml': XMLSitemapExporter,
+    'dot': DOTExporter,
+}
+
+
+def register_exporter(name: str, exporter_class: type):
+    """ Make a new exporter class available by name (e.g. to crawl.py's --format option). """
+
+    EXPORTERS[name] = exporter_class
+
+
+def get_exporter(name: str, **kwargs) -> Exporter:
+    """ Create an exporter by format name. """
+
+    try:
+        exporter_class = EXPORTERS[name]
+    except KeyError:
+        raise ValueError('Unknown export format: ' + name)
+    return exporter_class(**kwargs)
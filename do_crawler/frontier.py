@@ -0,0 +1,280 @@
+import heapq
+import math
+import re
+
+from datetime import (
+    datetime,
+    timezone
+)
+from fnmatch import translate
+
+
+# --- Scorers:
+#
+# A scorer rates a frontier URL: score(url, inlinks) -> float, where inlinks is the number of times the
+# URL has been added to the frontier so far (i.e. how many crawled pages link to it). Higher scores are
+# visited first.
+
+
+class DepthScorer(object):
+    """ Prefer shallow pages: the score is minus the link depth (a breadth-first crawl). """
+
+    def __init__(self, depths: dict):
+        """
+        :param depths: the link depth of each URL (kept up to date by the crawler)
+        :type depths: dict
+        """
+        self.depths = depths
+
+    def __call__(self, url: str, inlinks: int) -> float:
+        return -self.depths.get(url, 0)
+
+
+class InlinkScorer(object):
+    """ Prefer pages that many crawled pages link to: the score is log(1 + in-links). """
+
+    def __call__(self, url: str, inlinks: int) -> float:
+        return math.log1p(inlinks)
+
+
+def _parse_lastmod(lastmod: str) -> datetime:
+    """ Parse a W3C datetime from a sitemap <lastmod> (a date, or a date and time); None, if malformed. """
+
+    try:
+        parsed = datetime.fromisoformat(lastmod.strip().replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class SitemapScorer(object):
+    """
+    Prefer pages that the site's sitemap.xml ranks high, or that changed recently:
+
+        - priority: the <priority> of the page (0.5 if it isn't given, 0 for pages not in the sitemap).
+        - freshness: 1 for a page modified now, halving every `half_life` days (0 without a <lastmod>).
+
+    The score is the sum of the two, weighted by `priority_weight` and `freshness_weight`.
+    """
+
+    DEFAULT_PRIORITY = 0.5
+
+    def __init__(self, entries: dict, priority_weight: float = 1.0, freshness_weight: float = 1.0,
+                 half_life: float = 30.0, now: datetime = None):
+        """
+        :param entries: the SitemapEntry of each URL (kept up to date by the crawler)
+        :type entries: dict
+        :param half_life: the age, in days, at which freshness halves
+        :param now: the time freshness is measured from; the current time, if None
+        """
+        self.entries = entries
+        self.priority_weight = priority_weight
+        self.freshness_weight = freshness_weight
+        self.half_life = half_life
+        self.now = now or datetime.now(timezone.utc)
+
+    def _freshness(self, lastmod: str) -> float:
+        """ 1 for a page modified now, halving every half_life days. """
+
+        modified = _parse_lastmod(lastmod) if lastmod else None
+        if modified is None:
+            return 0.0
+        age_days = max(0.0, (self.now - modified).total_seconds() / 86400)
+        return 0.5 ** (age_days / self.half_life)
+
+    def __call__(self, url: str, inlinks: int) -> float:
+        entry = self.entries.get(url)
+        if entry is None:
+            return 0.0
+
+        priority = self.DEFAULT_PRIORITY if entry.priority is None else entry.priority
+        return self.priority_weight * priority + self.freshness_weight * self._freshness(entry.lastmod)
+
+
+class PathPatternScorer(object):
+    """
+    Weight pages by URL pattern: the score is the sum of the weights of the glob patterns (matched
+    against the path and query, e.g. '/products/*' or '*page=*') that a URL matches.
+    """
+
+    def __init__(self, patterns: list):
+        """
+        :param patterns: a list of (glob pattern, weight) pairs; negative weights push pages back
+        :type patterns: list
+        """
+        self.patterns = [(re.compile(translate(pattern)), weight) for pattern, weight in patterns]
+
+    def __call__(self, url: str, inlinks: int) -> float:
+        return sum(weight for pattern, weight in self.patterns if pattern.match(url))
+
+
+class WeightedScorer(object):
+    """ Combine scorers into a weighted sum. """
+
+    def __init__(self, scorers: list):
+        """
+        :param scorers: a list of (scorer, weight) pairs
+        :type scorers: list
+        """
+        self.scorers = scorers
+
+    def __call__(self, url: str, inlinks: int) -> float:
+        return sum(weight * scorer(url, inlinks) for scorer, weight in self.scorers)
+
+
+SCORERS = ('depth', 'inlinks', 'sitemap')
+
+
+def build_scorer(weights: dict = None, path_weights: list = None, depths: dict = None,
+                 sitemap_entries: dict = None):
+    """
+    Build a frontier scorer from named signal weights.
+
+    :param weights: the weight of each signal in SCORERS (e.g. {'depth': 1, 'inlinks': 0.5});
+        breadth-first ({'depth': 1}), if None
+    :param path_weights: (glob pattern, weight) pairs for a PathPatternScorer
+    :param depths: the link depth of each URL, for the depth signal
+    :param sitemap_entries: the SitemapEntry of each URL, for the sitemap signal
+    :return: a scorer for Frontier
+    """
+    if weights is None:
+        weights = {'depth': 1.0}
+
+    unknown = set(weights) - set(SCORERS)
+    if unknown:
+        raise ValueError('Unknown frontier signals: ' + ', '.join(sorted(unknown)))
+
+    factories = {
+        'depth': lambda: DepthScorer(depths if depths is not None else {}),
+        'inlinks': InlinkScorer,
+        'sitemap': lambda: SitemapScorer(sitemap_entries if sitemap_entries is not None else {}),
+    }
+    scorers = [(factories[name](), weight) for name, weight in weights.items() if weight]
+    if path_weights:
+        scorers.append((PathPatternScorer(path_weights), 1.0))
+
+    if len(scorers) == 1 and scorers[0][1] == 1.0:
+        return scorers[0][0]
+    return WeightedScorer(scorers)
+
+
+# --- Frontier:
+
+
+class Frontier(object):
+    """
+    A best-first frontier: a priority queue of URLs, visited in order of decreasing score (ties in the
+    order they were added).
+
+        - add() and pop() are O(log n); a URL is queued once, however many times it's added.
+        - Adding a URL that's already queued counts one more in-link, and re-scores it; a changed score
+          pushes a new heap entry, and the old one is skipped when it reaches the top (lazy deletion).
+        - discard() is O(1), also by lazy deletion.
+
+    It supports the set operations the crawler uses (in, len, iteration, |=, ==), so it can stand in
+    for a set of links.
+    """
+
+    def __init__(self, scorer=None, links=()):
+        """
+        :param scorer: rates URLs as score(url, inlinks) -> float; first in, first out, if None
+        :param links: the initial links
+        """
+        self.scorer = scorer
+        self._heap = []
+        self._entries = {}
+        self._inlinks = {}
+        self._counter = 0
+        self |= links
+
+    def _score(self, url: str) -> float:
+        return self.scorer(url, self._inlinks.get(url, 0)) if self.scorer else 0.0
+
+    def _push(self, url: str, score: float):
+        """ Push a heap entry for a URL, making it the URL's live entry. """
+
+        self._counter += 1
+        entry = [-score, self._counter, url]
+        self._entries[url] = entry
+        heapq.heappush(self._heap, entry)
+
+        # Rebuild the heap when stale entries dominate it.
+        if len(self._heap) > 2 * len(self._entries) + 1024:
+            self._heap = list(self._entries.values())
+            heapq.heapify(self._heap)
+
+    def add(self, url: str):
+        """ Queue a URL, or count an in-link to a queued one (re-scoring it). """
+
+        self._inlinks[url] = self._inlinks.get(url, 0) + 1
+
+        entry = self._entries.get(url)
+        score = self._score(url)
+        if entry is None or -entry[0] != score:
+            self._push(url, score)
+
+    def update(self, url: str):
+        """ Re-score a queued URL, e.g. after the data its scorer depends on has changed. """
+
+        entry = self._entries.get(url)
+        if entry is not None:
+            score = self._score(url)
+            if -entry[0] != score:
+                self._push(url, score)
+
+    def pop(self) -> str:
+        """
+        Remove and return the URL with the highest score.
+
+        :raises KeyError: if the frontier is empty
+        """
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            url = entry[2]
+            if self._entries.get(url) is entry:
+                del self._entries[url]
+                self._inlinks.pop(url, None)
+                return url
+        raise KeyError('pop from an empty frontier')
+
+    def discard(self, url: str):
+        """ Remove a URL, if it's queued. """
+
+        if self._entries.pop(url, None) is not None:
+            self._inlinks.pop(url, None)
+
+    def score(self, url: str) -> float:
+        """ The current score of a queued URL. """
+
+        return -self._entries[url][0]
+
+    def inlinks(self, url: str) -> int:
+        """ The number of times a queued URL has been added. """
+
+        return self._inlinks.get(url, 0)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        """ Iterate over the queued URLs (in no particular order). """
+
+        return iter(list(self._entries))
+
+    def __ior__(self, links):
+        for link in links:
+            self.add(link)
+        return self
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (Frontier, set, frozenset)):
+            return self._entries.keys() == set(other)
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Frontier(%r)' % set(self._entries)
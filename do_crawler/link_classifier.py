@@ -2,6 +2,7 @@ import bs4
 import re
 
 from bs4 import BeautifulSoup
+from do_crawler.canonical import UrlCanonicalizer
 from functools import lru_cache
 from urllib.parse import (
     urljoin,
@@ -9,13 +10,18 @@ from urllib.parse import (
 )
 
 
+HTTP_SCHEMES = {'http', 'https'}
+
+DEFAULT_CANONICALIZER = UrlCanonicalizer()
+
+
 # --- Link Classifier helper functions:
 
 
 def _url_has_http_scheme(url: str) -> bool:
-    """ Check if a given URL has the HTTP scheme. """
+    """ Check if a given URL has the HTTP or HTTPS scheme. """
 
-    return urlparse(url, 'http').scheme == 'http'
+    return urlparse(url, 'http').scheme in HTTP_SCHEMES
 
 
 def _unquote_link(url: str) -> str:
@@ -79,7 +85,7 @@ class LinkClassifier(object):
         ('link', 'href', {'icon', 'prefetch', 'stylesheet'})
     ]
 
-    def __init__(self, url: str, html_content: bytes):
+    def __init__(self, url: str, html_content: bytes, canonicalizer: UrlCanonicalizer = None):
         """
         The LinkClassifier constructor takes a string with the HTML content.
 
@@ -87,7 +93,10 @@ class LinkClassifier(object):
         :type url: str
         :param html_content: the content of the HTML document
         :type html_content: bytes
+        :param canonicalizer: the rules all links are rewritten with (the default rules, if None)
+        :type canonicalizer: UrlCanonicalizer
         """
+        self._canonicalize = canonicalizer or DEFAULT_CANONICALIZER
 
         try:
             self._bs_obj = BeautifulSoup(html_content, 'html.parser')
@@ -98,7 +107,7 @@ class LinkClassifier(object):
         if not self.base_url:
             self.base_url = url
 
-        self.base_url = _make_unique_root_url(self.base_url)
+        self.base_url = self._canonicalize(_make_unique_root_url(self.base_url))
 
     def _get_base_url(self) -> str:
         """
@@ -143,7 +152,7 @@ class LinkClassifier(object):
                 link = _unquote_link(link)
                 abs_link = absolutize_link(self.base_url, link)
                 unique_link = _make_unique_root_url(abs_link)
-                links.add(unique_link)
+                links.add(self._canonicalize(unique_link))
 
         # Make sure we don't consider the base URL that we started from.
         if self.base_url in links:
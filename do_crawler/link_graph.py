@@ -0,0 +1,302 @@
+import csv
+import sys
+
+from do_crawler.sitemap import SiteMap
+from do_crawler.sitemap_store import load_sitemap
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the link graph analytics.
+    np = None
+
+try:
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+except ImportError:
+    csr_matrix = None
+
+
+# --- Link graph helper functions:
+
+
+def _require_numpy():
+    """ Fail with a helpful message when the optional numpy dependency is missing. """
+
+    if np is None:
+        raise ImportError('The link graph analytics require numpy (pip install numpy).')
+
+
+def _gather(indptr, indices, nodes):
+    """ Return the concatenated CSR rows of the given nodes, without a Python-level loop. """
+
+    starts = indptr[nodes]
+    lengths = indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return indices[:0]
+
+    # For each output position: its row's start, plus its offset within the row.
+    row_offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return indices[row_offsets + np.arange(total)]
+
+
+def _strongly_connected_components(n: int, indptr, indices):
+    """
+    Label the strongly connected components of a CSR graph, with an iterative Tarjan's algorithm.
+    Used when scipy isn't available; linear in the size of the graph, but runs in Python.
+    """
+    indptr = indptr.tolist()
+    indices = indices.tolist()
+
+    labels = [-1] * n
+    index = [-1] * n
+    low = [0] * n
+    on_stack = [False] * n
+    stack = []
+    counter = 0
+    num_components = 0
+
+    for start in range(n):
+        if index[start] >= 0:
+            continue
+
+        work = [(start, indptr[start])]
+        index[start] = low[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack[start] = True
+
+        while work:
+            node, edge = work[-1]
+            if edge < indptr[node + 1]:
+                work[-1] = (node, edge + 1)
+                succ = indices[edge]
+                if index[succ] < 0:
+                    index[succ] = low[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack[succ] = True
+                    work.append((succ, indptr[succ]))
+                elif on_stack[succ]:
+                    low[node] = min(low[node], index[succ])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low[parent] = min(low[parent], low[node])
+
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    labels[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+
+    return num_components, np.array(labels, dtype=np.int64)
+
+
+# --- LinkGraph:
+
+
+class LinkGraph(object):
+    """
+    The link graph of a sitemap as a CSR (compressed sparse row) adjacency structure:
+
+        - Node i is a distinct page (aliases of duplicate pages are collapsed into one node).
+        - self.indices[self.indptr[i]:self.indptr[i + 1]] are the pages node i links to.
+
+    Links to URLs that aren't in the sitemap (e.g. failed or unvisited links), duplicate links
+    and self-links are dropped.
+    """
+
+    def __init__(self, urls: list, src, dst):
+        """
+        :param urls: the URL list of each node (the first URL names the node)
+        :type urls: list
+        :param src: an array of edge source nodes
+        :param dst: an array of edge target nodes
+        """
+        _require_numpy()
+
+        self.urls = urls
+        self.num_nodes = n = len(urls)
+
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+
+        # Drop self-links and duplicate edges, and sort the edges by source.
+        keep = src != dst
+        edges = np.unique(src[keep] * n + dst[keep])
+        self.src = edges // n
+        self.indices = edges % n
+        self.indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.src, minlength=n), out=self.indptr[1:])
+
+        self._node_of_url = None
+
+    @classmethod
+    def from_sitemap(cls, sitemap: SiteMap) -> 'LinkGraph':
+        """ Build the link graph of a sitemap. """
+
+        _require_numpy()
+
+        node_of_page = {}
+        for page in sitemap.pages.values():
+            node_of_page.setdefault(id(page), len(node_of_page))
+        node_of_url = {url: node_of_page[id(page)] for url, page in sitemap.pages.items()}
+
+        urls = [None] * len(node_of_page)
+        src = []
+        dst = []
+        for page in sitemap.pages.values():
+            node = node_of_page[id(page)]
+            if urls[node] is not None:
+                continue
+            urls[node] = list(page.urls)
+            targets = [node_of_url[link] for link in page.links if link in node_of_url]
+            src.extend([node] * len(targets))
+            dst.extend(targets)
+
+        graph = cls(urls, src, dst)
+        graph._node_of_url = node_of_url
+        return graph
+
+    def node(self, url: str) -> int:
+        """ Return the node of a URL (or of one of its aliases). """
+
+        if self._node_of_url is None:
+            self._node_of_url = {url: node for node, urls in enumerate(self.urls) for url in urls}
+        return self._node_of_url[url]
+
+    @property
+    def num_edges(self) -> int:
+        """ The number of distinct links between distinct pages. """
+
+        return len(self.indices)
+
+    def out_degree(self):
+        """ The number of distinct pages each page links to. """
+
+        return np.diff(self.indptr)
+
+    def in_degree(self):
+        """ The number of distinct pages linking to each page. """
+
+        return np.bincount(self.indices, minlength=self.num_nodes)
+
+    def pagerank(self, damping: float = 0.85, tol: float = 1e-10, max_iter: int = 100):
+        """
+        Compute PageRank by power iteration. The rank of dead-end pages is spread uniformly.
+
+        :return: an array of ranks that sums to 1
+        """
+        n = self.num_nodes
+        if not n:
+            return np.zeros(0)
+
+        out_degree = self.out_degree()
+        dead_ends = out_degree == 0
+        inv_out_degree = np.where(dead_ends, 0.0, 1.0 / np.maximum(out_degree, 1))
+
+        rank = np.full(n, 1.0 / n)
+        for _ in range(max_iter):
+            contrib = (rank * inv_out_degree)[self.src]
+            new_rank = np.bincount(self.indices, weights=contrib, minlength=n)
+            new_rank = damping * (new_rank + rank[dead_ends].sum() / n) + (1.0 - damping) / n
+
+            converged = np.abs(new_rank - rank).sum() < tol
+            rank = new_rank
+            if converged:
+                break
+
+        return rank
+
+    def depths(self, root: str = '/'):
+        """
+        Compute the link depth of each page from the root page, with a level-synchronous BFS.
+
+        :return: an array of depths, -1 for pages that can't be reached from the root
+        """
+        depth = np.full(self.num_nodes, -1, dtype=np.int64)
+        try:
+            frontier = np.array([self.node(root)], dtype=np.int64)
+        except KeyError:
+            return depth
+
+        level = 0
+        depth[frontier] = 0
+        while len(frontier):
+            level += 1
+            neighbours = _gather(self.indptr, self.indices, frontier)
+            frontier = np.unique(neighbours[depth[neighbours] < 0])
+            depth[frontier] = level
+
+        return depth
+
+    def strongly_connected_components(self):
+        """
+        Label each page with its strongly connected component.
+
+        :return: a (number of components, array of labels) tuple
+        """
+        if csr_matrix is not None:
+            matrix = csr_matrix(
+                (np.ones(self.num_edges, dtype=np.int8), self.indices, self.indptr),
+                shape=(self.num_nodes, self.num_nodes)
+            )
+            return connected_components(matrix, directed=True, connection='strong')
+
+        return _strongly_connected_components(self.num_nodes, self.indptr, self.indices)
+
+    def page_metrics(self, root: str = '/'):
+        """
+        Compute all metrics, and yield them per page (in node order) as dictionaries.
+
+        Orphans are pages that no other page links to; dead ends are pages that link to no other page.
+        """
+        ranks = self.pagerank()
+        in_degree = self.in_degree()
+        out_degree = self.out_degree()
+        depths = self.depths(root)
+        _, components = self.strongly_connected_components()
+        component_sizes = np.bincount(components, minlength=1)
+
+        for node, urls in enumerate(self.urls):
+            yield {
+                'url': urls[0],
+                'aliases': len(urls) - 1,
+                'pagerank': float(ranks[node]),
+                'in_degree': int(in_degree[node]),
+                'out_degree': int(out_degree[node]),
+                'depth': int(depths[node]),
+                'component': int(components[node]),
+                'component_size': int(component_sizes[components[node]]),
+                'orphan': bool(in_degree[node] == 0),
+                'dead_end': bool(out_degree[node] == 0),
+            }
+
+    def export_csv(self, file, root: str = '/'):
+        """ Write the per-page metrics to a file as CSV. """
+
+        writer = None
+        for row in self.page_metrics(root):
+            if writer is None:
+                writer = csv.DictWriter(file, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+
+# --- Main function:
+
+
+def main():
+    with load_sitemap(sys.argv[1]) as smf:
+        graph = LinkGraph.from_sitemap(smf.to_sitemap())
+    graph.export_csv(sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
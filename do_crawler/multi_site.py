@@ -0,0 +1,296 @@
+import logging
+import sys
+import threading
+import time
+
+from collections import deque
+from do_crawler import page_fetcher
+from do_crawler.bloom import ScalableBloomFilter
+from do_crawler.budget import CrawlBudget
+from do_crawler.crawler import Crawler
+from do_crawler.traps import TrapDetector
+from multiprocessing.dummy import Pool as ThreadPool
+
+
+logger = logging.getLogger(__name__)
+
+SCHEDULING_POLICIES = ('round-robin', 'deficit')
+
+
+# --- Site:
+
+
+class _Site(object):
+    """ The scheduling state of one site of a multi-site crawl. """
+
+    # Weight of the latest fetch in the moving average of the fetch time.
+    COST_SMOOTHING = 0.2
+
+    def __init__(self, crawler: Crawler):
+        self.crawler = crawler
+        self.in_flight = 0
+        self.charged = 0.0
+        self.cost = None
+        self.fetches = 0
+        self.busy_time = 0.0
+
+    def record_fetch(self, elapsed: float):
+        """ Account for a finished fetch, and update the moving average of the fetch time. """
+
+        self.fetches += 1
+        self.busy_time += elapsed
+        if self.cost is None:
+            self.cost = elapsed
+        else:
+            self.cost += self.COST_SMOOTHING * (elapsed - self.cost)
+
+
+# --- MultiSiteCrawler:
+
+
+class MultiSiteCrawler(object):
+    """
+    Crawls many sites in one process, on one shared worker pool and fetch session (so DNS, TLS session
+    and circuit breaker state is shared too). Each site keeps its own Crawler, with its own SiteMap,
+    frontier and budget; the multi-site crawler only decides which site's link a free worker fetches
+    next:
+
+        - 'round-robin': the sites take turns, so each gets the same number of fetches.
+        - 'deficit': the sites take equal shares of worker time. Each site is charged the time its
+          fetches take, and a free worker goes to the ready site with the smallest charge (the largest
+          deficit); so a slow site can't tie up the pool, and fast sites aren't held back by it.
+
+    A site is never given more than `per_site_limit` concurrent fetches, to be polite to its host.
+    """
+
+    MAX_NUM_THREADS = 32
+
+    # The crawler of each site (replaceable, e.g. to crawl simulated sites).
+    CRAWLER_CLASS = Crawler
+
+    def __init__(self, roots: list, max_workers: int = MAX_NUM_THREADS, per_site_limit: int = Crawler.MAX_NUM_THREADS,
+                 scheduling: str = 'deficit', session: page_fetcher.FetchSession = None,
+                 site_budget: dict = None, site_traps: dict = None, site_seen_filter: dict = None,
+                 **crawler_options):
+        """
+        :param roots: the domain root URLs of the sites
+        :type roots: list
+        :param max_workers: the size of the shared worker pool
+        :type max_workers: int
+        :param per_site_limit: the maximum number of concurrent fetches from one site
+        :type per_site_limit: int
+        :param scheduling: the scheduling policy, one of SCHEDULING_POLICIES
+        :type scheduling: str
+        :param session: the shared fetch session; a new one, if None
+        :type session: FetchSession
+        :param site_budget: CrawlBudget arguments, for each site's own budget
+        :type site_budget: dict
+        :param site_traps: TrapDetector arguments, for each site's own trap detector; no detection, if None
+        :type site_traps: dict
+        :param site_seen_filter: ScalableBloomFilter arguments, for each site's own seen-set; exact
+            deduplication, if None
+        :type site_seen_filter: dict
+        :param crawler_options: other Crawler arguments, applied to every site
+        """
+        if scheduling not in SCHEDULING_POLICIES:
+            raise ValueError('Unknown scheduling policy: ' + scheduling)
+
+        self.max_workers = max_workers
+        self.per_site_limit = per_site_limit
+        self.scheduling = scheduling
+        self.pool = ThreadPool(max_workers)
+        self.session = session or page_fetcher.FetchSession()
+
+        self.sites = [
+            _Site(self.CRAWLER_CLASS(root, session=self.session, pool=self.pool,
+                                     budget=CrawlBudget(**(site_budget or {})),
+                                     trap_detector=TrapDetector(**site_traps) if site_traps is not None else None,
+                                     seen_filter=(ScalableBloomFilter(**site_seen_filter)
+                                                  if site_seen_filter is not None else None),
+                                     **crawler_options))
+            for root in roots
+        ]
+        self._order = deque(self.sites)
+        self._in_flight = 0
+        self._stopping = False
+        self._lock = threading.Lock()
+        self._work_done = threading.Condition(self._lock)
+        self._elapsed = 0.0
+
+    @property
+    def crawlers(self) -> dict:
+        """ The crawler of each site, by root URL. """
+
+        return {site.crawler.root: site.crawler for site in self.sites}
+
+    def _is_ready(self, site: _Site) -> bool:
+        """ Check whether a site has a link to fetch now. Needs the site's crawler lock. """
+
+        crawler = site.crawler
+        return (site.in_flight < self.per_site_limit and bool(crawler.links_to_visit) and
+                not crawler.budget.exhausted() and not crawler._stopping and not crawler._circuit_pause())
+
+    def _dispatch(self, site: _Site) -> bool:
+        """ Send one of a site's links to the pool, if it has one ready. Needs self._lock. """
+
+        crawler = site.crawler
+        with crawler._lock:
+            if not self._is_ready(site):
+                return False
+            link = crawler._take_link()
+
+        # Charge the fetch at its expected cost now, and correct the charge when it's done.
+        estimate = site.cost or 0.0
+        site.charged += estimate
+        site.in_flight += 1
+        self._in_flight += 1
+        self.pool.apply_async(self._visit_link_task, (site, link, estimate))
+        return True
+
+    def _visit_link_task(self, site: _Site, link: str, estimate: float):
+        """ Visit a site's link on a worker thread, and signal the dispatcher when done. """
+
+        start = time.monotonic()
+        try:
+            site.crawler._visit_link_task(link)
+        finally:
+            with self._lock:
+                elapsed = time.monotonic() - start
+                site.charged += elapsed - estimate
+                site.record_fetch(elapsed)
+                site.in_flight -= 1
+                self._in_flight -= 1
+                self._work_done.notify_all()
+
+    def _dispatch_round_robin(self) -> bool:
+        """ Give each site in turn one fetch, while there are free workers. Needs self._lock. """
+
+        dispatched = False
+        for _ in range(len(self._order)):
+            if self._in_flight >= self.max_workers:
+                break
+            site = self._order[0]
+            self._order.rotate(-1)
+            dispatched |= self._dispatch(site)
+        return dispatched
+
+    def _dispatch_deficit(self) -> bool:
+        """ Give a free worker to the ready site that was charged the least worker time. Needs self._lock. """
+
+        # A site that was idle (or paused) doesn't bank its share while it waits: it may lag the busy
+        # sites by at most one fetch per allowed connection.
+        busy = [site for site in self.sites if site.in_flight]
+        if busy:
+            floor = min(site.charged for site in busy) - self.per_site_limit * max(site.cost or 0.0 for site in busy)
+            for site in self.sites:
+                site.charged = max(site.charged, floor)
+
+        for site in sorted(self.sites, key=lambda site: site.charged):
+            if self._dispatch(site):
+                return True
+        return False
+
+    def _wait_time(self) -> float:
+        """
+        How long to wait for a worker when no site can be dispatched; None, for as long as it takes.
+        Needs self._lock (and takes each site's crawler lock in turn).
+        """
+        waits = []
+        for site in self.sites:
+            crawler = site.crawler
+            with crawler._lock:
+                if crawler.links_to_visit and not crawler.budget.exhausted():
+                    waits.append(crawler._circuit_pause() or None)
+                    waits.append(crawler.budget.time_left())
+                if crawler._seeding:
+                    # Seeders signal their crawler, not the scheduler: poll for new sitemap links.
+                    waits.append(crawler.SEED_FLUSH_INTERVAL)
+        waits = [wait for wait in waits if wait is not None]
+        return min(waits) if waits else None
+
+    def _has_work(self) -> bool:
+        """
+        Whether any site still has links to fetch, or fetches to wait for. Needs self._lock (and takes
+        each site's crawler lock in turn, as the crawlers' seeders and workers change their frontiers).
+        """
+        for site in self.sites:
+            crawler = site.crawler
+            with crawler._lock:
+                if site.in_flight and not crawler.budget.exhausted():
+                    return True
+                if ((crawler.links_to_visit or crawler._seeding) and not crawler.budget.exhausted() and
+                        not crawler._stopping):
+                    return True
+        return False
+
+    def crawl(self):
+        """ Crawl all the sites in parallel, until every site's frontier or budget runs out. """
+
+        start = time.monotonic()
+        for site in self.sites:
+            site.crawler._start()
+
+        dispatch = self._dispatch_deficit if self.scheduling == 'deficit' else self._dispatch_round_robin
+        with self._lock:
+            self._stopping = False
+            while not self._stopping and self._has_work():
+                if self._in_flight < self.max_workers and dispatch():
+                    continue
+                self._work_done.wait(self._wait_time())
+
+        for site in self.sites:
+            with site.crawler._lock:
+                site.crawler._drain()
+            site.crawler._log_exhausted_budget()
+
+        self._elapsed += time.monotonic() - start
+        logger.info('Crawled ' + str(sum(len(site.crawler.sitemap.pages) for site in self.sites)) +
+                    ' pages from ' + str(len(self.sites)) + ' sites')
+
+    def stop(self):
+        """ Ask a running crawl to stop dispatching links (from another thread). """
+
+        with self._lock:
+            self._stopping = True
+            for site in self.sites:
+                site.crawler._stopping = True
+            self._work_done.notify_all()
+
+    def close(self):
+        """ Terminate the shared worker pool. """
+
+        self.pool.terminate()
+        self.pool.join()
+
+    def summary(self) -> dict:
+        """ Return a summary of the crawl: per-site summaries and scheduling counters, and the totals. """
+
+        pages = sum(len(site.crawler.sitemap.pages) for site in self.sites)
+        return {
+            'sites': {
+                site.crawler.root: dict(site.crawler.summary(), fetches=site.fetches, busy_time=site.busy_time)
+                for site in self.sites
+            },
+            'pages': pages,
+            'fetches': sum(site.fetches for site in self.sites),
+            'pages_per_second': pages / self._elapsed if self._elapsed else None,
+            'fetch': self.session.stats(),
+        }
+
+
+# --- Main function:
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    c = MultiSiteCrawler(sys.argv[1:], site_budget={'max_pages': 50})
+    try:
+        c.crawl()
+    finally:
+        c.close()
+    for root, crawler in c.crawlers.items():
+        print(root, len(crawler.sitemap.pages))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,556 @@
+import io
 import logging
+import socket
+import ssl
+import threading
+import time
 
-from functools import lru_cache
-from http.client import HTTPResponse
-from urllib.error import URLError
+from do_crawler.canonical import DEFAULT_PORTS
+from do_crawler.dns_cache import DNSCache
+from do_crawler.retry import (
+    CircuitBreakers,
+    CircuitOpenError,
+    RetryPolicy,
+    is_retryable
+)
+from functools import (
+    lru_cache,
+    partial
+)
+from http.client import (
+    HTTPConnection,
+    HTTPException,
+    HTTPResponse,
+    HTTPSConnection
+)
+from urllib.error import (
+    HTTPError,
+    URLError
+)
+from urllib.parse import urlparse
 from urllib.request import (
+    HTTPHandler,
+    HTTPSHandler,
     Request,
-    urlopen
+    build_opener
 )
 
 
 logger = logging.getLogger(__name__)
 
+READ_CHUNK_SIZE = 64 * 1024
+
+
+# --- TLS helpers:
+
+
+def create_ssl_context(cafile: str = None) -> ssl.SSLContext:
+    """
+    Create the client SSLContext shared by all HTTPS connections of a session.
+
+    :param cafile: an optional PEM file of extra trusted certificates (e.g. a self-signed test CA)
+    :type cafile: str
+    """
+    context = ssl.create_default_context(cafile=cafile)
+    context.set_alpn_protocols(['http/1.1'])
+    return context
+
+
+class TLSSessionCache(object):
+    """
+    Keeps the most recent TLS session per (host, port), so that new connections to a host
+    can resume it with an abbreviated handshake instead of a full one.
+    With `resume` off, handshakes are still counted but sessions are never offered.
+    """
+
+    def __init__(self, resume: bool = True):
+        self.resume = resume
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+        self.handshakes = 0
+        self.resumed = 0
+
+    def get(self, host: str, port: int) -> ssl.SSLSession:
+        """ Return the session to offer when connecting to a host, if there is one. """
+
+        if not self.resume:
+            return None
+        with self._lock:
+            return self._sessions.get((host, port))
+
+    def record_handshake(self, sock: ssl.SSLSocket):
+        """ Count a completed handshake, and whether it resumed an earlier session. """
+
+        with self._lock:
+            self.handshakes += 1
+            if sock.session_reused:
+                self.resumed += 1
+
+    def store(self, host: str, port: int, sock: ssl.SSLSocket):
+        """
+        Remember the socket's session for later connections. With TLS 1.3 the session ticket only
+        arrives after the handshake, so this is called once the response headers have been read.
+        """
+        try:
+            session = sock.session
+        except (OSError, ValueError):
+            return
+
+        if self.resume and session is not None and (session.has_ticket or session.id):
+            with self._lock:
+                self._sessions[(host, port)] = session
+
+    def stats(self) -> dict:
+        """ Return the handshake counters. """
+
+        with self._lock:
+            return {'handshakes': self.handshakes, 'resumed': self.resumed}
+
+
+# --- Timeouts:
+
+
+class FetchTimeoutError(URLError):
+    """ Raised when a fetch runs past its total deadline, or transfers slower than the minimum rate. """
+
+    def __init__(self, reason: str):
+        super().__init__(socket.timeout(reason))
+
+
+def is_timeout(error: Exception) -> bool:
+    """ Check whether a fetch error was a timeout (connect, read, total, or a too slow transfer). """
+
+    if isinstance(error, URLError) and not isinstance(error, HTTPError):
+        error = error.reason
+    return isinstance(error, (TimeoutError, socket.timeout))
+
+
+class Timeouts(object):
+    """
+    The deadlines of a fetch, in seconds (None disables each):
+
+        - connect: to establish the connection, including the TLS handshake.
+        - read: for each read from the socket, once connected.
+        - total: for the whole fetch, from the first attempt until the body is read.
+        - min_rate: the minimum transfer rate of the body, in bytes/s; checked once `min_rate_grace`
+          seconds have passed since the body started, so short stalls are tolerated.
+
+    The total deadline and the minimum rate are checked between reads, so a fetch can overrun them
+    by up to one read timeout.
+    """
+
+    def __init__(self, connect: float = 10.0, read: float = 30.0, total: float = 120.0,
+                 min_rate: float = None, min_rate_grace: float = 5.0, clock=time.monotonic):
+        self.connect = connect
+        self.read = read
+        self.total = total
+        self.min_rate = min_rate
+        self.min_rate_grace = min_rate_grace
+        self.clock = clock
+
+    def past_deadline(self, started: float) -> bool:
+        """ Whether a fetch started at a given clock time has run past the total deadline. """
+
+        return self.total is not None and self.clock() - started > self.total
+
+    def time_left(self, started: float) -> float:
+        """ Seconds left before the total deadline of a fetch started at a given clock time (None, if no deadline). """
+
+        return None if self.total is None else max(0.0, started + self.total - self.clock())
+
+    def check_transfer(self, started: float, body_started: float, received: int):
+        """
+        Check a body transfer in progress against the total deadline and the minimum rate.
+
+        :param started: the clock time the fetch started
+        :param body_started: the clock time the body started
+        :param received: the number of body bytes received so far
+        :raises FetchTimeoutError: if either limit was broken
+        """
+        if self.past_deadline(started):
+            raise FetchTimeoutError('Total deadline of %ss exceeded' % self.total)
+
+        elapsed = self.clock() - body_started
+        if self.min_rate is not None and elapsed > self.min_rate_grace and received / elapsed < self.min_rate:
+            raise FetchTimeoutError('Transfer slower than %s bytes/s' % self.min_rate)
+
+
+# --- Connection classes:
+
+
+def _create_cached_connection(dns_cache: DNSCache, address: tuple, timeout=None,
+                              source_address: tuple = None) -> socket.socket:
+    """
+    A drop-in replacement for socket.create_connection() that takes its addresses from a DNSCache.
+    Each resolved address is tried in turn, as the original does.
+    """
+    host, port = address
+    error = None
+    for family, sock_type, proto, _, sock_addr in dns_cache.resolve(host, port):
+        sock = None
+        try:
+            sock = socket.socket(family, sock_type, proto)
+            if isinstance(timeout, (int, float)):
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sock_addr)
+            return sock
+        except OSError as e:
+            error = e
+            if sock is not None:
+                sock.close()
+
+    raise error or OSError('No addresses found for ' + host)
+
+
+class _CachingHTTPConnection(HTTPConnection):
+    """
+    An HTTP connection that resolves its host through a shared DNSCache. The connection's timeout
+    applies to connecting; once connected, the socket switches to `read_timeout`.
+    """
+
+    def __init__(self, *args, dns_cache: DNSCache, read_timeout: float = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dns_cache = dns_cache
+        self._read_timeout = read_timeout
+        # HTTPConnection.__init__ sets this instance attribute, which would shadow a method override.
+        self._create_connection = partial(_create_cached_connection, dns_cache)
+
+    def connect(self):
+        super().connect()
+        self.sock.settimeout(self._read_timeout)
+
+
+class _CachingHTTPSConnection(HTTPSConnection):
+    """
+    An HTTPS connection that resolves its host through a shared DNSCache and resumes
+    TLS sessions from a shared TLSSessionCache.
+    """
+
+    def __init__(self, *args, dns_cache: DNSCache, tls_sessions: TLSSessionCache, read_timeout: float = None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self._dns_cache = dns_cache
+        self._tls_sessions = tls_sessions
+        self._read_timeout = read_timeout
+        # HTTPConnection.__init__ sets this instance attribute, which would shadow a method override.
+        self._create_connection = partial(_create_cached_connection, dns_cache)
+
+    def _server_hostname(self) -> str:
+        """ The name the certificate is checked against (and the session cache is keyed by). """
+
+        return self._tunnel_host or self.host
+
+    def connect(self):
+        """ Connect to a host on a given (SSL) port, offering a cached session for resumption. """
+
+        HTTPConnection.connect(self)
+
+        server_hostname = self._server_hostname()
+        session = self._tls_sessions.get(server_hostname, self.port)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=server_hostname, session=session)
+        self._tls_sessions.record_handshake(self.sock)
+        self.sock.settimeout(self._read_timeout)
+
+    def getresponse(self):
+        # Grab the socket first: the connection drops it if the response will close it.
+        sock = self.sock
+        response = super().getresponse()
+        if sock:
+            self._tls_sessions.store(self._server_hostname(), self.port, sock)
+        return response
+
+
+class _CachingHTTPHandler(HTTPHandler):
+    """ A urllib handler that opens http:// URLs with _CachingHTTPConnection. """
+
+    def __init__(self, dns_cache: DNSCache, timeouts: Timeouts):
+        super().__init__()
+        self._dns_cache = dns_cache
+        self._timeouts = timeouts
+
+    def http_open(self, req):
+        return self.do_open(
+            _CachingHTTPConnection, req, dns_cache=self._dns_cache, read_timeout=self._timeouts.read
+        )
+
+
+class _CachingHTTPSHandler(HTTPSHandler):
+    """ A urllib handler that opens https:// URLs with _CachingHTTPSConnection. """
+
+    def __init__(self, dns_cache: DNSCache, context: ssl.SSLContext, tls_sessions: TLSSessionCache,
+                 timeouts: Timeouts):
+        super().__init__(context=context)
+        self._dns_cache = dns_cache
+        self._tls_sessions = tls_sessions
+        self._timeouts = timeouts
+
+    def https_open(self, req):
+        return self.do_open(
+            _CachingHTTPSConnection, req,
+            context=self._context, dns_cache=self._dns_cache, tls_sessions=self._tls_sessions,
+            read_timeout=self._timeouts.read
+        )
+
+
+# --- FetchSession:
+
+
+class FetchSession(object):
+    """
+    Connection state shared by all the fetches of a crawl:
+
+        - A DNS cache (self.dns_cache), so each host is resolved once per TTL.
+        - One SSLContext (self.ssl_context) for all HTTPS connections.
+        - A TLS session cache (self.tls_sessions), so new connections resume earlier sessions.
+        - A urllib opener that routes connections through all of the above.
+        - A retry policy (self.retry_policy) and per-host circuit breakers (self.breakers).
+        - The fetch deadlines (self.timeouts).
+        - Optionally, a recorder (self.recorder, e.g. a warc.WarcWriter) that fetched responses are
+          written to.
+    """
+
+    def __init__(self, dns_cache: DNSCache = None, ssl_context: ssl.SSLContext = None,
+                 tls_resumption: bool = True, retry_policy: RetryPolicy = None,
+                 breakers: CircuitBreakers = None, timeouts: Timeouts = None, recorder=None):
+        """
+        :param dns_cache: the resolver cache to use; a new one, if None
+        :type dns_cache: DNSCache
+        :param ssl_context: the client context for HTTPS connections; a default one, if None
+        :type ssl_context: ssl.SSLContext
+        :param tls_resumption: whether to resume TLS sessions across connections
+        :type tls_resumption: bool
+        :param retry_policy: when and how to retry failed requests; a default policy, if None
+        :type retry_policy: RetryPolicy
+        :param breakers: the per-host circuit breakers; default ones, if None
+        :type breakers: CircuitBreakers
+        :param timeouts: the fetch deadlines; the defaults, if None
+        :type timeouts: Timeouts
+        :param recorder: records responses as record(url, response, body, latency); nothing is recorded, if None
+        """
+        self.dns_cache = dns_cache or DNSCache()
+        self.ssl_context = ssl_context or create_ssl_context()
+        self.tls_sessions = TLSSessionCache(resume=tls_resumption)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.breakers = breakers or CircuitBreakers()
+        self.timeouts = timeouts or Timeouts()
+        self.recorder = recorder
+
+        self._opener = build_opener(
+            _CachingHTTPHandler(self.dns_cache, self.timeouts),
+            _CachingHTTPSHandler(self.dns_cache, self.ssl_context, self.tls_sessions, self.timeouts)
+        )
+
+    def open(self, req: Request, started: float = None):
+        """
+        Open a request through the session's opener, retrying retryable errors with backoff
+        (unless that would run past the total deadline).
+
+        :param started: the clock time the fetch started (see Timeouts.clock); now, if None
+        :raises CircuitOpenError: if the host's circuit breaker is open
+        :raises URLError: if the request failed (lower level errors are wrapped in a URLError)
+        """
+        if started is None:
+            started = self.timeouts.clock()
+
+        host = urlparse(req.full_url).hostname
+        attempt = 0
+        while True:
+            attempt += 1
+            if not self.breakers.allow(host):
+                raise CircuitOpenError(host)
+
+            try:
+                response = self._opener.open(req, timeout=self.timeouts.connect)
+            except (URLError, OSError, HTTPException) as e:
+                error = e if isinstance(e, URLError) else URLError(e)
+            except Exception:
+                # E.g. a URL that can't be encoded: not retryable, but it must not leave a probe half-open.
+                self.breakers.record_failure(host)
+                raise
+            else:
+                self.breakers.record_success(host)
+                return response
+
+            # An HTTP error status means the host is up, even if the request failed.
+            if isinstance(error, HTTPError) and not is_retryable(error):
+                self.breakers.record_success(host)
+            else:
+                self.breakers.record_failure(host)
+
+            if self.timeouts.past_deadline(started) or not self.retry_policy.should_retry(error, attempt):
+                raise error
+
+            logger.info('Retrying ' + req.full_url + ' after: ' + str(error.reason))
+            self.retry_policy.backoff(attempt, self.timeouts.time_left(started))
+
+    def read(self, response: HTTPResponse, started: float = None) -> bytes:
+        """
+        Read a response body, enforcing the total deadline and the minimum transfer rate between reads.
+        Reads return as soon as any data arrives, so a trickling server can't hold up the checks.
+
+        :param started: the clock time the fetch started; now, if None
+        :raises FetchTimeoutError: if the transfer ran out of time or was too slow
+        """
+        body_started = self.timeouts.clock()
+        if started is None:
+            started = body_started
+
+        chunks = []
+        received = 0
+        while True:
+            chunk = response.read1(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            received += len(chunk)
+            self.timeouts.check_transfer(started, body_started, received)
+
+        return chunks[0] if len(chunks) == 1 else b''.join(chunks)
+
+    def record(self, url: str, response, body: bytes, started: float):
+        """
+        Pass a fetched response to the recorder, if there is one.
+
+        :param body: the response body; None, if it wasn't read
+        :param started: the clock time the fetch started
+        """
+        if self.recorder is not None:
+            self.recorder.record(url, response, body, self.timeouts.clock() - started)
+
+    def prefetch(self, urls):
+        """ Warm the DNS cache for the hosts of the given absolute URLs, in the background. """
+
+        by_port = {}
+        for url in urls:
+            parts = urlparse(url)
+            if parts.hostname and parts.scheme in DEFAULT_PORTS:
+                port = parts.port or DEFAULT_PORTS[parts.scheme]
+                by_port.setdefault(port, set()).add(parts.hostname)
+
+        for port, hosts in by_port.items():
+            self.dns_cache.prefetch(hosts, port)
+
+    def stats(self) -> dict:
+        """ Return the session's fetch-layer statistics. """
+
+        return {
+            'dns': self.dns_cache.stats(),
+            'tls': self.tls_sessions.stats(),
+            'retries': self.retry_policy.stats(),
+            'circuit_breakers': self.breakers.stats(),
+        }
+
+    def close(self):
+        """ Release any background resources held by the session. """
+
+        self.dns_cache.close()
+        if self.recorder is not None:
+            self.recorder.close()
+
+
+_default_session = None
+
+
+def default_session() -> FetchSession:
+    """ Return the process-wide session used by fetches that don't specify their own. """
+
+    global _default_session
+    if _default_session is None:
+        _default_session = FetchSession()
+    return _default_session
+
 
 # --- Page fetcher helper functions:
 
 
-def _get_page(url: str) -> HTTPResponse:
+def _open_page(url: str, session: FetchSession, started: float = None) -> HTTPResponse:
+    """
+    Follow a URL and return the HTTP response, if it is one.
+
+    :raises URLError: if the fetch failed
+    :raises ValueError: if the URL is malformed
+    """
+    req = Request(url, headers={'User-Agent': 'do_crawler'})
+    html_content = session.open(req, started)
+
+    if not isinstance(html_content, HTTPResponse):
+        return None
+
+    return html_content
+
+
+def _log_fetch_error(error: Exception):
+    """ Log why a fetch failed. """
+
+    if isinstance(error, URLError):
+        logger.warn(error.reason)
+    else:
+        logger.warn("Bad URL: " + str(error))
+
+
+def _get_page(url: str, session: FetchSession = None) -> HTTPResponse:
     """
     Follow a URL and return an HTTP response if the content is a valid HTML page.
 
     :param url: a valid URL to a page
+    :param session: the session whose connections to use (the default session, if None)
     :return: a response object
     :rtype: HTTPResponse
     """
     try:
-        req = Request(url, headers={'User-Agent': 'do_crawler'})
-        html_content = urlopen(req)
-    except URLError as e:
-        logger.warn(e.reason)
+        return _open_page(url, session or default_session())
+    except (URLError, ValueError) as e:
+        _log_fetch_error(e)
         return None
-    except ValueError as e:
-        logger.warn("Bad URL: " + str(e))
+
+
+def _record_error(session: FetchSession, url: str, error: HTTPError, started: float):
+    """ Record an HTTP error response, with its body (if it can be read). """
+
+    try:
+        body = error.read()
+    except (OSError, HTTPException, AttributeError):
+        body = None
+    session.record(url, error, body, started)
+
+
+def fetch_document(url: str, session: FetchSession = None):
+    """
+    Fetch a document other than a page (robots.txt, a sitemap), as a binary stream.
+
+    When the session has a recorder, the body is read in full and recorded, like a page's (and so
+    are HTTP errors), so a crawl replayed from the recording sees the same documents. Otherwise,
+    the response is returned for streaming.
+
+    :param url: the URL of the document
+    :param session: the session whose connections to use (the default session, if None)
+    :return: a binary file-like object; None, if the fetch failed
+    """
+    session = session or default_session()
+    started = session.timeouts.clock()
+    try:
+        response = _open_page(url, session, started)
+    except (URLError, ValueError) as e:
+        _log_fetch_error(e)
+        if isinstance(e, HTTPError):
+            _record_error(session, url, e, started)
         return None
 
-    if not isinstance(html_content, HTTPResponse):
+    if response is None or session.recorder is None:
+        return response
+
+    try:
+        with response:
+            body = session.read(response, started)
+    except (OSError, HTTPException) as e:
+        _log_fetch_error(e if isinstance(e, URLError) else URLError(e))
         return None
 
-    return html_content
+    session.record(url, response, body, started)
+    return io.BytesIO(body)
 
 
 # --- PageFetcher:
@@ -45,16 +559,34 @@ def _get_page(url: str) -> HTTPResponse:
 class PageFetcher(object):
     """
     A basic class that provides HTML resource download.
+    If the fetch fails, self.error holds the reason (see timed_out()).
     """
 
-    def __init__(self, url: str):
+    def __init__(self, url: str, session: FetchSession = None):
         self.url = url
-        self._response = _get_page(self.url)
+        self.error = None
+        self._session = session or default_session()
+        self._started = self._session.timeouts.clock()
+
+        try:
+            self._response = _open_page(self.url, self._session, self._started)
+        except (URLError, ValueError) as e:
+            _log_fetch_error(e)
+            self.error = e
+            self._response = None
+            if isinstance(e, HTTPError):
+                self._record_error(e)
+
         if self._response:
             self.response_url = self._response.geturl()
         else:
             self.response_url = None
 
+    def _record_error(self, error: HTTPError):
+        """ Record an HTTP error response, with its body (if it can be read). """
+
+        _record_error(self._session, self.url, error, self._started)
+
     def is_html(self) -> bool:
         """ Return whether the content type is HTML. """
 
@@ -73,16 +605,33 @@ class PageFetcher(object):
 
         return bool(self._response)
 
+    def timed_out(self) -> bool:
+        """ Return whether the fetch failed because it ran out of time. """
+
+        return self.error is not None and is_timeout(self.error)
+
     @property
     @lru_cache(maxsize=1)
     def content(self) -> bytes:
         """
         The page HTML content that can be parsed later.
-        :return: the content; None, if
+        :return: the content; None, if the page isn't valid HTML, or reading it failed
         """
         if self.is_valid() and self.is_html():
-            return str(self._response.read())
+            try:
+                body = self._session.read(self._response, self._started)
+            except (OSError, HTTPException) as e:
+                self.error = e if isinstance(e, URLError) else URLError(e)
+                _log_fetch_error(self.error)
+                return None
+            finally:
+                self._response.close()
+
+            self._session.record(self.url, self._response, body, self._started)
+            return str(body)
         else:
+            if self.is_valid():
+                self._session.record(self.url, self._response, None, self._started)
             return None
 
 
@@ -0,0 +1,260 @@
+import http.client
+import random
+import socket
+import ssl
+import threading
+import time
+
+from urllib.error import (
+    HTTPError,
+    URLError
+)
+
+
+RETRYABLE_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+# --- Error classification:
+
+
+class CircuitOpenError(URLError):
+    """ Raised instead of sending a request to a host whose circuit breaker is open. """
+
+    def __init__(self, host: str):
+        super().__init__('Circuit open for ' + str(host))
+        self.host = host
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Check whether a failed request may succeed if retried: server errors, throttling, timeouts and
+    dropped connections are retryable; client errors, DNS failures and bad certificates aren't.
+    """
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, HTTPError):
+        return error.code in RETRYABLE_HTTP_STATUSES
+    if isinstance(error, URLError):
+        error = error.reason
+
+    if isinstance(error, (socket.gaierror, ssl.SSLCertVerificationError)):
+        return False
+    return isinstance(error, (TimeoutError, socket.timeout, ConnectionError, http.client.IncompleteRead,
+                              http.client.BadStatusLine, ssl.SSLError))
+
+
+# --- RetryPolicy:
+
+
+class RetryPolicy(object):
+    """
+    Retries retryable errors with "full jitter" exponential backoff: the n-th retry waits a random
+    time between 0 and min(max_delay, base_delay * 2 ** n). Retries across the whole crawl are limited
+    by `budget`, so a failing site can't multiply the crawl's request count.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 30.0,
+                 budget: int = 1000, rng=random.random, sleep=time.sleep):
+        """
+        :param max_attempts: the maximum number of attempts per request (1 disables retries)
+        :param base_delay: the backoff scale, in seconds
+        :param max_delay: the maximum backoff, in seconds
+        :param budget: the maximum number of retries for the lifetime of the policy (None for no limit)
+        :param rng: a random number generator in [0, 1), replaceable in tests
+        :param sleep: the sleep function, replaceable in tests
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self._rng = rng
+        self._sleep = sleep
+
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.gave_up = 0
+
+    def delay(self, retry: int) -> float:
+        """ The (jittered) delay before a given retry, counting from 0. """
+
+        return self._rng() * min(self.max_delay, self.base_delay * 2 ** retry)
+
+    def should_retry(self, error: Exception, attempt: int) -> bool:
+        """
+        Decide whether to retry after a failed attempt (counting from 1), and take a retry from the
+        budget if so.
+        """
+        if not is_retryable(error):
+            return False
+
+        with self._lock:
+            if attempt >= self.max_attempts:
+                self.gave_up += 1
+                return False
+            if self.budget is not None and self.retries >= self.budget:
+                self.budget_exhausted += 1
+                return False
+            self.retries += 1
+            return True
+
+    def backoff(self, attempt: int, time_left: float = None):
+        """
+        Sleep before retrying after a given failed attempt (counting from 1).
+
+        :param time_left: the seconds left before the request's deadline, which the sleep doesn't run
+            past; no limit, if None
+        """
+        delay = self.delay(attempt - 1)
+        if time_left is not None:
+            delay = min(delay, max(0.0, time_left))
+        self._sleep(delay)
+
+    def stats(self) -> dict:
+        """ Return the retry counters. """
+
+        with self._lock:
+            return {
+                'retries': self.retries,
+                'gave_up': self.gave_up,
+                'budget_exhausted': self.budget_exhausted,
+            }
+
+
+# --- Circuit breakers:
+
+
+class CircuitBreaker(object):
+    """
+    A per-host circuit breaker:
+
+        - closed: requests go through; `failure_threshold` consecutive failures open the circuit.
+        - open: requests are rejected for `reset_timeout` seconds, after which a single probe
+          request is let through (half-open).
+        - half-open: the probe's success closes the circuit; its failure opens it again.
+
+    After `max_trips` consecutive openings without a success, the host is given up on, and
+    requests are rejected straight away.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_trips: int = 5,
+                 clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_trips = max_trips
+        self._clock = clock
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+
+    @property
+    def given_up(self) -> bool:
+        """ Whether the host has failed too many probes to be tried again. """
+
+        return self.trips >= self.max_trips
+
+    def allow(self) -> bool:
+        """ Check whether a request may be sent now (and if this makes it the half-open probe). """
+
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and not self.given_up and self.wait_time() == 0:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        """
+        Seconds until a request to the host can be sent: 0 if it can be sent now, or if the host
+        was given up on (so requests fail fast).
+        """
+        if self.state == self.CLOSED or self.given_up:
+            return 0.0
+        if self.state == self.HALF_OPEN:
+            return self.reset_timeout
+        return max(0.0, self.opened_at + self.reset_timeout - self._clock())
+
+    def record_success(self):
+        """ A request got a response from the host: close the circuit. """
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+
+    def record_failure(self):
+        """ A request to the host failed: open the circuit if there were too many failures in a row. """
+
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = self._clock()
+            self.trips += 1
+
+
+class CircuitBreakers(object):
+    """ The thread-safe set of circuit breakers of a crawl, one per host. """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, max_trips: int = 5,
+                 clock=time.monotonic):
+        self._settings = (failure_threshold, reset_timeout, max_trips, clock)
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _breaker(self, host: str) -> CircuitBreaker:
+        """ Get (or create) the breaker of a host. Needs self._lock. """
+
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(*self._settings)
+        return breaker
+
+    def allow(self, host: str) -> bool:
+        """ Check whether a request to a host may be sent now. """
+
+        with self._lock:
+            if self._breaker(host).allow():
+                return True
+            self.rejected += 1
+            return False
+
+    def wait_time(self, host: str) -> float:
+        """ Seconds until a request to a host can be sent (see CircuitBreaker.wait_time). """
+
+        with self._lock:
+            return self._breaker(host).wait_time()
+
+    def record_success(self, host: str):
+        """ Record a response from a host. """
+
+        with self._lock:
+            self._breaker(host).record_success()
+
+    def record_failure(self, host: str):
+        """ Record a failed request to a host. """
+
+        with self._lock:
+            breaker = self._breaker(host)
+            was_open = breaker.state == CircuitBreaker.OPEN
+            breaker.record_failure()
+            if breaker.state == CircuitBreaker.OPEN and not was_open:
+                self.opened += 1
+
+    def stats(self) -> dict:
+        """ Return the breaker counters and the hosts whose circuits aren't closed. """
+
+        with self._lock:
+            return {
+                'opened': self.opened,
+                'rejected': self.rejected,
+                'open_hosts': sorted(host for host, breaker in self._breakers.items()
+                                     if breaker.state != CircuitBreaker.CLOSED),
+            }
@@ -1,6 +1,7 @@
 import hashlib
 
-from urllib.parse import urlparse
+from array import array
+from urllib.parse import urlsplit
 
 
 # --- Site map helper funcs:
@@ -15,9 +16,10 @@ def compute_page_hash(content: bytes) -> str:
 
 
 def _get_relative_url(url: str) -> str:
-    """ Return the relative part of a URL. """
+    """ Return the relative part of a URL: its path, and its query if it has one. """
 
-    return urlparse(url)[2]
+    parts = urlsplit(url)
+    return parts.path + '?' + parts.query if parts.query else parts.path
 
 
 # --- Page:
@@ -55,12 +57,23 @@ class SiteMap(object):
 
         - A dictionary of page urls to page structs.
         - A dictionary of hash codes to page structs.
+        - A reverse link index from each linked-to url to the urls of the pages linking to it.
+          Urls are interned to integer ids, and each url's referrers are kept in a compact array.
+        - An intern table of static asset sets: pages with the same assets share one frozenset,
+          and the asset url strings themselves are shared across sets.
     """
 
     def __init__(self):
         self.pages = {}
         self._hashes = {}
 
+        self._url_ids = {}
+        self._urls = []
+        self._backlinks = {}
+
+        self._asset_sets = {}
+        self._asset_urls = {}
+
     def add_page(self, page: Page):
         """ Add a new page to the sitemap. """
 
@@ -73,16 +86,83 @@ class SiteMap(object):
 
         # Check if we have the same hash and make the url point to the original entry.
         if page.page_hash in self._hashes:
-            existing_page = self._hashes[page.page_hash]
-            self.pages[url] = existing_page
-
-            # Store the alternative URL in the page for future reference.
-            existing_page.urls.append(url)
+            self.add_alias(url, page.page_hash)
             return
 
         # This is a completely new page, add it.
+        page.static_assets = self._intern_assets(page.static_assets)
         self.pages[url] = page
         self._hashes[page.page_hash] = self.pages[url]
+        self._index_links(url, page.links)
+
+    def has_hash(self, page_hash: str) -> bool:
+        """ Check if the sitemap already contains a page with a given content hash. """
+
+        return page_hash in self._hashes
+
+    def add_alias(self, url: str, page_hash: str) -> Page:
+        """
+        Add a url as an alias of the page with a given content hash, without building a page for it.
+
+        :return: the page the url now points to
+        :raises KeyError: if there is no page with that hash
+        """
+        existing_page = self._hashes[page_hash]
+        url = _get_relative_url(url)
+        if self.has_page(url):
+            return self.pages[url]
+
+        self.pages[url] = existing_page
+
+        # Store the alternative URL in the page for future reference.
+        existing_page.urls.append(url)
+
+        # Same content, same links: the alias links to everything the existing page links to.
+        self._index_links(url, existing_page.links)
+        return existing_page
+
+    def _intern_assets(self, assets: set) -> frozenset:
+        """ Return the shared frozenset equal to a set of static assets. """
+
+        key = frozenset(assets)
+        shared = self._asset_sets.get(key)
+        if shared is None:
+            shared = frozenset(self._asset_urls.setdefault(asset, asset) for asset in assets)
+            self._asset_sets[shared] = shared
+        return shared
+
+    def asset_urls(self) -> set:
+        """ Return all the distinct static asset urls in the sitemap. """
+
+        return set(self._asset_urls)
+
+    def _url_id(self, url: str) -> int:
+        """ Intern a url to an integer id. """
+
+        url_id = self._url_ids.get(url)
+        if url_id is None:
+            url_id = self._url_ids[url] = len(self._urls)
+            self._urls.append(url)
+        return url_id
+
+    def _index_links(self, url: str, links: set):
+        """ Record a page url as a referrer of each of its forward links. """
+
+        referrer_id = self._url_id(url)
+        for link in links:
+            link_id = self._url_id(link)
+            referrers = self._backlinks.get(link_id)
+            if referrers is None:
+                referrers = self._backlinks[link_id] = array('I')
+            referrers.append(referrer_id)
+
+    def referrers(self, url: str) -> list:
+        """ Return the urls of all the pages (including aliases) that link to a given url. """
+
+        url_id = self._url_ids.get(url)
+        if url_id is None or url_id not in self._backlinks:
+            return []
+        return [self._urls[referrer_id] for referrer_id in self._backlinks[url_id]]
 
     def has_page(self, url: str) -> bool:
         """ Check if the sitemap already contains a page with a given URL. """
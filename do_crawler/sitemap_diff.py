@@ -0,0 +1,176 @@
+import json
+import logging
+import sys
+
+from collections import OrderedDict
+from do_crawler.exporters import open_output
+from do_crawler.sitemap import SiteMap
+from do_crawler.sitemap_store import (
+    SiteMapFile,
+    load_sitemap
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+CHANGE_TYPES = ('added', 'removed', 'changed')
+
+# The number of changed pages whose link and asset deltas are kept for their aliases.
+DELTA_CACHE_SIZE = 1024
+
+
+# --- Sitemap views:
+
+
+class _SiteMapView(object):
+    """ The url -> (hash, links, assets) view of an in-memory SiteMap. """
+
+    def __init__(self, sitemap: SiteMap):
+        self.pages = sitemap.pages
+
+    def url_hashes(self):
+        for url, page in self.pages.items():
+            yield url, page.page_hash
+
+    def page_hash(self, url: str) -> str:
+        page = self.pages.get(url)
+        return page.page_hash if page is not None else None
+
+    def url_has_hash(self, url: str, page_hash: str) -> bool:
+        page = self.pages.get(url)
+        return page is not None and page.page_hash == page_hash
+
+    def links(self, url: str) -> set:
+        return self.pages[url].links
+
+    def assets(self, url: str) -> set:
+        return self.pages[url].static_assets
+
+
+class _SiteMapFileView(object):
+    """
+    The url -> (hash, links, assets) view of a saved crawl state. Lookups go through the file's
+    on-disk hash tables, so a diff against it doesn't load the whole sitemap into memory; an
+    unchanged URL is matched through the hash index, without decoding its page.
+    """
+
+    def __init__(self, smf: SiteMapFile):
+        self.smf = smf
+
+    def url_hashes(self):
+        return self.smf.iter_url_hashes()
+
+    def page_hash(self, url: str) -> str:
+        return self.smf.page_hash(url) if url in self.smf else None
+
+    def url_has_hash(self, url: str, page_hash: str) -> bool:
+        return self.smf.url_has_hash(url, page_hash)
+
+    def links(self, url: str) -> set:
+        return set(self.smf.outlinks(url))
+
+    def assets(self, url: str) -> set:
+        return set(self.smf.assets(url))
+
+
+def _view(sitemap):
+    """ Wrap a SiteMap or a SiteMapFile in a common view. """
+
+    if isinstance(sitemap, SiteMapFile):
+        return _SiteMapFileView(sitemap)
+    return _SiteMapView(sitemap)
+
+
+# --- Diff functions:
+
+
+def diff_sitemaps(old, new):
+    """
+    Compare two crawls of a site, URL by URL, and yield one change record per added, removed or
+    changed URL: new URLs first (in the order of the new crawl), then removed ones.
+
+    Pages are compared by content hash first, through the hash index; only the pages whose hash
+    changed have their links and static assets compared, so unchanged pages cost one hash lookup
+    each. The deltas of the last DELTA_CACHE_SIZE changed pages are kept for their aliases, so memory
+    stays bounded however many pages changed.
+
+    :param old: the earlier crawl
+    :type old: SiteMap or SiteMapFile
+    :param new: the later crawl
+    :type new: SiteMap or SiteMapFile
+    :return: dicts with a 'change' of 'added', 'removed' or 'changed', and the 'url'
+    """
+    old, new = _view(old), _view(new)
+
+    deltas = OrderedDict()
+    for url, new_hash in new.url_hashes():
+        if old.url_has_hash(url, new_hash):
+            continue
+        old_hash = old.page_hash(url)
+        if old_hash is None:
+            yield {'change': 'added', 'url': url, 'hash': new_hash}
+            continue
+
+        key = (old_hash, new_hash)
+        if key in deltas:
+            deltas.move_to_end(key)
+        else:
+            old_links, new_links = old.links(url), new.links(url)
+            old_assets, new_assets = old.assets(url), new.assets(url)
+            deltas[key] = {
+                'links_added': sorted(new_links - old_links),
+                'links_removed': sorted(old_links - new_links),
+                'assets_added': sorted(new_assets - old_assets),
+                'assets_removed': sorted(old_assets - new_assets),
+            }
+            if len(deltas) > DELTA_CACHE_SIZE:
+                deltas.popitem(last=False)
+        change = {'change': 'changed', 'url': url, 'old_hash': old_hash, 'hash': new_hash}
+        change.update(deltas[key])
+        yield change
+
+    for url, old_hash in old.url_hashes():
+        if new.page_hash(url) is None:
+            yield {'change': 'removed', 'url': url, 'hash': old_hash}
+
+
+def write_change_feed(old, new, file) -> dict:
+    """
+    Stream the diff of two crawls to an open text file as NDJSON, one change record per line.
+
+    :return: the number of changes of each type
+    :rtype: dict
+    """
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    counts = dict.fromkeys(CHANGE_TYPES, 0)
+    for change in diff_sitemaps(old, new):
+        counts[change['change']] += 1
+        file.write(encode(change) + '\n')
+    return counts
+
+
+def diff_states(old_path: str, new_path: str, path: str = None, compress: bool = False) -> dict:
+    """
+    Diff two crawl states saved with save_sitemap() (crawl --save-state), writing the change feed to
+    a file; to stdout, if no path is given.
+
+    :return: the number of changes of each type
+    :rtype: dict
+    """
+    with load_sitemap(old_path) as old, load_sitemap(new_path) as new:
+        if path is None:
+            return write_change_feed(old, new, sys.stdout)
+        with open_output(path, compress) as f:
+            return write_change_feed(old, new, f)
+
+
+# --- Main function:
+
+
+def main():
+    print(diff_states(sys.argv[1], sys.argv[2]), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
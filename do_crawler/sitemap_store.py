@@ -0,0 +1,386 @@
+import mmap
+import os
+import struct
+import sys
+import zlib
+
+from array import array
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+
+
+MAGIC = b'DOSM'
+VERSION = 2
+
+# Magic, version, byte order, then the counts and the section offsets.
+_HEADER = struct.Struct('<4sHH7I11Q')
+_SECTIONS = (
+    'string_offsets', 'string_blob', 'page_hashes',
+    'url_ptr', 'url_ids', 'link_ptr', 'link_ids', 'asset_ptr', 'asset_ids',
+    'url_table', 'hash_table',
+)
+_BYTE_ORDERS = {'little': 1, 'big': 2}
+
+
+# --- Binary sitemap helper functions:
+
+
+def _string_hash(data: bytes) -> int:
+    """ A hash that is stable across processes (unlike hash()), for the on-disk hash tables. """
+
+    return zlib.crc32(data)
+
+
+def _table_size(count: int) -> int:
+    """ A power of two hash table size that keeps the load factor at or below 1/2. """
+
+    size = 8
+    while size < 2 * count:
+        size *= 2
+    return size
+
+
+def _build_table(entries, encoded: list) -> array:
+    """
+    Build an open-addressing hash table of (string id + 1, page id) slots, keyed by the strings.
+
+    :param entries: (string id, page id) pairs
+    :param encoded: the UTF-8 bytes of each string id
+    :return: the flat array of slots
+    """
+    entries = list(entries)
+    size = _table_size(len(entries))
+    table = array('I', bytes(8 * size))
+    for string_id, page_id in entries:
+        slot = _string_hash(encoded[string_id]) & (size - 1)
+        while table[2 * slot]:
+            slot = (slot + 1) & (size - 1)
+        table[2 * slot] = string_id + 1
+        table[2 * slot + 1] = page_id
+    return table
+
+
+def _pad(f, alignment: int = 8):
+    """ Pad the file to the next aligned offset, so arrays can be cast in place. """
+
+    f.write(b'\0' * (-f.tell() % alignment))
+
+
+class _StringTable(object):
+    """ Interns the strings of a sitemap into consecutive integer ids. """
+
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def id(self, string: str) -> int:
+        """ Return the id of a string, adding it to the table if it's new. """
+
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+
+# --- Saving:
+
+
+def save_sitemap(sitemap: SiteMap, path: str):
+    """
+    Write a sitemap in the binary format. The file is laid out as:
+
+        - A header with the counts and section offsets.
+        - A string table: an offsets array into a blob of UTF-8 strings (URLs, links, assets and hashes).
+        - One hash string id per page.
+        - Adjacency arrays in CSR form: per-page offsets into flat arrays of URL (alias), link and asset ids.
+        - An open-addressing hash table of (url string id + 1, page id) slots, for lookups by URL.
+        - A second one of (hash string id + 1, page id) slots, for lookups by content hash.
+
+    The file is written to a temporary name first, and then renamed into place.
+    """
+    strings = _StringTable()
+
+    # Aliases share a Page object, so deduplicate by identity while keeping the insertion order.
+    pages = list({id(page): page for page in sitemap.pages.values()}.values())
+
+    page_hashes = array('I', (strings.id(page.page_hash) for page in pages))
+    url_ptr, url_ids = array('I', [0]), array('I')
+    link_ptr, link_ids = array('I', [0]), array('I')
+    asset_ptr, asset_ids = array('I', [0]), array('I')
+
+    for page in pages:
+        url_ids.extend(strings.id(url) for url in page.urls)
+        url_ptr.append(len(url_ids))
+        link_ids.extend(strings.id(link) for link in sorted(page.links))
+        link_ptr.append(len(link_ids))
+        asset_ids.extend(strings.id(asset) for asset in sorted(page.static_assets))
+        asset_ptr.append(len(asset_ids))
+
+    encoded = [string.encode('utf-8') for string in strings.strings]
+    string_offsets = array('Q', [0])
+    for data in encoded:
+        string_offsets.append(string_offsets[-1] + len(data))
+
+    url_table = _build_table(
+        ((url_id, page_id)
+         for page_id in range(len(pages)) for url_id in url_ids[url_ptr[page_id]:url_ptr[page_id + 1]]),
+        encoded
+    )
+    hash_table = _build_table(((hash_id, page_id) for page_id, hash_id in enumerate(page_hashes)), encoded)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(bytes(_HEADER.size))
+        offsets = []
+        for section in (string_offsets, encoded, page_hashes, url_ptr, url_ids, link_ptr, link_ids,
+                        asset_ptr, asset_ids, url_table, hash_table):
+            _pad(f)
+            offsets.append(f.tell())
+            if isinstance(section, array):
+                section.tofile(f)
+            else:
+                f.writelines(section)
+
+        f.seek(0)
+        f.write(_HEADER.pack(
+            MAGIC, VERSION, _BYTE_ORDERS[sys.byteorder],
+            len(encoded), len(pages), len(url_ids), len(link_ids), len(asset_ids),
+            len(url_table) // 2, len(hash_table) // 2,
+            *offsets
+        ))
+
+    os.replace(tmp_path, path)
+
+
+# --- SiteMapFile:
+
+
+class SiteMapFile(object):
+    """
+    A read-only, memory-mapped view of a sitemap saved with save_sitemap().
+
+    Opening a file only maps it and reads the header, so it takes constant time regardless of the
+    sitemap's size; pages are decoded lazily as they are queried. URLs are the relative URLs used as
+    keys in SiteMap.pages.
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        self._views = []
+
+        header = _HEADER.unpack_from(self._buf)
+        magic, version, byte_order = header[:3]
+        if magic != MAGIC:
+            self.close()
+            raise ValueError('Not a binary sitemap file: ' + path)
+        if version != VERSION:
+            self.close()
+            raise ValueError('Unsupported binary sitemap version %d (expected %d): %s' % (version, VERSION, path))
+        if byte_order != _BYTE_ORDERS[sys.byteorder]:
+            self.close()
+            raise ValueError('Binary sitemap was written on a machine with a different byte order.')
+
+        (self._num_strings, self.num_pages, num_urls, num_links, num_assets,
+         self._table_size, self._hash_table_size) = header[3:10]
+        offsets = dict(zip(_SECTIONS, header[10:]))
+
+        self._string_offsets = self._array(offsets['string_offsets'], 'Q', self._num_strings + 1)
+        self._string_blob = offsets['string_blob']
+        self._page_hashes = self._array(offsets['page_hashes'], 'I', self.num_pages)
+        self._url_ptr = self._array(offsets['url_ptr'], 'I', self.num_pages + 1)
+        self._url_ids = self._array(offsets['url_ids'], 'I', num_urls)
+        self._link_ptr = self._array(offsets['link_ptr'], 'I', self.num_pages + 1)
+        self._link_ids = self._array(offsets['link_ids'], 'I', num_links)
+        self._asset_ptr = self._array(offsets['asset_ptr'], 'I', self.num_pages + 1)
+        self._asset_ids = self._array(offsets['asset_ids'], 'I', num_assets)
+        self._url_table = self._array(offsets['url_table'], 'I', 2 * self._table_size)
+        self._hash_table = self._array(offsets['hash_table'], 'I', 2 * self._hash_table_size)
+
+    def _array(self, offset: int, type_code: str, count: int) -> memoryview:
+        """ A zero-copy typed view of a section of the mapped file. """
+
+        size = struct.calcsize(type_code)
+        view = self._buf[offset:offset + count * size].cast(type_code)
+        self._views.append(view)
+        return view
+
+    def _string_bytes(self, string_id: int) -> memoryview:
+        """ The raw UTF-8 bytes of a string, without copying them. """
+
+        start = self._string_blob + self._string_offsets[string_id]
+        end = self._string_blob + self._string_offsets[string_id + 1]
+        return self._buf[start:end]
+
+    def _string(self, string_id: int) -> str:
+        """ Decode a string from the string table. """
+
+        return str(self._string_bytes(string_id), 'utf-8')
+
+    def _strings(self, ptr: memoryview, ids: memoryview, page_id: int) -> list:
+        """ Decode a page's row of one of the CSR adjacency arrays. """
+
+        return [self._string(string_id) for string_id in ids[ptr[page_id]:ptr[page_id + 1]]]
+
+    def _lookup(self, table: memoryview, size: int, string: str) -> int:
+        """ Look up a string in one of the on-disk hash tables; return its page id, or None. """
+
+        data = string.encode('utf-8')
+        mask = size - 1
+        slot = _string_hash(data) & mask
+        while True:
+            entry = table[2 * slot]
+            if not entry:
+                return None
+            if self._string_bytes(entry - 1) == data:
+                return table[2 * slot + 1]
+            slot = (slot + 1) & mask
+
+    def page_id(self, url: str) -> int:
+        """
+        Look up the page a URL (or one of its aliases) belongs to.
+        :return: the page id; None, if the URL isn't in the sitemap
+        :rtype: int
+        """
+        return self._lookup(self._url_table, self._table_size, url)
+
+    def page_id_by_hash(self, page_hash: str) -> int:
+        """
+        Look up the page with a given content hash.
+        :return: the page id; None, if there's no page with that hash
+        :rtype: int
+        """
+        return self._lookup(self._hash_table, self._hash_table_size, page_hash)
+
+    def has_hash(self, page_hash: str) -> bool:
+        """ Check if the sitemap contains a page with a given content hash, as with SiteMap.has_hash(). """
+
+        return self.page_id_by_hash(page_hash) is not None
+
+    def url_has_hash(self, url: str, page_hash: str) -> bool:
+        """ Check if a URL is in the sitemap with a given content hash, without decoding its page. """
+
+        page_id = self.page_id_by_hash(page_hash)
+        return page_id is not None and self.page_id(url) == page_id
+
+    def _page_id_or_raise(self, url: str) -> int:
+        """ Look up the page a URL belongs to, raising KeyError if it isn't in the sitemap. """
+
+        page_id = self.page_id(url)
+        if page_id is None:
+            raise KeyError(url)
+        return page_id
+
+    def __contains__(self, url: str) -> bool:
+        return self.page_id(url) is not None
+
+    def __len__(self) -> int:
+        """ The number of URLs in the sitemap, as with len(SiteMap.pages). """
+
+        return len(self._url_ids)
+
+    def aliases(self, url: str) -> list:
+        """ All the URLs of the page a URL belongs to (the first one is the original). """
+
+        return self._strings(self._url_ptr, self._url_ids, self._page_id_or_raise(url))
+
+    def outlinks(self, url: str) -> list:
+        """ The forward links of the page at a URL. """
+
+        return self._strings(self._link_ptr, self._link_ids, self._page_id_or_raise(url))
+
+    def assets(self, url: str) -> list:
+        """ The static assets of the page at a URL. """
+
+        return self._strings(self._asset_ptr, self._asset_ids, self._page_id_or_raise(url))
+
+    def page_hash(self, url: str) -> str:
+        """ The content hash of the page at a URL. """
+
+        return self._string(self._page_hashes[self._page_id_or_raise(url)])
+
+    def page(self, url: str) -> Page:
+        """ Decode the page at a URL into a Page object. """
+
+        return self._page(self._page_id_or_raise(url))
+
+    def page_by_hash(self, page_hash: str) -> Page:
+        """ Decode the page with a given content hash into a Page object, raising KeyError if there is none. """
+
+        page_id = self.page_id_by_hash(page_hash)
+        if page_id is None:
+            raise KeyError(page_hash)
+        return self._page(page_id)
+
+    def _page(self, page_id: int) -> Page:
+        """ Decode a page by id. """
+
+        urls = self._strings(self._url_ptr, self._url_ids, page_id)
+        page = Page(urls[0], self._string(self._page_hashes[page_id]),
+                    set(self._strings(self._asset_ptr, self._asset_ids, page_id)),
+                    set(self._strings(self._link_ptr, self._link_ids, page_id)))
+        page.urls = urls
+        return page
+
+    def iter_pages(self):
+        """ Decode all distinct pages, in the order they were added to the original sitemap. """
+
+        for page_id in range(self.num_pages):
+            yield self._page(page_id)
+
+    def iter_url_hashes(self):
+        """ Iterate over (url, page hash) pairs for all URLs, without decoding links or assets. """
+
+        for page_id in range(self.num_pages):
+            page_hash = self._string(self._page_hashes[page_id])
+            for url in self._strings(self._url_ptr, self._url_ids, page_id):
+                yield url, page_hash
+
+    def to_sitemap(self) -> SiteMap:
+        """ Load the whole file back into a SiteMap. """
+
+        sm = SiteMap()
+        for page in self.iter_pages():
+            page.static_assets = sm._intern_assets(page.static_assets)
+            for url in page.urls:
+                sm.pages[url] = page
+                sm._index_links(url, page.links)
+            sm._hashes[page.page_hash] = page
+        return sm
+
+    def close(self):
+        """ Release the views and unmap the file. """
+
+        for view in self._views:
+            view.release()
+        self._buf.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_sitemap(path: str) -> SiteMapFile:
+    """ Open a binary sitemap file for querying. """
+
+    return SiteMapFile(path)
+
+
+# --- Main function:
+
+
+def main():
+    with load_sitemap(sys.argv[1]) as smf:
+        print(str(smf.num_pages) + ' pages, ' + str(len(smf)) + ' URLs')
+
+
+if __name__ == '__main__':
+    main()
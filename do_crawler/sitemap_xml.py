@@ -0,0 +1,188 @@
+import gzip
+import io
+import logging
+
+from do_crawler import page_fetcher
+from do_crawler.link_classifier import absolutize_link
+from xml.etree.ElementTree import (
+    ParseError,
+    iterparse
+)
+
+
+logger = logging.getLogger(__name__)
+
+WELL_KNOWN_SITEMAPS = ['/sitemap.xml', '/sitemap_index.xml']
+GZIP_MAGIC = b'\x1f\x8b'
+
+# The namespace of sitemaps.org elements; extensions (image, video, news, ...) have their own.
+SITEMAP_NAMESPACES = {'http://www.sitemaps.org/schemas/sitemap/0.9', ''}
+
+
+# --- SitemapEntry:
+
+
+class SitemapEntry(object):
+    """ A <url> (or <sitemap>) record from a sitemap.xml file: its location and optional metadata. """
+
+    __slots__ = ('loc', 'lastmod', 'priority')
+
+    def __init__(self, loc: str, lastmod: str = None, priority: float = None):
+        self.loc = loc
+        self.lastmod = lastmod
+        self.priority = priority
+
+    def __repr__(self):
+        return 'SitemapEntry(%r, lastmod=%r, priority=%r)' % (self.loc, self.lastmod, self.priority)
+
+
+# --- Sitemap parsing helper functions:
+
+
+def _split_tag(tag: str) -> tuple:
+    """ Split an XML tag name into its namespace (empty, if it has none) and its local name. """
+
+    if tag.startswith('{'):
+        namespace, _, name = tag[1:].partition('}')
+        return namespace, name
+    return '', tag
+
+
+def _decompressed(stream) -> io.BufferedIOBase:
+    """ Wrap a binary stream so that gzipped sitemaps are transparently decompressed. """
+
+    stream = io.BufferedReader(stream) if not hasattr(stream, 'peek') else stream
+    if stream.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=stream)
+    return stream
+
+
+def _parse_priority(text: str) -> float:
+    """ Parse a <priority> value; None, if it's missing or malformed. """
+
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_sitemap(stream):
+    """
+    Incrementally parse a sitemap or sitemap index, without loading the whole document.
+
+    Only the sitemaps.org <loc>, <lastmod> and <priority> elements directly inside a <url> or
+    <sitemap> record are read, so extension elements (such as the <image:loc> of an image sitemap)
+    don't override the page's own fields.
+
+    :param stream: a binary file-like object with the (possibly gzipped) XML document
+    :return: an iterator of (kind, SitemapEntry) pairs, where kind is 'url' or 'sitemap'
+    """
+    root = None
+    depth = 0
+    fields = {}
+    for event, elem in iterparse(_decompressed(stream), events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event == 'start':
+            depth += 1
+            continue
+
+        namespace, name = _split_tag(elem.tag)
+        if namespace in SITEMAP_NAMESPACES:
+            # The document element is at depth 1, records at depth 2, and their fields at depth 3.
+            if depth == 3 and name in ('loc', 'lastmod', 'priority'):
+                fields[name] = (elem.text or '').strip()
+            elif depth == 2 and name in ('url', 'sitemap'):
+                if fields.get('loc'):
+                    yield name, SitemapEntry(fields['loc'], fields.get('lastmod'),
+                                             _parse_priority(fields.get('priority')))
+        if depth == 2:
+            fields = {}
+
+            # Drop the finished records, so memory stays flat on huge sitemaps.
+            root.clear()
+        depth -= 1
+
+
+def parse_robots_sitemaps(robots_txt: str) -> list:
+    """ Extract the sitemap URLs listed with 'Sitemap:' directives in a robots.txt file. """
+
+    sitemaps = []
+    for line in robots_txt.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip().lower() == 'sitemap' and value.strip():
+            sitemaps.append(value.strip())
+    return sitemaps
+
+
+# --- Sitemap discovery:
+
+
+def _open(url: str, session: page_fetcher.FetchSession):
+    """ Open a URL for streaming (recording it, if the session records); None, if it can't be fetched. """
+
+    return page_fetcher.fetch_document(url, session)
+
+
+def discover_sitemaps(root: str, session: page_fetcher.FetchSession = None) -> list:
+    """
+    Find a site's sitemaps: those listed in its robots.txt, or else the well-known locations.
+
+    :param root: the domain root URL
+    :param session: the fetch session to use
+    :rtype: list
+    """
+    response = _open(absolutize_link(root, '/robots.txt'), session)
+    if response:
+        with response:
+            sitemaps = parse_robots_sitemaps(response.read().decode('utf-8', 'replace'))
+        if sitemaps:
+            return sitemaps
+
+    return [absolutize_link(root, path) for path in WELL_KNOWN_SITEMAPS]
+
+
+def iter_site_urls(root: str, session: page_fetcher.FetchSession = None, max_sitemaps: int = 1000):
+    """
+    Stream the page entries of all of a site's sitemaps, following sitemap indexes.
+
+    :param root: the domain root URL
+    :param session: the fetch session to use
+    :param max_sitemaps: the maximum number of sitemap files to fetch
+    :return: an iterator of SitemapEntry objects
+    """
+    to_fetch = discover_sitemaps(root, session)
+    fetched = set()
+
+    while to_fetch and len(fetched) < max_sitemaps:
+        url = to_fetch.pop()
+        if url in fetched:
+            continue
+        fetched.add(url)
+
+        response = _open(url, session)
+        if not response:
+            continue
+
+        logger.info('Reading sitemap ' + url)
+        with response:
+            try:
+                for kind, entry in iter_sitemap(response):
+                    if kind == 'sitemap':
+                        to_fetch.append(entry.loc)
+                    else:
+                        yield entry
+            except (ParseError, OSError, EOFError) as e:
+                logger.warning('Bad sitemap ' + url + ': ' + str(e))
+
+
+# --- Main function:
+
+
+def main():
+    for entry in iter_site_urls('https://www.digitalocean.com/'):
+        print(entry)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+import threading
+import unittest
+
+from do_crawler.asset_probe import (
+    AssetInfo,
+    AssetProber,
+    page_weights
+)
+from do_crawler.page_fetcher import FetchSession
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+
+
+class _AssetHandler(BaseHTTPRequestHandler):
+    """ Answer HEAD requests for /style.css and /logo.png, and count them. """
+
+    assets = {
+        '/style.css': ('text/css', 1000),
+        '/logo.png': ('image/png', 5000),
+    }
+    requests = []
+
+    def do_HEAD(self):
+        self.requests.append(self.path)
+        if self.path not in self.assets:
+            self.send_error(404)
+            return
+        content_type, size = self.assets[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class AssetProberTests(unittest.TestCase):
+
+    def setUp(self):
+        _AssetHandler.requests = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), _AssetHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = 'http://127.0.0.1:%d' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_probe_each_asset_once(self):
+        """ Test that each distinct asset is probed exactly once, with its status, size and type recorded. """
+
+        urls = [self.base + '/style.css', self.base + '/logo.png', self.base + '/missing.js']
+        prober = AssetProber(FetchSession(), max_workers=2)
+
+        results = prober.probe(urls + urls)
+        prober.probe(urls)
+
+        self.failUnlessEqual(sorted(_AssetHandler.requests), ['/logo.png', '/missing.js', '/style.css'])
+        css = results[self.base + '/style.css']
+        self.failUnlessEqual((css.status, css.size, css.content_type), (200, 1000, 'text/css'))
+        self.failUnlessEqual(results[self.base + '/missing.js'].status, 404)
+
+    def test_page_weights(self):
+        """ Test that page weights add up the known asset sizes and count the unknown ones. """
+
+        sm = SiteMap()
+        sm.add_page(Page('http://a/', 'hash1', {'http://a/s.css', 'http://a/l.png', 'http://a/x.js'}, set()))
+        sm.add_page(Page('http://a/index', 'hash1', set(), set()))
+        results = {
+            'http://a/s.css': AssetInfo(200, 1000, 'text/css'),
+            'http://a/l.png': AssetInfo(200, 5000, 'image/png'),
+            'http://a/x.js': AssetInfo(error='timed out'),
+        }
+
+        self.failUnlessEqual(list(page_weights(sm, results)), [('/', 3, 6000, 1)])
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
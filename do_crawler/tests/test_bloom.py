@@ -0,0 +1,84 @@
+import unittest
+
+from do_crawler.bloom import (
+    BloomFilter,
+    ScalableBloomFilter
+)
+
+
+class BloomFilterTests(unittest.TestCase):
+
+    def test_add_and_contains(self):
+        bloom = BloomFilter(1000, 0.01)
+
+        self.failIf(bloom.add('/a'))
+        self.failUnless(bloom.add('/a'))
+        self.failUnless('/a' in bloom)
+        self.failIf('/b' in bloom)
+        self.failUnlessEqual(len(bloom), 1)
+
+    def test_error_rate_at_capacity(self):
+        """ Test that the false positive rate at capacity is close to the target. """
+
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add('/page/' + str(i))
+
+        false_positives = sum(('/other/' + str(i)) in bloom for i in range(10000))
+        self.failUnless(false_positives < 200)
+        self.failUnless(0.005 < bloom.estimated_error_rate() < 0.02)
+        self.failUnlessEqual(bloom.nbytes, (bloom.num_bits + 7) // 8)
+
+    def test_bad_error_rate(self):
+        self.failUnlessRaises(ValueError, BloomFilter, 10, 1.5)
+
+
+class ScalableBloomFilterTests(unittest.TestCase):
+
+    def test_grows(self):
+        """ Test that filters are added as items arrive, keeping the overall error rate bounded. """
+
+        seen = ScalableBloomFilter(error_rate=0.01, initial_capacity=100)
+        duplicates = sum(seen.add('/page/' + str(i)) for i in range(5000))
+
+        self.failUnless(len(seen.filters) > 3)
+        self.failUnless(all(('/page/' + str(i)) in seen for i in range(5000)))
+        self.failUnless(seen.add('/page/42'))
+        self.failUnless(seen.estimated_error_rate() < 0.02)
+        self.failUnless(duplicates < 100)
+        self.failUnlessEqual(len(seen), 5000 - duplicates)
+
+    def test_memory_budget(self):
+        """ Test that the filter stops growing at its memory budget, and reports the rising error rate. """
+
+        seen = ScalableBloomFilter(error_rate=0.01, initial_capacity=100, max_bytes=1000)
+        for i in range(5000):
+            seen.add('/page/' + str(i))
+
+        stats = seen.stats()
+        self.failUnless(stats['saturated'])
+        self.failUnless(stats['bytes'] <= 1000)
+        self.failUnless(stats['estimated_error_rate'] > 0.01)
+
+    def test_memory_budget_below_first_filter(self):
+        """ Test that a budget smaller than the first filter shrinks it, instead of being exceeded. """
+
+        seen = ScalableBloomFilter(error_rate=0.01, initial_capacity=1 << 16, max_bytes=1000)
+        self.failUnless(seen.nbytes <= 1000)
+        self.failUnless(seen.saturated)
+
+        for i in range(2000):
+            seen.add('/page/' + str(i))
+        self.failUnless(seen.nbytes <= 1000)
+        self.failUnless(all(('/page/' + str(i)) in seen for i in range(2000)))
+
+    def test_bad_memory_budget(self):
+        self.failUnlessRaises(ValueError, ScalableBloomFilter, max_bytes=0)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import unittest
+
+from do_crawler.budget import CrawlBudget
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CrawlBudgetTests(unittest.TestCase):
+
+    def test_unbounded_budget(self):
+        """ Test that a budget with no limits is never exhausted. """
+
+        budget = CrawlBudget()
+        budget.start()
+        for _ in range(1000):
+            budget.charge_page()
+        budget.charge_bytes(10 ** 9)
+
+        self.failIf(budget.exhausted())
+        self.failUnless(budget.allows_depth(1000))
+        self.failUnlessEqual(budget.time_left(), None)
+
+    def test_page_and_byte_limits(self):
+        """ Test that the page and byte limits are reported once reached. """
+
+        budget = CrawlBudget(max_pages=2, max_bytes=100)
+        budget.charge_page()
+        budget.charge_bytes(60)
+        self.failIf(budget.exhausted())
+
+        budget.charge_bytes(60)
+        self.failUnlessEqual(budget.exhausted(), 'max_bytes')
+
+        budget = CrawlBudget(max_pages=2)
+        budget.charge_page()
+        budget.charge_page()
+        self.failUnlessEqual(budget.exhausted(), 'max_pages')
+
+    def test_depth_limit(self):
+        """ Test that links beyond the maximum depth are not allowed. """
+
+        budget = CrawlBudget(max_depth=2)
+        self.failUnless(budget.allows_depth(2))
+        self.failIf(budget.allows_depth(3))
+
+    def test_deadline(self):
+        """ Test that the deadline counts from the start of the crawl. """
+
+        clock = FakeClock()
+        budget = CrawlBudget(deadline=10, clock=clock)
+
+        clock.now = 100
+        budget.start()
+        self.failUnlessEqual(budget.time_left(), 10)
+
+        clock.now = 105
+        self.failIf(budget.exhausted())
+        clock.now = 110
+        self.failUnlessEqual(budget.exhausted(), 'deadline')
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
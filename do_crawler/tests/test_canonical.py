@@ -0,0 +1,69 @@
+import unittest
+
+from do_crawler.canonical import UrlCanonicalizer
+
+
+class UrlCanonicalizerTests(unittest.TestCase):
+
+    def test_default_rules(self):
+        """ Test the rules that always apply: case, default ports, fragments and empty paths. """
+
+        canonicalize = UrlCanonicalizer()
+
+        self.failUnlessEqual(canonicalize('HTTP://WWW.Example.COM'), 'http://www.example.com/')
+        self.failUnlessEqual(canonicalize('http://example.com:80/a/B'), 'http://example.com/a/B')
+        self.failUnlessEqual(canonicalize('https://example.com:443/'), 'https://example.com/')
+        self.failUnlessEqual(canonicalize('https://example.com:8443/'), 'https://example.com:8443/')
+        self.failUnlessEqual(canonicalize('http://example.com/a?b=1#top'), 'http://example.com/a?b=1')
+        self.failUnlessEqual(canonicalize('http://user@[::1]:80/'), 'http://user@[::1]/')
+
+    def test_other_urls_are_untouched(self):
+        """ Test that non-http URLs and malformed ports are left alone. """
+
+        canonicalize = UrlCanonicalizer(sort_query=True)
+
+        self.failUnlessEqual(canonicalize('mailto:Someone@Example.com'), 'mailto:Someone@Example.com')
+        self.failUnlessEqual(canonicalize('http://example.com:port/'), 'http://example.com:port/')
+
+    def test_query_rules(self):
+        """ Test the whitelist, drop patterns, tracking and session parameters, and sorting. """
+
+        canonicalize = UrlCanonicalizer(drop_params=['sort'], drop_tracking=True, drop_session_ids=True,
+                                        sort_query=True)
+        self.failUnlessEqual(
+            canonicalize('http://shop.com/list?page=2&utm_source=mail&sort=price&color=red&PHPSESSID=x&color=blue'),
+            'http://shop.com/list?color=red&color=blue&page=2'
+        )
+        self.failUnlessEqual(canonicalize('http://shop.com/list?utm_medium=x'), 'http://shop.com/list')
+        self.failUnlessEqual(canonicalize('http://shop.com/a;jsessionid=ABC?q=1'), 'http://shop.com/a?q=1')
+
+        canonicalize = UrlCanonicalizer(keep_params=['page'])
+        self.failUnlessEqual(canonicalize('http://shop.com/list?page=2&view=grid'), 'http://shop.com/list?page=2')
+
+    def test_query_is_not_reencoded(self):
+        """ Test that kept parameters are copied verbatim. """
+
+        canonicalize = UrlCanonicalizer(sort_query=True)
+        self.failUnlessEqual(canonicalize('http://a.com/?q=a+b%2F&a=%20'), 'http://a.com/?a=%20&q=a+b%2F')
+
+    def test_path_rules(self):
+        """ Test index page stripping and the trailing slash rules. """
+
+        canonicalize = UrlCanonicalizer(strip_index=True, trailing_slash='add')
+        self.failUnlessEqual(canonicalize('http://a.com/about/index.html'), 'http://a.com/about/')
+        self.failUnlessEqual(canonicalize('http://a.com/about'), 'http://a.com/about/')
+        self.failUnlessEqual(canonicalize('http://a.com/about/team.html'), 'http://a.com/about/team.html')
+
+        canonicalize = UrlCanonicalizer(strip_index=True, trailing_slash='strip')
+        self.failUnlessEqual(canonicalize('http://a.com/about/Index.HTML'), 'http://a.com/about')
+        self.failUnlessEqual(canonicalize('http://a.com/'), 'http://a.com/')
+
+        self.assertRaises(ValueError, UrlCanonicalizer, trailing_slash='sometimes')
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
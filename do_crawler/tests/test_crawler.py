@@ -1,9 +1,33 @@
+import asyncio
+import time
 import unittest
 
+from do_crawler.bloom import ScalableBloomFilter
+from do_crawler.budget import CrawlBudget
 from do_crawler.crawler import Crawler
+from do_crawler.link_classifier import LinkClassifier
+from do_crawler.sitemap_xml import SitemapEntry
+from do_crawler.traps import TrapDetector
 from unittest.mock import patch
 
 
+def chain_page(url: str) -> bytes:
+    """ Return a page that links to the next page in an endless /0, /1, /2, ... chain. """
+
+    path = url.rsplit('/', 1)[1]
+    next_link = '/' + str(int(path) + 1 if path else 0)
+    return bytes("<html><body><a href='" + next_link + "'></a></body></html>", 'utf-8')
+
+
+def wide_page(url: str) -> bytes:
+    """ Return a root page that links to 100 leaf pages (or one of those leaves). """
+
+    path = url.split('test.domain', 1)[1]
+    if path == '/':
+        return bytes(''.join("<a href='/w" + str(i) + "'></a>" for i in range(100)), 'utf-8')
+    return bytes('<p>' + path + '</p>', 'utf-8')
+
+
 class CrawlerPartialTests(unittest.TestCase):
 
     def test_crawler_keeps_root(self):
@@ -74,6 +98,72 @@ class CrawlerPartialTests(unittest.TestCase):
         # Check that no forward links are added for the same page.
         self.failUnless(len(c.links_to_visit) == 0)
 
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_failed_link_referrers(self, mock_get_page_content):
+        """ Test that failed links are reported with the pages that link to them. """
+
+        html = "<html><body><a href='/broken'><body></html>"
+
+        def get_page_content(url):
+            if url.endswith('/broken'):
+                c.failed_links.add(url)
+                return None
+            return bytes(html, 'utf-8')
+
+        mock_get_page_content.side_effect = get_page_content
+
+        c = Crawler('http://test.domain')
+        c.crawl()
+
+        self.failUnlessEqual(c.failed_link_referrers(), {'http://test.domain/broken': ['/']})
+
+    def test_dequeued_links_are_not_queued_again(self):
+        """ Test that a link taken from the frontier isn't queued again, even if its page was never added. """
+
+        c = Crawler('http://test.domain')
+        with c._lock:
+            c._queue_links({'/a', '/b'}, 1)
+            link = c._pop_link()
+            c._queue_links({'/a', '/b'}, 1)
+
+        self.failUnlessEqual(c.links_to_visit, {'/a', '/b'} - {link})
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_failed_links_are_not_queued_again(self, mock_get_page_content):
+        """ Test that a failed link is fetched once, however many pages link to it after it failed. """
+
+        pages = {
+            '/': "<a href='/a'></a><a href='/broken'></a>",
+            '/a': "<a href='/b'></a>",
+            '/b': "<a href='/broken'></a><a href='/c'></a>",
+            '/c': "<a href='/broken'></a>",
+        }
+        mock_get_page_content.side_effect = lambda url: (
+            bytes(pages[url[len('http://test.domain'):]], 'utf-8') if not url.endswith('/broken') else None
+        )
+
+        c = Crawler('http://test.domain')
+        c.crawl()
+
+        self.failUnlessEqual(set(c.sitemap.pages), {'/', '/a', '/b', '/c'})
+        self.failUnlessEqual(mock_get_page_content.call_count, 5)
+        self.failIf(c.links_to_visit)
+
+    @patch('do_crawler.page_fetcher.PageFetcher')
+    def test_timed_out_links(self, mock_page_fetcher):
+        """ Test that timed out fetches are recorded apart from other failures. """
+
+        mock_page_fetcher.return_value.is_valid.return_value = False
+        mock_page_fetcher.return_value.timed_out.side_effect = [True, False]
+
+        c = Crawler('http://test.domain')
+        c._visit_link('/slow')
+        c._visit_link('/broken')
+
+        self.failUnlessEqual(c.timed_out_links, {'http://test.domain/slow'})
+        self.failUnlessEqual(c.failed_links, {'http://test.domain/broken'})
+        self.failUnlessEqual(c.summary()['timed_out_links'], 1)
+
 
 class CrawlerFullTests(unittest.TestCase):
 
@@ -126,6 +216,389 @@ class CrawlerFullTests(unittest.TestCase):
         self.failUnless(self.crawler.sitemap.has_page('/next.link'))
 
 
+    @patch('do_crawler.sitemap_xml.iter_site_urls')
+    def test_seed_from_sitemaps(self, mock_iter_site_urls):
+        """ Test that same-domain sitemap URLs are added to the frontier along with their entries. """
+
+        mock_iter_site_urls.return_value = iter([
+            SitemapEntry('http://test.domain/a', '2016-01-02'),
+            SitemapEntry('http://test.domain/b'),
+            SitemapEntry('http://other.domain/c'),
+            SitemapEntry('HTTP://Test.Domain:80/d'),
+        ])
+
+        c = Crawler('http://Test.domain', seed_sitemaps=True)
+        c._start()
+        c._seeder.join()
+
+        self.failUnlessEqual(c.links_to_visit, {'/', '/a', '/b', '/d'})
+        self.failUnlessEqual(c.seed_entries['/a'].lastmod, '2016-01-02')
+
+    @patch('do_crawler.sitemap_xml.iter_site_urls')
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_seeding_overlaps_fetching(self, mock_get_page_content, mock_iter_site_urls):
+        """ Test that pages are fetched while a slow sitemap is still being read, and seeding honours the deadline. """
+
+        fetched_while_seeding = []
+
+        def slow_sitemap(root, session):
+            for i in range(1000):
+                time.sleep(0.01)
+                fetched_while_seeding.append(mock_get_page_content.call_count)
+                yield SitemapEntry('http://test.domain/s' + str(i))
+
+        mock_iter_site_urls.side_effect = slow_sitemap
+        mock_get_page_content.side_effect = lambda url: bytes('<p>' + url + '</p>', 'utf-8')
+
+        c = Crawler('http://test.domain', seed_sitemaps=True, budget=CrawlBudget(deadline=0.5))
+        start = time.monotonic()
+        c.parallel_crawl()
+        c._seeder.join(1)
+
+        self.failUnless(time.monotonic() - start < 1.0)
+        self.failIf(c._seeder.is_alive())
+        self.failUnless(len(fetched_while_seeding) < 1000)
+        # The root page, and the first batches of seeds, were fetched before the sitemap was finished.
+        self.failUnless(fetched_while_seeding[-1] > 1)
+        self.failUnless(len(c.sitemap.pages) > 1)
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_failed_seeder_ends_seeding(self, mock_get_page_content):
+        """ Test that a seeder that raises still ends seeding, so the crawl doesn't wait for it forever. """
+
+        mock_get_page_content.side_effect = lambda url: bytes('<p>' + url + '</p>', 'utf-8')
+
+        c = Crawler('http://test.domain', seed_sitemaps=True)
+        with patch.object(c, '_seed_from_sitemaps', side_effect=ValueError('bad seed')):
+            c.parallel_crawl()
+        c.close()
+
+        self.failIf(c._seeding)
+        self.failUnlessEqual(set(c.sitemap.pages), {'/'})
+
+
+class CrawlerBudgetTests(unittest.TestCase):
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_max_pages(self, mock_get_page_content):
+        """ Test that a crawl stops after the maximum number of pages and keeps the frontier. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_pages=3))
+        c.crawl()
+
+        self.failUnlessEqual(len(c.sitemap.pages), 3)
+        self.failUnlessEqual(c.links_to_visit, {'/2'})
+        self.failUnlessEqual(c.summary()['budget']['exhausted'], 'max_pages')
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_best_first_under_page_budget(self, mock_get_page_content):
+        """ Test that weighted links are visited before endless pagination when pages are limited. """
+
+        site = {
+            '/': ['/list?page=1', '/shop'],
+            '/shop': ['/products/1', '/products/2'],
+        }
+
+        def site_page(url):
+            path = url[len('http://test.domain'):]
+            if path.startswith('/list?page='):
+                links = ['/list?page=' + str(int(path.rsplit('=', 1)[1]) + 1)]
+            else:
+                links = site.get(path, [])
+            return bytes(path + ''.join("<a href='" + link + "'></a>" for link in links), 'utf-8')
+
+        mock_get_page_content.side_effect = site_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_pages=5),
+                    priorities={'depth': 1.0}, path_weights=[('/products/*', 5.0), ('/shop', 5.0)])
+        c.crawl()
+
+        self.failUnless({'/shop', '/products/1', '/products/2'} <= c.sitemap.pages.keys())
+        self.failUnlessEqual(c.links_to_visit, {'/list?page=2'})
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_max_depth(self, mock_get_page_content):
+        """ Test that links beyond the maximum depth are not followed. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_depth=2))
+        c.parallel_crawl()
+
+        self.failUnlessEqual(set(c.sitemap.pages), {'/', '/0', '/1'})
+        self.failIf(c.links_to_visit)
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_interrupted_crawl_keeps_its_frontier(self, mock_get_page_content):
+        """ Test that a crawl interrupted by Ctrl-C still returns its unvisited links in links_to_visit. """
+
+        mock_get_page_content.side_effect = wide_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(grace_period=0.1))
+        apply_async = c.pool.apply_async
+        dispatched = []
+
+        def interrupt_after_10(func, args):
+            dispatched.append(args[0])
+            if len(dispatched) > 10:
+                raise KeyboardInterrupt()
+            return apply_async(func, args)
+
+        c.pool.apply_async = interrupt_after_10
+        self.failUnlessRaises(KeyboardInterrupt, c.parallel_crawl)
+        c.close()
+
+        self.failUnless(c._closed)
+        self.failUnlessEqual(len(c.links_to_visit) + len(c.sitemap.pages), 101)
+        self.failUnless(dispatched[-1] in c.links_to_visit)
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_max_bytes(self, mock_get_page_content):
+        """ Test that a crawl stops once the downloaded content exceeds the byte budget. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_bytes=1))
+        c.parallel_crawl()
+
+        self.failUnlessEqual(len(c.sitemap.pages), 1)
+        self.failUnlessEqual(c.links_to_visit, {'/0'})
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_deadline_drains_in_flight_fetches(self, mock_get_page_content):
+        """
+        Test that after the deadline, fetches that don't finish within the grace period
+        are returned to the frontier and their late results are dropped.
+        """
+        def slow_page(url):
+            if not url.endswith('/'):
+                time.sleep(0.3)
+            return bytes("<html><body><a href='/slow1'><a href='/slow2'></body></html>", 'utf-8')
+
+        mock_get_page_content.side_effect = slow_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(deadline=0.1, grace_period=0.05))
+        start = time.monotonic()
+        c.parallel_crawl()
+
+        self.failUnless(time.monotonic() - start < 0.3)
+        self.failUnlessEqual(set(c.sitemap.pages), {'/'})
+        self.failUnlessEqual(c.links_to_visit, {'/slow1', '/slow2'})
+
+        # The slow fetches complete later, but must not change the drained sitemap.
+        time.sleep(0.4)
+        self.failUnlessEqual(set(c.sitemap.pages), {'/'})
+
+
+class CrawlerDuplicateTests(unittest.TestCase):
+
+    @patch('do_crawler.link_classifier.LinkClassifier')
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_duplicates_are_not_parsed(self, mock_get_page_content, mock_link_classifier):
+        """ Test that pages whose content is already in the sitemap are added as aliases without parsing. """
+
+        def classify(*args):
+            time.sleep(0.05)
+            return LinkClassifier(*args)
+
+        mock_link_classifier.side_effect = classify
+        mock_get_page_content.side_effect = lambda url: (
+            wide_page(url) if url.endswith('.domain/') else b"<a href='/'></a><p>the same page</p>"
+        )
+
+        c = Crawler('http://test.domain')
+        c.parallel_crawl()
+        c.close()
+
+        # All the leaves are fetched at once, but only one of them is parsed.
+        self.failUnlessEqual(len(c.sitemap.pages), 101)
+        self.failUnlessEqual(mock_link_classifier.call_count, 2)
+        self.failUnlessEqual(c.summary()['skipped_parses'], 99)
+
+        page = c.sitemap.pages['/w0']
+        self.failUnlessEqual(len(page.urls), 100)
+        self.failUnless(all(c.sitemap.pages['/w' + str(i)] is page for i in range(100)))
+
+
+class CrawlerSeenFilterTests(unittest.TestCase):
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_seen_filter(self, mock_get_page_content):
+        """ Test that a crawl deduplicated by a Bloom filter visits each page once, and reports the filter. """
+
+        mock_get_page_content.side_effect = lambda url: (
+            wide_page(url) if url.endswith('.domain/') else bytes("<a href='/'></a><a href='/w1'></a>" + url, 'utf-8')
+        )
+
+        c = Crawler('http://test.domain', seen_filter=ScalableBloomFilter(error_rate=0.0001))
+        c.parallel_crawl()
+        c.close()
+
+        self.failUnlessEqual(len(c.sitemap.pages), 101)
+        self.failUnlessEqual(mock_get_page_content.call_count, 101)
+        stats = c.summary()['seen_filter']
+        self.failUnlessEqual(stats['items'], 101)
+        self.failUnless(stats['bytes'] > 0)
+        self.failUnless(stats['estimated_error_rate'] < 0.0001)
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_depths_of_visited_links_are_dropped(self, mock_get_page_content):
+        """ Test that only the frontier's links keep a depth, so a seen-filter crawl's state stays small. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_pages=5),
+                    seen_filter=ScalableBloomFilter(error_rate=0.0001))
+        c.crawl()
+        self.failUnlessEqual(c._depths, {'/4': 5})
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_pages=5),
+                    seen_filter=ScalableBloomFilter(error_rate=0.0001))
+        c.parallel_crawl()
+        c.close()
+        self.failUnlessEqual(set(c._depths), set(c.links_to_visit))
+
+
+class CrawlerTrapTests(unittest.TestCase):
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_endless_pagination_is_capped(self, mock_get_page_content):
+        """ Test that an endless chain of numbered pages stops at the per-template cap. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', trap_detector=TrapDetector(max_per_template=5))
+        c.parallel_crawl()
+        c.close()
+
+        self.failUnlessEqual(set(c.sitemap.pages), {'/', '/0', '/1', '/2', '/3', '/4'})
+        self.failUnlessEqual(c.summary()['traps']['capped_templates'], {'/{n}': 1})
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_nested_relative_links_are_capped(self, mock_get_page_content):
+        """ Test that relative links that nest a path endlessly (/a/, /a/a/, ...) are capped. """
+
+        mock_get_page_content.side_effect = lambda url: bytes(
+            "<html><body><a href='a/'></a><p>" + url + "</p></body></html>", 'utf-8'
+        )
+
+        c = Crawler('http://test.domain', trap_detector=TrapDetector(max_per_template=3))
+        c.crawl()
+
+        self.failUnlessEqual(set(c.sitemap.pages), {'/', '/a/', '/a/a/', '/a/a/a/', '/a/a/a/a/'})
+        self.failIf(c.links_to_visit)
+
+    def test_inlinks_are_counted_with_trap_detection(self):
+        """ Test that rediscovering a queued link counts an in-link, but doesn't count it again as a trap. """
+
+        c = Crawler('http://test.domain', priorities={'inlinks': 1.0},
+                    trap_detector=TrapDetector(max_per_template=5))
+        with c._lock:
+            for _ in range(3):
+                c._queue_links({'/a'}, 1)
+
+        self.failUnlessEqual(c.links_to_visit.inlinks('/a'), 3)
+        self.failUnlessEqual(c.trap_detector.templates['/a'], 1)
+
+
+class CrawlerStreamTests(unittest.TestCase):
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_iter_pages(self, mock_get_page_content):
+        """ Test that every committed page is yielded once, with its metadata. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_depth=2))
+        crawled = list(c.iter_pages())
+
+        self.failUnlessEqual([record.page.urls[0] for record in crawled], ['/', '/0', '/1'])
+        self.failUnlessEqual([record.depth for record in crawled], [0, 1, 2])
+        self.failUnlessEqual(crawled[1].url, 'http://test.domain/0')
+        self.failUnless(crawled[1].size > 0 and crawled[1].fetch_time >= 0)
+        self.failIf(crawled[1].duplicate)
+
+    @patch('do_crawler.link_classifier.LinkClassifier')
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_fetch_time_excludes_parsing(self, mock_get_page_content, mock_link_classifier):
+        """ Test that a page's fetch time covers the fetch only, not the parse. """
+
+        def get_page_content(url):
+            time.sleep(0.05)
+            return chain_page(url)
+
+        def classify(url, content, canonicalizer):
+            time.sleep(0.5)
+            return LinkClassifier(url, content, canonicalizer)
+
+        mock_get_page_content.side_effect = get_page_content
+        mock_link_classifier.side_effect = classify
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(max_pages=1))
+        crawled = list(c.iter_pages())
+
+        self.failUnlessEqual(len(crawled), 1)
+        self.failUnless(0.05 <= crawled[0].fetch_time < 0.5)
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_iter_pages_backpressure(self, mock_get_page_content):
+        """ Test that a slow consumer holds the crawl back. """
+
+        mock_get_page_content.side_effect = wide_page
+
+        c = Crawler('http://test.domain')
+        pages = c.iter_pages(max_buffered=2)
+        next(pages)
+        time.sleep(0.3)
+
+        # The consumed page, the buffered ones, and one blocked page per worker.
+        self.failUnless(len(c.sitemap.pages) <= 1 + 2 + Crawler.MAX_NUM_THREADS)
+
+        self.failUnlessEqual(len(list(pages)), 100)
+        self.failUnlessEqual(len(c.sitemap.pages), 101)
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_iter_pages_cancellation(self, mock_get_page_content):
+        """ Test that closing the generator early stops the crawl and the worker pool. """
+
+        mock_get_page_content.side_effect = chain_page
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(grace_period=1))
+        for record in c.iter_pages(max_buffered=1):
+            if record.depth == 3:
+                break
+
+        crawled = len(c.sitemap.pages)
+        time.sleep(0.1)
+        self.failUnlessEqual(len(c.sitemap.pages), crawled)
+        self.failUnless(c.links_to_visit)
+        self.assertRaises(ValueError, c.pool.apply_async, len, ('',))
+
+    @patch('test_crawler.Crawler._get_page_content')
+    def test_aiter_pages(self, mock_get_page_content):
+        """ Test the async generator, including cancelling it from the consuming task. """
+
+        mock_get_page_content.side_effect = wide_page
+
+        async def consume(crawler, limit):
+            urls = []
+            async for record in crawler.aiter_pages(max_buffered=5):
+                urls.append(record.page.urls[0])
+                if len(urls) == limit:
+                    break
+            return urls
+
+        urls = asyncio.run(consume(Crawler('http://test.domain'), None))
+        self.failUnlessEqual(len(urls), 101)
+        self.failUnlessEqual(urls[0], '/')
+
+        c = Crawler('http://test.domain', budget=CrawlBudget(grace_period=1))
+        self.failUnlessEqual(len(asyncio.run(consume(c, 10))), 10)
+        self.failUnless(len(c.sitemap.pages) < 101)
+
+
 def main():
     unittest.main()
 
@@ -0,0 +1,121 @@
+import socket
+import threading
+import time
+import unittest
+
+from do_crawler.dns_cache import DNSCache
+
+
+class StubResolver(object):
+    """ A local resolver stand-in that maps host names to loopback addresses and counts calls. """
+
+    def __init__(self, hosts: dict, delay: float = 0.0):
+        self.hosts = hosts
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, host: str, port: int) -> list:
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if host not in self.hosts:
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (self.hosts[host], port))]
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DNSCacheTests(unittest.TestCase):
+
+    def test_cache_hit(self):
+        """ Test that a host is resolved once and then served from the cache. """
+
+        resolver = StubResolver({'stub.host': '127.0.0.1'})
+        cache = DNSCache(resolver)
+
+        first = cache.resolve('stub.host', 80)
+        second = cache.resolve('stub.host', 80)
+
+        self.failUnlessEqual(first, second)
+        self.failUnlessEqual(resolver.calls, 1)
+        self.failUnlessEqual(cache.stats()['hits'], 1)
+        self.failUnlessEqual(cache.stats()['misses'], 1)
+
+    def test_ttl_expiry(self):
+        """ Test that entries are resolved again once their TTL has passed. """
+
+        resolver = StubResolver({'stub.host': '127.0.0.1'})
+        clock = FakeClock()
+        cache = DNSCache(resolver, ttl=10, clock=clock)
+
+        cache.resolve('stub.host', 80)
+        clock.now = 5
+        cache.resolve('stub.host', 80)
+        self.failUnlessEqual(resolver.calls, 1)
+
+        clock.now = 11
+        cache.resolve('stub.host', 80)
+        self.failUnlessEqual(resolver.calls, 2)
+
+    def test_negative_caching(self):
+        """ Test that resolution failures are cached for the negative TTL. """
+
+        resolver = StubResolver({})
+        clock = FakeClock()
+        cache = DNSCache(resolver, negative_ttl=5, clock=clock)
+
+        for _ in range(3):
+            self.assertRaises(OSError, cache.resolve, 'missing.host', 80)
+        self.failUnlessEqual(resolver.calls, 1)
+        self.failUnlessEqual(cache.stats()['negative_hits'], 2)
+
+        clock.now = 6
+        self.assertRaises(OSError, cache.resolve, 'missing.host', 80)
+        self.failUnlessEqual(resolver.calls, 2)
+
+    def test_concurrent_lookups_resolve_once(self):
+        """ Test that concurrent lookups of the same host share a single in-flight resolution. """
+
+        resolver = StubResolver({'stub.host': '127.0.0.1'}, delay=0.05)
+        cache = DNSCache(resolver)
+
+        threads = [threading.Thread(target=cache.resolve, args=('stub.host', 80)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.failUnlessEqual(resolver.calls, 1)
+        self.failUnlessEqual(cache.stats()['resolutions'], 1)
+
+    def test_prefetch(self):
+        """ Test that prefetched hosts are resolved in the background and then served as hits. """
+
+        resolver = StubResolver({'a.host': '127.0.0.1', 'b.host': '127.0.0.2'})
+        cache = DNSCache(resolver)
+
+        cache.prefetch({'a.host', 'b.host'})
+        cache.close()
+
+        self.failUnless(cache.is_cached('a.host', 80))
+        self.failUnless(cache.is_cached('b.host', 80))
+
+        cache.resolve('a.host', 80)
+        self.failUnlessEqual(resolver.calls, 2)
+        self.failUnlessEqual(cache.stats()['hits'], 1)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from do_crawler.exporters import (
+    XMLSitemapExporter,
+    get_exporter
+)
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+from unittest.mock import patch
+
+
+class ExporterTests(unittest.TestCase):
+
+    def setUp(self):
+        """ A two page sitemap, plus an alias of the root page. """
+
+        self.sitemap = SiteMap()
+        self.sitemap.add_page(Page('http://base.url/', 'hash1', {'http://base.url/s.css'},
+                                   {'http://base.url/a&b', 'http://base.url/index'}))
+        self.sitemap.add_page(Page('http://base.url/a&b', 'hash2', set(), {'http://base.url/'}))
+        self.sitemap.add_page(Page('http://base.url/index', 'hash1', set(), set()))
+
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def _export(self, name: str, **kwargs) -> str:
+        f = io.StringIO()
+        get_exporter(name, base_url='http://base.url', **kwargs).write(self.sitemap, f)
+        return f.getvalue()
+
+    def test_json(self):
+        """ Test that the JSON export is one valid document with a record per distinct page. """
+
+        pages = json.loads(self._export('json'))['pages']
+
+        self.failUnlessEqual(len(pages), 2)
+        self.failUnlessEqual(pages[0]['urls'], ['/', '/index'])
+        self.failUnlessEqual(pages[0]['links'], ['/a&b', '/index'])
+        self.failUnlessEqual(pages[0]['static_assets'], ['http://base.url/s.css'])
+
+    def test_ndjson(self):
+        """ Test that the NDJSON export has one JSON record per line. """
+
+        lines = self._export('ndjson').splitlines()
+
+        self.failUnlessEqual([json.loads(line)['hash'] for line in lines], ['hash1', 'hash2'])
+
+    def test_dot(self):
+        """ Test that the DOT export has an edge per link, with aliases pointing to the original page. """
+
+        dot = self._export('dot')
+
+        self.failUnless(dot.startswith('digraph sitemap {'))
+        self.failUnless('"/" -> "/a&b";' in dot)
+        self.failUnless('"/" -> "/";' in dot)
+        self.failUnless('"/a&b" -> "/";' in dot)
+
+    def test_xml_sitemap(self):
+        """ Test that the XML export lists the absolute, escaped url of each distinct page. """
+
+        xml = self._export('xml')
+
+        self.failUnless('<loc>http://base.url/</loc>' in xml)
+        self.failUnless('<loc>http://base.url/a&amp;b</loc>' in xml)
+        self.failIf('/index' in xml)
+
+    @patch.object(XMLSitemapExporter, 'MAX_URLS_PER_FILE', 1)
+    def test_xml_sitemap_split_and_gzipped(self):
+        """ Test that large XML sitemaps are split into gzipped parts listed by a sitemap index. """
+
+        path = os.path.join(self.tmp_dir, 'sitemap.xml.gz')
+        get_exporter('xml', base_url='http://base.url', compress=True).export(self.sitemap, path)
+
+        with gzip.open(path, 'rt') as f:
+            index = f.read()
+        self.failUnless('<sitemapindex' in index)
+        self.failUnless('<loc>http://base.url/sitemap-2.xml.gz</loc>' in index)
+
+        with gzip.open(os.path.join(self.tmp_dir, 'sitemap-2.xml.gz'), 'rt') as f:
+            self.failUnless('<loc>http://base.url/a&amp;b</loc>' in f.read())
+        self.failIf(os.path.exists(os.path.join(self.tmp_dir, 'sitemap-3.xml.gz')))
+
+    @patch.object(XMLSitemapExporter, 'MAX_URLS_PER_FILE', 1)
+    def test_xml_sitemap_index_names_gzipped_parts(self):
+        """ Test that the index lists the gzipped parts by their file names, whatever the index is called. """
+
+        path = os.path.join(self.tmp_dir, 'sitemap.xml')
+        get_exporter('xml', base_url='http://base.url', compress=True).export(self.sitemap, path)
+
+        with gzip.open(path, 'rt') as f:
+            index = f.read()
+        self.failUnlessEqual(sorted(os.listdir(self.tmp_dir)), ['sitemap-1.xml.gz', 'sitemap-2.xml.gz', 'sitemap.xml'])
+        for name in ('sitemap-1.xml.gz', 'sitemap-2.xml.gz'):
+            self.failUnless('<loc>http://base.url/' + name + '</loc>' in index)
+
+    def test_unknown_format(self):
+        """ Test that asking for an unknown format fails. """
+
+        self.assertRaises(ValueError, get_exporter, 'yaml')
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import unittest
+
+from datetime import (
+    datetime,
+    timezone
+)
+from do_crawler.frontier import (
+    DepthScorer,
+    Frontier,
+    PathPatternScorer,
+    SitemapScorer,
+    build_scorer
+)
+from do_crawler.sitemap_xml import SitemapEntry
+
+
+class FrontierTests(unittest.TestCase):
+
+    def test_fifo_without_scorer(self):
+        """ Test that without a scorer links come out in the order they went in, once each. """
+
+        frontier = Frontier(links=['/a', '/b'])
+        frontier |= {'/c'}
+        frontier.add('/a')
+
+        self.failUnlessEqual(len(frontier), 3)
+        self.failUnlessEqual([frontier.pop() for _ in range(3)], ['/a', '/b', '/c'])
+        self.assertRaises(KeyError, frontier.pop)
+
+    def test_set_compatibility(self):
+        """ Test membership, iteration, equality and discard. """
+
+        frontier = Frontier(links=['/a', '/b', '/c'])
+        frontier.discard('/b')
+        frontier.discard('/missing')
+
+        self.failUnless('/a' in frontier)
+        self.failIf('/b' in frontier)
+        self.failUnlessEqual(frontier, {'/a', '/c'})
+        self.failUnlessEqual(sorted(frontier), ['/a', '/c'])
+        self.failUnlessEqual([frontier.pop(), frontier.pop()], ['/a', '/c'])
+        self.failIf(frontier)
+
+    def test_best_first_with_reprioritization(self):
+        """ Test that in-links raise a queued link's priority, and stale heap entries are skipped. """
+
+        frontier = Frontier(build_scorer({'inlinks': 1.0}))
+        frontier |= ['/a', '/b', '/c']
+        frontier.add('/c')
+        frontier.add('/c')
+        frontier.add('/b')
+
+        self.failUnlessEqual(frontier.inlinks('/c'), 3)
+        self.failUnlessEqual([frontier.pop() for _ in range(3)], ['/c', '/b', '/a'])
+        self.failIf(frontier)
+
+    def test_depth_scorer_and_update(self):
+        """ Test breadth-first order, and re-scoring after the depths change. """
+
+        depths = {'/deep': 3, '/shallow': 1}
+        frontier = Frontier(DepthScorer(depths), ['/deep', '/shallow'])
+        depths['/deep'] = 0
+        frontier.update('/deep')
+
+        self.failUnlessEqual(frontier.score('/deep'), 0)
+        self.failUnlessEqual(frontier.pop(), '/deep')
+
+    def test_heap_is_compacted(self):
+        """ Test that stale entries don't pile up in the heap. """
+
+        frontier = Frontier(build_scorer({'inlinks': 1.0}), ['/a'])
+        for _ in range(5000):
+            frontier.add('/a')
+
+        self.failUnless(len(frontier._heap) < 2100)
+        self.failUnlessEqual(frontier.pop(), '/a')
+        self.failIf(frontier)
+
+
+class ScorerTests(unittest.TestCase):
+
+    def test_sitemap_scorer(self):
+        """ Test sitemap priority, freshness halving, and pages missing from the sitemap. """
+
+        now = datetime(2020, 1, 31, tzinfo=timezone.utc)
+        entries = {
+            '/new': SitemapEntry('http://a.com/new', lastmod='2020-01-31', priority=0.2),
+            '/old': SitemapEntry('http://a.com/old', lastmod='2020-01-01T00:00:00Z'),
+            '/bad': SitemapEntry('http://a.com/bad', lastmod='yesterday', priority=1.0),
+        }
+        score = SitemapScorer(entries, now=now)
+
+        self.failUnlessAlmostEqual(score('/new', 0), 1.2)
+        self.failUnlessAlmostEqual(score('/old', 0), 1.0)
+        self.failUnlessAlmostEqual(score('/bad', 0), 1.0)
+        self.failUnlessEqual(score('/missing', 0), 0.0)
+
+    def test_path_pattern_scorer(self):
+        """ Test that the weights of all matching patterns add up. """
+
+        score = PathPatternScorer([('/products/*', 2.0), ('*page=*', -1.0)])
+
+        self.failUnlessEqual(score('/products/shoes', 0), 2.0)
+        self.failUnlessEqual(score('/products/list?page=7', 0), 1.0)
+        self.failUnlessEqual(score('/about', 0), 0)
+
+    def test_build_scorer(self):
+        """ Test combining weighted signals, and rejecting unknown ones. """
+
+        depths = {'/a': 2}
+        score = build_scorer({'depth': 0.5, 'inlinks': 0}, [('/a', 3.0)], depths=depths)
+
+        self.failUnlessEqual(score('/a', 10), 2.0)
+        self.assertRaises(ValueError, build_scorer, {'pagerank': 1.0})
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import unittest
 
+from do_crawler.canonical import UrlCanonicalizer
 from do_crawler.link_classifier import LinkClassifier
 
 
@@ -57,6 +58,8 @@ class LinkClassifierTests(unittest.TestCase):
 
         self.failIf(_url_has_http_scheme('data:img/jpeg;01234567890ABCDEF'))
         self.failUnless(_url_has_http_scheme('http://www.foo.com'))
+        self.failUnless(_url_has_http_scheme('https://www.foo.com'))
+        self.failIf(_url_has_http_scheme('ftp://www.foo.com'))
         self.failUnless(_url_has_http_scheme('//index.html'))
 
     def test_static_asset_types(self):
@@ -148,6 +151,23 @@ class LinkClassifierTests(unittest.TestCase):
 
         self.failIf(classifier._forward_links)
 
+    def test_links_are_canonicalized(self):
+        """ Test that different spellings of a link collapse into one canonical link. """
+
+        url = 'http://www.shop.com/'
+        html = (
+            "<html><body>"
+            "<a href='HTTP://WWW.SHOP.COM:80/list?page=2#reviews'/>"
+            "<a href='/list?utm_source=mail&page=2'/>"
+            "<a href='/list?page=3'/>"
+            "<body></html>"
+        )
+        classifier = LinkClassifier(url, bytes(html, 'utf-8'), UrlCanonicalizer(drop_tracking=True))
+
+        self.failUnlessEqual(
+            classifier.same_domain_links, {'http://www.shop.com/list?page=2', 'http://www.shop.com/list?page=3'}
+        )
+
     def test_is_same_domain_link(self):
         """ Make sure that the classifier can distinguish same domain links from external links. """
 
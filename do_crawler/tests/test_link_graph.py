@@ -0,0 +1,112 @@
+import io
+import unittest
+
+from do_crawler import link_graph
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def make_sitemap(pages: list) -> SiteMap:
+    """ Build a sitemap from (url, hash, links) tuples. """
+
+    sm = SiteMap()
+    for url, page_hash, links in pages:
+        sm.add_page(Page('http://base.url' + url, page_hash, set(), {'http://base.url' + link for link in links}))
+    return sm
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class LinkGraphTests(unittest.TestCase):
+
+    def setUp(self):
+        """
+        A small site: / <-> /a -> /b (a dead end), an orphan /o -> /a, and /dup, an alias of /a.
+        /a also links to /missing, which isn't in the sitemap.
+        """
+        self.sitemap = make_sitemap([
+            ('/', 'h0', ['/a', '/']),
+            ('/a', 'ha', ['/', '/b', '/missing']),
+            ('/b', 'hb', []),
+            ('/o', 'ho', ['/a', '/dup']),
+            ('/dup', 'ha', ['/', '/b']),
+        ])
+        self.graph = link_graph.LinkGraph.from_sitemap(self.sitemap)
+
+    def test_aliases_are_collapsed(self):
+        """ Test that duplicate-hash pages share a node and that unknown, duplicate and self links are dropped. """
+
+        self.failUnlessEqual(self.graph.num_nodes, 4)
+        self.failUnlessEqual(self.graph.node('/a'), self.graph.node('/dup'))
+        self.failUnlessEqual(self.graph.num_edges, 4)
+
+    def test_degrees(self):
+        """ Test in- and out-degrees. """
+
+        node = self.graph.node
+        in_degree = self.graph.in_degree()
+        out_degree = self.graph.out_degree()
+
+        self.failUnlessEqual(in_degree[node('/a')], 2)
+        self.failUnlessEqual(in_degree[node('/o')], 0)
+        self.failUnlessEqual(out_degree[node('/a')], 2)
+        self.failUnlessEqual(out_degree[node('/b')], 0)
+
+    def test_pagerank(self):
+        """ Test that PageRank sums to one and ranks the most linked-to pages highest. """
+
+        ranks = self.graph.pagerank()
+        node = self.graph.node
+
+        self.failUnlessAlmostEqual(ranks.sum(), 1.0)
+        self.failUnless(ranks[node('/a')] > ranks[node('/b')] > ranks[node('/o')])
+
+    def test_depths(self):
+        """ Test depths from the root page, with -1 for unreachable pages. """
+
+        depths = self.graph.depths('/')
+        node = self.graph.node
+
+        self.failUnlessEqual(
+            [depths[node(url)] for url in ('/', '/a', '/b', '/o')],
+            [0, 1, 2, -1]
+        )
+
+    def test_strongly_connected_components(self):
+        """ Test SCCs, both with scipy (when available) and with the fallback implementation. """
+
+        for num_components, labels in (
+            self.graph.strongly_connected_components(),
+            link_graph._strongly_connected_components(self.graph.num_nodes, self.graph.indptr, self.graph.indices),
+        ):
+            node = self.graph.node
+            self.failUnlessEqual(num_components, 3)
+            self.failUnlessEqual(labels[node('/')], labels[node('/a')])
+            self.failIfEqual(labels[node('/')], labels[node('/b')])
+
+    def test_export_csv(self):
+        """ Test the per-page export, including the orphan and dead-end flags. """
+
+        f = io.StringIO()
+        self.graph.export_csv(f)
+        lines = f.getvalue().splitlines()
+
+        self.failUnless(lines[0].startswith('url,aliases,pagerank'))
+        self.failUnlessEqual(len(lines), 5)
+        rows = {row['url']: row for row in self.graph.page_metrics()}
+        self.failUnless(rows['/o']['orphan'])
+        self.failUnless(rows['/b']['dead_end'])
+        self.failUnlessEqual(rows['/a']['aliases'], 1)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import time
+import unittest
+
+from do_crawler.crawler import Crawler
+from do_crawler.multi_site import MultiSiteCrawler
+from unittest.mock import patch
+
+
+def site_page(url: str) -> bytes:
+    """ Return a root page that links to 5 leaf pages of the same site (or one of those leaves). """
+
+    path = url.split('.test', 1)[1]
+    if path == '/':
+        return bytes(''.join("<a href='/p" + str(i) + "'></a>" for i in range(5)), 'utf-8')
+    return bytes('<p>' + url + '</p>', 'utf-8')
+
+
+def tree_page(url: str) -> bytes:
+    """ Return a page of an endless binary tree of pages: /n links to /2n+1 and /2n+2. """
+
+    n = int(url.split('.test/', 1)[1] or 0)
+    return bytes("<a href='/" + str(2 * n + 1) + "'></a><a href='/" + str(2 * n + 2) + "'></a>" + str(n), 'utf-8')
+
+
+class MultiSiteCrawlerTests(unittest.TestCase):
+
+    def tearDown(self):
+        if hasattr(self, 'c'):
+            self.c.close()
+
+    @patch('test_multi_site.Crawler._get_page_content')
+    def test_crawl_keeps_sites_apart(self, mock_get_page_content):
+        """ Test that each site gets its own sitemap, and all of them share a pool and a session. """
+
+        mock_get_page_content.side_effect = site_page
+
+        roots = ['http://a.test', 'http://b.test', 'http://c.test']
+        self.c = MultiSiteCrawler(roots, max_workers=4)
+        self.c.crawl()
+
+        for root in roots:
+            crawler = self.c.crawlers[root]
+            self.failUnlessEqual(set(crawler.sitemap.pages), {'/'} | {'/p' + str(i) for i in range(5)})
+            self.failUnless(crawler.pool is self.c.pool)
+            self.failUnless(crawler.session is self.c.session)
+            self.failIf(crawler.links_to_visit)
+
+        summary = self.c.summary()
+        self.failUnlessEqual(summary['pages'], 18)
+        self.failUnlessEqual(summary['fetches'], 18)
+        self.failUnlessEqual(summary['sites']['http://b.test']['fetches'], 6)
+
+    @patch('test_multi_site.Crawler._get_page_content')
+    def test_site_budgets(self, mock_get_page_content):
+        """ Test that an endless site is held to its own budget, without starving the others. """
+
+        mock_get_page_content.side_effect = lambda url: tree_page(url) if 'big.test' in url else site_page(url)
+
+        self.c = MultiSiteCrawler(['http://big.test', 'http://small.test'], max_workers=2,
+                                  site_budget={'max_pages': 20})
+        self.c.crawl()
+
+        self.failUnlessEqual(len(self.c.crawlers['http://big.test'].sitemap.pages), 20)
+        self.failUnlessEqual(len(self.c.crawlers['http://small.test'].sitemap.pages), 6)
+
+    @patch('test_multi_site.Crawler._get_page_content')
+    def test_round_robin(self, mock_get_page_content):
+        """ Test that with round-robin scheduling, the sites take turns. """
+
+        visits = []
+
+        def get_page_content(url):
+            visits.append(url.split('://')[1].split('.')[0])
+            return tree_page(url)
+
+        mock_get_page_content.side_effect = get_page_content
+
+        self.c = MultiSiteCrawler(['http://a.test', 'http://b.test'], max_workers=1, scheduling='round-robin',
+                                  site_budget={'max_pages': 5})
+        self.c.crawl()
+
+        self.failUnlessEqual(visits, ['a', 'b'] * 5)
+
+    @patch('test_multi_site.Crawler._get_page_content')
+    def test_deficit_shares_worker_time(self, mock_get_page_content):
+        """ Test that deficit scheduling gives a fast site more fetches than a slow one, for the same time. """
+
+        def get_page_content(url):
+            time.sleep(0.04 if 'slow.test' in url else 0.004)
+            return tree_page(url)
+
+        mock_get_page_content.side_effect = get_page_content
+
+        self.c = MultiSiteCrawler(['http://slow.test', 'http://fast.test'], max_workers=2, per_site_limit=2,
+                                  site_budget={'deadline': 0.5, 'grace_period': 1})
+        self.c.crawl()
+
+        sites = self.c.summary()['sites']
+        self.failUnless(sites['http://fast.test']['fetches'] > 3 * sites['http://slow.test']['fetches'])
+
+    def test_unknown_scheduling(self):
+        self.failUnlessRaises(ValueError, MultiSiteCrawler, ['http://a.test'], scheduling='lottery')
+
+    def test_shared_pool_outlives_crawlers(self):
+        """ Test that closing a site's crawler leaves the shared pool running. """
+
+        self.c = MultiSiteCrawler(['http://a.test'], max_workers=1)
+        self.c.crawlers['http://a.test'].close()
+        self.failUnlessEqual(self.c.pool.apply(len, ('abc',)), 3)
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
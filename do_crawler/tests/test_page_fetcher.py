@@ -1,7 +1,115 @@
+import os
+import socket
+import ssl
+import threading
+import time
 import unittest
 
+from do_crawler.dns_cache import DNSCache
+from do_crawler.page_fetcher import (
+    FetchSession,
+    FetchTimeoutError,
+    PageFetcher,
+    Timeouts,
+    create_ssl_context
+)
+from do_crawler.retry import (
+    CircuitBreakers,
+    CircuitOpenError,
+    RetryPolicy
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+    ThreadingHTTPServer
+)
 from unittest.mock import MagicMock
-from do_crawler.page_fetcher import PageFetcher
+from urllib.error import HTTPError
+from urllib.request import Request
+
+
+TEST_CERT = os.path.join(os.path.dirname(__file__), 'data', 'localhost.pem')
+
+
+class _HTMLHandler(BaseHTTPRequestHandler):
+    """ Serve the same small HTML page for every GET. """
+
+    body = b"<html><body><a href='/next'>next</a></body></html>"
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FlakyHandler(_HTMLHandler):
+    """ Answer 503 to the first `failures` GETs, then serve the HTML page. """
+
+    failures = 0
+    requests = 0
+
+    def do_GET(self):
+        type(self).requests += 1
+        if type(self).requests <= self.failures:
+            self.send_error(503)
+            return
+        super().do_GET()
+
+
+def start_flaky_server(failures: int) -> HTTPServer:
+    """ Start a local HTTP server that fails the first requests, in a daemon thread. """
+
+    handler = type('FlakyHandler', (_FlakyHandler,), {'failures': failures})
+    server = HTTPServer(('127.0.0.1', 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class _TrickleHandler(BaseHTTPRequestHandler):
+    """ Send the headers of a 1000 byte page, then its body one byte at a time (or stall). """
+
+    interval = 0.05
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', '1000')
+        self.end_headers()
+        try:
+            for _ in range(1000):
+                self.wfile.write(b' ')
+                time.sleep(self.interval)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_trickle_server(interval: float) -> HTTPServer:
+    """ Start a local HTTP server that sends its body very slowly, in a daemon thread. """
+
+    handler = type('TrickleHandler', (_TrickleHandler,), {'interval': interval})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_https_server() -> HTTPServer:
+    """ Start a local HTTPS server with the self-signed test certificate, in a daemon thread. """
+
+    server = HTTPServer(('127.0.0.1', 0), _HTMLHandler)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(TEST_CERT)
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
 
 
 class PageFetcherTests(unittest.TestCase):
@@ -17,6 +125,7 @@ class PageFetcherTests(unittest.TestCase):
         content_type_mock.get_content_type = MagicMock(return_value='text/html')
         self.pf._response.info = MagicMock(return_value=content_type_mock)
         self.pf._response.read = MagicMock(return_value=self.html_content)
+        self.pf._response.read1 = MagicMock(side_effect=[self.html_content, ''])
 
     def test_is_valid(self):
         """ Test if the response is valid. """
@@ -34,6 +143,169 @@ class PageFetcherTests(unittest.TestCase):
         self.failUnlessEqual(self.pf.content, self.html_content)
 
 
+class FetchSessionTests(unittest.TestCase):
+
+    def test_fetches_use_dns_cache(self):
+        """ Test that HTTP and HTTPS fetches connect to the address returned by the session's DNS cache. """
+
+        resolved = []
+
+        def stub_resolver(host, port):
+            resolved.append(host)
+            return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', port))]
+
+        server = start_flaky_server(failures=0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        https_server = start_https_server()
+        self.addCleanup(https_server.server_close)
+        self.addCleanup(https_server.shutdown)
+
+        session = FetchSession(DNSCache(stub_resolver), ssl_context=create_ssl_context(cafile=TEST_CERT))
+        for _ in range(2):
+            self.failUnless('/next' in PageFetcher('http://stub.host:%d/' % server.server_address[1], session).content)
+            self.failUnless('/next' in PageFetcher('https://localhost:%d/' % https_server.server_address[1],
+                                                   session).content)
+
+        self.failUnlessEqual(resolved, ['stub.host', 'localhost'])
+        dns = session.stats()['dns']
+        self.failUnlessEqual((dns['misses'], dns['hits']), (2, 2))
+
+    def test_https_fetch_resumes_tls_session(self):
+        """ Test that HTTPS pages are fetched and later connections resume the first TLS session. """
+
+        server = start_https_server()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'https://localhost:%d/' % server.server_address[1]
+
+        session = FetchSession(ssl_context=create_ssl_context(cafile=TEST_CERT))
+        for _ in range(3):
+            pf = PageFetcher(url, session)
+            self.failUnless(pf.is_html())
+            self.failUnless('/next' in pf.content)
+
+        tls = session.stats()['tls']
+        self.failUnlessEqual(tls['handshakes'], 3)
+        self.failUnlessEqual(tls['resumed'], 2)
+
+    def test_https_without_resumption(self):
+        """ Test that with resumption disabled every connection does a full handshake. """
+
+        server = start_https_server()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'https://localhost:%d/' % server.server_address[1]
+
+        session = FetchSession(ssl_context=create_ssl_context(cafile=TEST_CERT), tls_resumption=False)
+        for _ in range(2):
+            self.failUnless(PageFetcher(url, session).content)
+
+        self.failUnlessEqual(session.stats()['tls'], {'handshakes': 2, 'resumed': 0})
+
+    def test_retries_transient_errors(self):
+        """ Test that a 503 is retried with backoff, and the retry's response is returned. """
+
+        server = start_flaky_server(failures=2)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+        sleeps = []
+        session = FetchSession(retry_policy=RetryPolicy(max_attempts=3, sleep=sleeps.append))
+        self.failUnless('/next' in PageFetcher(url, session).content)
+
+        self.failUnlessEqual(len(sleeps), 2)
+        self.failUnlessEqual(session.stats()['retries']['retries'], 2)
+
+    def test_circuit_opens_on_failing_host(self):
+        """ Test that a host that keeps failing is cut off by its circuit breaker. """
+
+        server = start_flaky_server(failures=100)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+        session = FetchSession(retry_policy=RetryPolicy(max_attempts=1),
+                               breakers=CircuitBreakers(failure_threshold=2))
+        for _ in range(2):
+            self.assertRaises(HTTPError, session.open, Request(url))
+        self.assertRaises(CircuitOpenError, session.open, Request(url))
+
+        self.failUnlessEqual(PageFetcher(url, session).content, None)
+        self.failUnlessEqual(session.stats()['circuit_breakers']['open_hosts'], ['127.0.0.1'])
+
+    def test_failed_probe_reopens_circuit(self):
+        """ Test that a half-open probe that fails with an unexpected error opens the circuit again. """
+
+        now = [0.0]
+        breakers = CircuitBreakers(failure_threshold=1, reset_timeout=30.0, clock=lambda: now[0])
+        session = FetchSession(retry_policy=RetryPolicy(max_attempts=1), breakers=breakers)
+        session._opener = MagicMock()
+        session._opener.open.side_effect = UnicodeEncodeError('ascii', '/café', 4, 5, 'ordinal not in range')
+
+        breakers.record_failure('stub.host')
+        now[0] = 31.0
+        self.assertRaises(UnicodeEncodeError, session.open, Request('http://stub.host/caf%C3%A9'))
+
+        self.failUnlessEqual(breakers._breaker('stub.host').state, 'open')
+        self.failUnlessEqual(breakers.wait_time('stub.host'), 30.0)
+        now[0] = 62.0
+        self.failUnlessEqual(breakers.wait_time('stub.host'), 0.0)
+
+
+class TimeoutTests(unittest.TestCase):
+
+    def test_check_transfer(self):
+        """ Test the total deadline and the minimum rate (after its grace period) with a fake clock. """
+
+        now = [0.0]
+        timeouts = Timeouts(total=10, min_rate=100, min_rate_grace=2, clock=lambda: now[0])
+
+        now[0] = 1
+        timeouts.check_transfer(0, 0, 1)
+        now[0] = 3
+        timeouts.check_transfer(0, 0, 1000)
+        self.assertRaises(FetchTimeoutError, timeouts.check_transfer, 0, 0, 100)
+
+        now[0] = 11
+        self.failUnless(timeouts.past_deadline(0))
+        self.failUnlessEqual(timeouts.time_left(5), 4)
+        self.failUnlessEqual(timeouts.time_left(0), 0)
+        self.failUnlessEqual(Timeouts(total=None).time_left(0), None)
+        self.assertRaises(FetchTimeoutError, timeouts.check_transfer, 0, 5, 10 ** 6)
+
+    def fetch(self, interval: float, timeouts: Timeouts) -> PageFetcher:
+        """ Fetch a page from a trickling server, without retries. """
+
+        server = start_trickle_server(interval)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:%d/' % server.server_address[1]
+
+        return PageFetcher(url, FetchSession(retry_policy=RetryPolicy(max_attempts=1), timeouts=timeouts))
+
+    def test_read_timeout(self):
+        """ Test that a server that stalls mid-body times out. """
+
+        started = time.monotonic()
+        pf = self.fetch(5.0, Timeouts(read=0.2))
+
+        self.failUnlessEqual(pf.content, None)
+        self.failUnless(pf.timed_out())
+        self.failUnless(time.monotonic() - started < 2)
+
+    def test_slow_transfer(self):
+        """ Test that a server that trickles its body is cut off by the minimum rate guard. """
+
+        started = time.monotonic()
+        pf = self.fetch(0.02, Timeouts(min_rate=1000, min_rate_grace=0.2))
+
+        self.failUnlessEqual(pf.content, None)
+        self.failUnless(pf.timed_out())
+        self.failUnless(time.monotonic() - started < 2)
+
+
 def main():
     unittest.main()
 
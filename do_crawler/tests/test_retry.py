@@ -0,0 +1,143 @@
+import socket
+import unittest
+
+from do_crawler.retry import (
+    CircuitBreaker,
+    CircuitBreakers,
+    CircuitOpenError,
+    RetryPolicy,
+    is_retryable
+)
+from urllib.error import (
+    HTTPError,
+    URLError
+)
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def http_error(code: int) -> HTTPError:
+    return HTTPError('http://example.com/', code, 'error', {}, None)
+
+
+class RetryPolicyTests(unittest.TestCase):
+
+    def test_classification(self):
+        """ Test which errors are worth retrying. """
+
+        self.failUnless(is_retryable(http_error(503)))
+        self.failUnless(is_retryable(http_error(429)))
+        self.failUnless(is_retryable(URLError(socket.timeout('timed out'))))
+        self.failUnless(is_retryable(URLError(ConnectionResetError())))
+        self.failIf(is_retryable(http_error(404)))
+        self.failIf(is_retryable(URLError(socket.gaierror('no such host'))))
+        self.failIf(is_retryable(CircuitOpenError('example.com')))
+
+    def test_jittered_delays(self):
+        """ Test that delays are a random fraction of an exponentially growing, capped bound. """
+
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0, rng=lambda: 0.5)
+        self.failUnlessEqual([policy.delay(retry) for retry in range(5)], [0.5, 1.0, 2.0, 2.5, 2.5])
+
+        policy = RetryPolicy(base_delay=1.0, max_delay=5.0, rng=lambda: 0.0)
+        self.failUnlessEqual(policy.delay(3), 0.0)
+
+    def test_attempts_and_budget(self):
+        """ Test that retries stop at the attempt limit, and when the retry budget is spent. """
+
+        sleeps = []
+        policy = RetryPolicy(max_attempts=3, budget=3, sleep=sleeps.append, rng=lambda: 1.0)
+        error = http_error(503)
+
+        self.failUnless(policy.should_retry(error, 1))
+        policy.backoff(1)
+        self.failUnless(policy.should_retry(error, 2))
+        policy.backoff(2)
+        self.failIf(policy.should_retry(error, 3))
+        self.failUnlessEqual(sleeps, [0.5, 1.0])
+
+        self.failUnless(policy.should_retry(error, 1))
+        self.failIf(policy.should_retry(error, 1))
+        self.failIf(policy.should_retry(http_error(404), 1))
+        self.failUnlessEqual(policy.stats(), {'retries': 3, 'gave_up': 1, 'budget_exhausted': 1})
+
+    def test_backoff_stops_at_the_deadline(self):
+        """ Test that a backoff doesn't sleep past the time left before the deadline. """
+
+        sleeps = []
+        policy = RetryPolicy(base_delay=4.0, sleep=sleeps.append, rng=lambda: 1.0)
+        policy.backoff(1, time_left=10.0)
+        policy.backoff(2, time_left=3.0)
+        policy.backoff(3, time_left=-1.0)
+        policy.backoff(3)
+        self.failUnlessEqual(sleeps, [4.0, 3.0, 0.0, 16.0])
+
+
+class CircuitBreakerTests(unittest.TestCase):
+
+    def test_state_transitions(self):
+        """ Test closed -> open -> half-open -> open -> half-open -> closed. """
+
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=clock)
+
+        breaker.record_failure()
+        self.failUnless(breaker.allow())
+        breaker.record_failure()
+        self.failUnlessEqual(breaker.state, CircuitBreaker.OPEN)
+        self.failIf(breaker.allow())
+        self.failUnlessEqual(breaker.wait_time(), 10)
+
+        clock.now = 10
+        self.failUnless(breaker.allow())
+        self.failUnlessEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.failIf(breaker.allow())
+
+        breaker.record_failure()
+        self.failUnlessEqual(breaker.state, CircuitBreaker.OPEN)
+
+        clock.now = 20
+        self.failUnless(breaker.allow())
+        breaker.record_success()
+        self.failUnlessEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.failUnlessEqual(breaker.wait_time(), 0)
+
+    def test_gives_up_after_max_trips(self):
+        """ Test that a host that keeps failing its probes is rejected without waiting. """
+
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1, max_trips=2, clock=clock)
+        breaker.record_failure()
+        clock.now = 1
+        self.failUnless(breaker.allow())
+        breaker.record_failure()
+
+        clock.now = 100
+        self.failUnless(breaker.given_up)
+        self.failIf(breaker.allow())
+        self.failUnlessEqual(breaker.wait_time(), 0)
+
+    def test_breakers_are_per_host(self):
+        """ Test that one host's failures don't affect another host. """
+
+        breakers = CircuitBreakers(failure_threshold=1, clock=FakeClock())
+        breakers.record_failure('a.com')
+
+        self.failIf(breakers.allow('a.com'))
+        self.failUnless(breakers.allow('b.com'))
+        self.failUnlessEqual(breakers.stats(), {'opened': 1, 'rejected': 1, 'open_hosts': ['a.com']})
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
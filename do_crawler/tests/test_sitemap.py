@@ -30,6 +30,9 @@ class SiteMapTests(unittest.TestCase):
         rel = "/asia/interesting_articles_1023/foo.html"
         self.failUnlessEqual(rel, _get_relative_url(url))
 
+        # Distinct queries are distinct pages.
+        self.failUnlessEqual(_get_relative_url('http://shop.com/list?page=2#top'), '/list?page=2')
+
     def test_page_construction(self):
         """ Check that a page is properly constructed with all links correctly relativized. """
 
@@ -81,6 +84,60 @@ class SiteMapTests(unittest.TestCase):
         self.failUnless(len(sm.pages) == 2)
         self.failUnlessEqual(sm.pages['url1'].urls, ['url1', 'url2'])
 
+    def test_sitemap_referrers(self):
+        """ Test that the reverse link index returns the pages linking to a url. """
+
+        sm = SiteMap()
+        sm.add_page(Page('http://base.url/', 'hash1', set(), {'http://base.url/a', 'http://base.url/b'}))
+        sm.add_page(Page('http://base.url/a', 'hash2', set(), {'http://base.url/b'}))
+
+        self.failUnlessEqual(sorted(sm.referrers('/b')), ['/', '/a'])
+        self.failUnlessEqual(sm.referrers('/a'), ['/'])
+        self.failUnlessEqual(sm.referrers('/'), [])
+        self.failUnlessEqual(sm.referrers('/unknown'), [])
+
+    def test_sitemap_referrers_of_aliases(self):
+        """ Test that a url folded into an existing page is indexed as a referrer of that page's links. """
+
+        sm = SiteMap()
+        sm.add_page(Page('http://base.url/', 'hash', set(), {'http://base.url/a'}))
+        sm.add_page(Page('http://base.url/index', 'hash', set(), set()))
+        sm.add_page(Page('http://base.url/index', 'hash', set(), set()))
+
+        self.failUnlessEqual(sm.referrers('/a'), ['/', '/index'])
+
+    def test_sitemap_add_alias(self):
+        """ Test that a url can be added by content hash alone, as an alias of the page with that hash. """
+
+        sm = SiteMap()
+        sm.add_page(Page('http://base.url/', 'hash', set(), {'http://base.url/a'}))
+
+        self.failUnless(sm.has_hash('hash'))
+        self.failIf(sm.has_hash('other'))
+
+        page = sm.add_alias('http://base.url/index?x=1', 'hash')
+        self.failUnless(page is sm.pages['/'])
+        self.failUnless(sm.pages['/index?x=1'] is page)
+        self.failUnlessEqual(page.urls, ['/', '/index?x=1'])
+        self.failUnlessEqual(sm.referrers('/a'), ['/', '/index?x=1'])
+
+        # Adding it again changes nothing.
+        sm.add_alias('http://base.url/index?x=1', 'hash')
+        self.failUnlessEqual(page.urls, ['/', '/index?x=1'])
+        self.failUnlessRaises(KeyError, sm.add_alias, '/b', 'other')
+
+    def test_sitemap_interns_static_assets(self):
+        """ Test that pages with equal static asset sets share a single frozen set. """
+
+        sm = SiteMap()
+        sm.add_page(Page('url1', 'hash1', {'http://a/s.css', 'http://a/s.js'}, set()))
+        sm.add_page(Page('url2', 'hash2', {'http://a/s.js', 'http://a/s.css'}, set()))
+        sm.add_page(Page('url3', 'hash3', {'http://a/s.css'}, set()))
+
+        self.failUnless(sm.pages['url1'].static_assets is sm.pages['url2'].static_assets)
+        self.failUnless(isinstance(sm.pages['url1'].static_assets, frozenset))
+        self.failUnlessEqual(sm.asset_urls(), {'http://a/s.css', 'http://a/s.js'})
+
 
 def main():
     unittest.main()
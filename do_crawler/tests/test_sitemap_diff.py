@@ -0,0 +1,154 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from collections import OrderedDict
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+from do_crawler.sitemap_diff import (
+    diff_sitemaps,
+    diff_states
+)
+from do_crawler.sitemap_store import (
+    load_sitemap,
+    save_sitemap
+)
+from unittest.mock import patch
+
+
+def build_sitemap(pages: list) -> SiteMap:
+    """ Build a sitemap from (url, hash, assets, links) tuples, with relative page urls and links. """
+
+    sitemap = SiteMap()
+    for url, page_hash, assets, links in pages:
+        sitemap.add_page(Page('http://base.url' + url, page_hash, set(assets),
+                              {'http://base.url' + link for link in links}))
+    return sitemap
+
+
+class SiteMapDiffTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Two crawls: /b changed, /c was removed, /d was added, and / and its alias are unchanged. """
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.old = build_sitemap([
+            ('/', 'hash1', ['http://cdn.url/style.css'], ['/a', '/b', '/c']),
+            ('/a', 'hash2', [], ['/']),
+            ('/b', 'hash3', ['http://cdn.url/b.png'], ['/', '/a']),
+            ('/c', 'hash4', [], ['/']),
+            ('/index', 'hash1', [], []),
+        ])
+        self.new = build_sitemap([
+            ('/', 'hash1', ['http://cdn.url/style.css'], ['/a', '/b', '/c']),
+            ('/a', 'hash2', [], ['/']),
+            ('/b', 'hash5', ['http://cdn.url/b.jpg'], ['/', '/d']),
+            ('/d', 'hash6', [], ['/']),
+            ('/index', 'hash1', [], []),
+        ])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def save(self, sitemap: SiteMap, name: str) -> str:
+        path = os.path.join(self.tmp_dir, name)
+        save_sitemap(sitemap, path)
+        return path
+
+    def expected_changes(self) -> list:
+        return [
+            {'change': 'changed', 'url': '/b', 'old_hash': 'hash3', 'hash': 'hash5',
+             'links_added': ['/d'], 'links_removed': ['/a'],
+             'assets_added': ['http://cdn.url/b.jpg'], 'assets_removed': ['http://cdn.url/b.png']},
+            {'change': 'added', 'url': '/d', 'hash': 'hash6'},
+            {'change': 'removed', 'url': '/c', 'hash': 'hash4'},
+        ]
+
+    def test_diff_sitemaps(self):
+        """ Test that only added, removed and changed urls are reported, with their link and asset deltas. """
+
+        self.failUnlessEqual(list(diff_sitemaps(self.old, self.new)), self.expected_changes())
+        self.failUnlessEqual(list(diff_sitemaps(self.new, self.new)), [])
+
+    def test_diff_saved_states(self):
+        """ Test that saved crawl states, and a mix of states and sitemaps, give the same diff. """
+
+        old_path, new_path = self.save(self.old, 'old.bin'), self.save(self.new, 'new.bin')
+        with load_sitemap(old_path) as old, load_sitemap(new_path) as new:
+            self.failUnlessEqual(list(diff_sitemaps(old, new)), self.expected_changes())
+            self.failUnlessEqual(list(diff_sitemaps(old, self.new)), self.expected_changes())
+
+    def test_unchanged_saved_pages_are_matched_by_hash(self):
+        """ Test that unchanged urls of saved states are matched through the hash index, without decoding them. """
+
+        old_path, new_path = self.save(self.old, 'old.bin'), self.save(self.new, 'new.bin')
+        with load_sitemap(old_path) as old, load_sitemap(new_path) as new:
+            with patch.object(old, 'page_hash', wraps=old.page_hash) as page_hash:
+                self.failUnlessEqual(list(diff_sitemaps(old, new)), self.expected_changes())
+
+        self.failUnlessEqual(sorted(call.args[0] for call in page_hash.call_args_list), ['/b'])
+
+    def test_unchanged_pages_are_not_decoded(self):
+        """ Test that links are only compared for pages whose hash changed, once per page. """
+
+        # /b2 is an alias of /b in both crawls.
+        self.old.add_page(Page('http://base.url/b2', 'hash3', set(), set()))
+        self.new.add_page(Page('http://base.url/b2', 'hash5', set(), set()))
+        compared = []
+
+        class Links(set):
+            def __sub__(self, other):
+                compared.append(self)
+                return set.__sub__(self, other)
+
+        for page in self.new.pages.values():
+            page.links = Links(page.links)
+
+        changes = list(diff_sitemaps(self.old, self.new))
+        self.failUnlessEqual([change['url'] for change in changes], ['/b', '/d', '/b2', '/c'])
+        self.failUnlessEqual(changes[2]['links_added'], ['/d'])
+        self.failUnlessEqual(len(compared), 1)
+
+    def test_delta_cache_is_bounded(self):
+        """ Test that only the deltas of the last DELTA_CACHE_SIZE changed pages are kept, and the diff is the same. """
+
+        for i in range(10):
+            self.old.add_page(Page('http://base.url/p' + str(i), 'old' + str(i), set(), set()))
+            self.new.add_page(Page('http://base.url/p' + str(i), 'new' + str(i), set(), {'http://base.url/'}))
+        expected = list(diff_sitemaps(self.old, self.new))
+        sizes = []
+
+        class Deltas(OrderedDict):
+            def __setitem__(self, key, value):
+                OrderedDict.__setitem__(self, key, value)
+                sizes.append(len(self))
+
+        with patch('do_crawler.sitemap_diff.DELTA_CACHE_SIZE', 2), patch('do_crawler.sitemap_diff.OrderedDict', Deltas):
+            self.failUnlessEqual(list(diff_sitemaps(self.old, self.new)), expected)
+        self.failUnlessEqual(len(sizes), 11)
+        # One over the limit at most, between adding a delta and dropping the oldest.
+        self.failUnlessEqual(max(sizes), 3)
+
+    def test_change_feed(self):
+        """ Test that the change feed is written as (gzipped) NDJSON, and counted. """
+
+        old_path, new_path = self.save(self.old, 'old.bin'), self.save(self.new, 'new.bin')
+        feed_path = os.path.join(self.tmp_dir, 'changes.ndjson.gz')
+
+        counts = diff_states(old_path, new_path, feed_path, compress=True)
+        self.failUnlessEqual(counts, {'added': 1, 'removed': 1, 'changed': 1})
+        with gzip.open(feed_path, 'rt', encoding='utf-8') as f:
+            self.failUnlessEqual([json.loads(line) for line in f], self.expected_changes())
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from do_crawler.sitemap import (
+    Page,
+    SiteMap
+)
+from do_crawler.sitemap_store import (
+    load_sitemap,
+    save_sitemap
+)
+
+
+class SiteMapStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        """ Build a small sitemap with an alias, and save it to a temporary file. """
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'sitemap.bin')
+
+        self.sitemap = SiteMap()
+        self.sitemap.add_page(Page('http://base.url/', 'hash1', {'http://base.url/style.css'},
+                                   {'http://base.url/a', 'http://base.url/b'}))
+        self.sitemap.add_page(Page('http://base.url/a', 'hash2', set(), {'http://base.url/'}))
+        self.sitemap.add_page(Page('http://base.url/index', 'hash1', set(), set()))
+        self.sitemap.add_page(Page('http://base.url/café', 'hash3', set(), set()))
+        save_sitemap(self.sitemap, self.path)
+
+        self.smf = load_sitemap(self.path)
+
+    def tearDown(self):
+        self.smf.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lookup_by_url(self):
+        """ Test that every URL (including aliases and non-ASCII URLs) can be found, and others can't. """
+
+        self.failUnlessEqual(len(self.smf), len(self.sitemap.pages))
+        self.failUnlessEqual(self.smf.num_pages, 3)
+        for url in self.sitemap.pages:
+            self.failUnless(url in self.smf)
+        self.failIf('/missing' in self.smf)
+        self.assertRaises(KeyError, self.smf.outlinks, '/missing')
+
+    def test_queries(self):
+        """ Test the outlinks, aliases, assets and hash queries. """
+
+        self.failUnlessEqual(self.smf.outlinks('/'), ['/a', '/b'])
+        self.failUnlessEqual(self.smf.aliases('/index'), ['/', '/index'])
+        self.failUnlessEqual(self.smf.assets('/index'), ['http://base.url/style.css'])
+        self.failUnlessEqual(self.smf.page_hash('/a'), 'hash2')
+
+    def test_lookup_by_hash(self):
+        """ Test that pages can be found by content hash, and URLs matched against a hash. """
+
+        self.failUnless(self.smf.has_hash('hash1'))
+        self.failIf(self.smf.has_hash('hash4'))
+        self.failUnlessEqual(self.smf.page_by_hash('hash1').urls, ['/', '/index'])
+        self.failUnlessEqual(self.smf.page_by_hash('hash3').urls, ['/café'])
+        self.assertRaises(KeyError, self.smf.page_by_hash, 'hash4')
+
+        self.failUnless(self.smf.url_has_hash('/index', 'hash1'))
+        self.failIf(self.smf.url_has_hash('/a', 'hash1'))
+        self.failIf(self.smf.url_has_hash('/missing', 'hash1'))
+
+    def test_round_trip(self):
+        """ Test that a loaded file converts back into an equivalent SiteMap. """
+
+        sm = self.smf.to_sitemap()
+
+        self.failUnlessEqual(set(sm.pages), set(self.sitemap.pages))
+        self.failUnless(sm.pages['/'] is sm.pages['/index'])
+        for url, page in self.sitemap.pages.items():
+            self.failUnlessEqual(sm.pages[url].urls, page.urls)
+            self.failUnlessEqual(sm.pages[url].links, page.links)
+            self.failUnlessEqual(sm.pages[url].static_assets, page.static_assets)
+            self.failUnless(sm.has_hash(page.page_hash))
+
+    def test_rejects_other_files(self):
+        """ Test that loading a file that isn't a binary sitemap fails cleanly. """
+
+        other = os.path.join(self.tmp_dir, 'other.bin')
+        with open(other, 'wb') as f:
+            f.write(b'\0' * 256)
+
+        self.assertRaises(ValueError, load_sitemap, other)
+
+        # A file in an older version of the format.
+        with open(self.path, 'rb') as f:
+            data = bytearray(f.read())
+        data[4:6] = (1).to_bytes(2, 'little')
+        with open(other, 'wb') as f:
+            f.write(data)
+
+        self.assertRaises(ValueError, load_sitemap, other)
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import gzip
+import io
+import unittest
+
+from do_crawler import sitemap_xml
+from do_crawler.sitemap_xml import (
+    iter_sitemap,
+    iter_site_urls,
+    parse_robots_sitemaps
+)
+from unittest.mock import patch
+
+
+URLSET = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    b'<url><loc>http://test.domain/a</loc><lastmod>2016-01-02</lastmod><priority>0.8</priority></url>'
+    b'<url><loc> http://test.domain/b </loc></url>'
+    b'<url><lastmod>2016-01-02</lastmod></url>'
+    b'</urlset>'
+)
+
+IMAGE_SITEMAP = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+    b' xmlns:image="http://www.google.com/schemas/sitemap-image/1.1">'
+    b'<url><loc>http://test.domain/page</loc><priority>0.5</priority>'
+    b'<image:image><image:loc>https://cdn.test.domain/img.jpg</image:loc></image:image></url>'
+    b'<url><image:image><image:loc>https://cdn.test.domain/orphan.jpg</image:loc></image:image></url>'
+    b'</urlset>'
+)
+
+SITEMAP_INDEX = (
+    b'<?xml version="1.0" encoding="UTF-8"?>'
+    b'<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+    b'<sitemap><loc>http://test.domain/sitemap1.xml.gz</loc><lastmod>2016-01-01</lastmod></sitemap>'
+    b'</sitemapindex>'
+)
+
+
+class SitemapXmlTests(unittest.TestCase):
+
+    def test_iter_urlset(self):
+        """ Test that <url> entries are parsed with their metadata, and entries with no <loc> are skipped. """
+
+        entries = list(iter_sitemap(io.BytesIO(URLSET)))
+
+        self.failUnlessEqual([kind for kind, _ in entries], ['url', 'url'])
+        first, second = entries[0][1], entries[1][1]
+        self.failUnlessEqual(first.loc, 'http://test.domain/a')
+        self.failUnlessEqual(first.lastmod, '2016-01-02')
+        self.failUnlessEqual(first.priority, 0.8)
+        self.failUnlessEqual(second.loc, 'http://test.domain/b')
+        self.failUnlessEqual(second.priority, None)
+
+    def test_iter_image_sitemap(self):
+        """ Test that the <image:loc> of an image sitemap doesn't replace (or stand in for) the page's <loc>. """
+
+        entries = list(iter_sitemap(io.BytesIO(IMAGE_SITEMAP)))
+
+        self.failUnlessEqual(len(entries), 1)
+        self.failUnlessEqual(entries[0][1].loc, 'http://test.domain/page')
+        self.failUnlessEqual(entries[0][1].priority, 0.5)
+
+    def test_iter_gzipped_index(self):
+        """ Test that gzipped sitemap indexes are detected and yield their child sitemaps. """
+
+        entries = list(iter_sitemap(io.BytesIO(gzip.compress(SITEMAP_INDEX))))
+
+        self.failUnlessEqual(len(entries), 1)
+        self.failUnlessEqual(entries[0][0], 'sitemap')
+        self.failUnlessEqual(entries[0][1].loc, 'http://test.domain/sitemap1.xml.gz')
+
+    def test_parse_robots_sitemaps(self):
+        """ Test that Sitemap directives are found in robots.txt regardless of case. """
+
+        robots = 'User-agent: *\nDisallow: /private\nSitemap: http://test.domain/s.xml\nsitemap:http://test.domain/t.xml\n'
+
+        self.failUnlessEqual(parse_robots_sitemaps(robots), ['http://test.domain/s.xml', 'http://test.domain/t.xml'])
+
+    @patch('do_crawler.sitemap_xml._open')
+    def test_iter_site_urls_follows_indexes(self, mock_open):
+        """ Test that site discovery goes through robots.txt and sitemap indexes to the page URLs. """
+
+        documents = {
+            'http://test.domain/robots.txt': b'Sitemap: http://test.domain/index.xml',
+            'http://test.domain/index.xml': SITEMAP_INDEX,
+            'http://test.domain/sitemap1.xml.gz': gzip.compress(URLSET),
+        }
+        mock_open.side_effect = lambda url, session: io.BytesIO(documents[url]) if url in documents else None
+
+        locs = [entry.loc for entry in iter_site_urls('http://test.domain/')]
+
+        self.failUnlessEqual(locs, ['http://test.domain/a', 'http://test.domain/b'])
+
+    @patch('do_crawler.sitemap_xml._open')
+    def test_well_known_fallback(self, mock_open):
+        """ Test that the well-known sitemap locations are used when robots.txt lists none. """
+
+        mock_open.return_value = None
+
+        self.failUnlessEqual(
+            sitemap_xml.discover_sitemaps('http://test.domain'),
+            ['http://test.domain/sitemap.xml', 'http://test.domain/sitemap_index.xml']
+        )
+
+
+def main():
+    unittest.main()
+
+if __name__ == '__main__':
+    main()
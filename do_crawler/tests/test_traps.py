@@ -0,0 +1,85 @@
+import unittest
+
+from do_crawler.traps import (
+    TrapDetector,
+    path_depth,
+    path_template
+)
+
+
+class PathTemplateTests(unittest.TestCase):
+
+    def test_numbers_dates_and_ids(self):
+        self.failUnlessEqual(path_template('/calendar/2024-05-31'), '/calendar/{date}')
+        self.failUnlessEqual(path_template('/calendar/20240531/events'), '/calendar/{date}/events')
+        self.failUnlessEqual(path_template('/archive/2024/05/'), '/archive/{n}/{n}/')
+        self.failUnlessEqual(path_template('/item/3f2a9c1d7e'), '/item/{hex}')
+        self.failUnlessEqual(path_template('/u/550e8400-e29b-41d4-a716-446655440000'), '/u/{hex}')
+        self.failUnlessEqual(path_template('/page-12.html'), '/page-{n}.html')
+
+    def test_words_are_kept(self):
+        self.failUnlessEqual(path_template('/blog/deadbeef'), '/blog/deadbeef')
+        self.failUnlessEqual(path_template('/about/'), '/about/')
+        self.failUnlessEqual(path_template('/'), '/')
+
+    def test_query_and_session_ids(self):
+        self.failUnlessEqual(path_template('/list?page=4&sort=asc'), '/list?page={n}&sort=asc')
+        self.failUnlessEqual(path_template('/cart;jsessionid=0A1B2C3D4E?sid=abc123def456'), '/cart?sid={hex}')
+
+    def test_repeated_segments(self):
+        self.failUnlessEqual(path_template('/a/b/a/b/a'), '/a/b/{repeat}')
+        self.failUnlessEqual(path_template('/a/b/a/b/a/b/a/b'), '/a/b/{repeat}')
+
+    def test_path_depth(self):
+        self.failUnlessEqual(path_depth('/'), 0)
+        self.failUnlessEqual(path_depth('/a'), 1)
+        self.failUnlessEqual(path_depth('/a/b/?x=/y'), 2)
+
+
+class TrapDetectorTests(unittest.TestCase):
+
+    def test_cap(self):
+        detector = TrapDetector(max_per_template=3)
+        allowed = detector.filter(['/day/' + str(i) for i in range(10)] + ['/about'])
+
+        self.failUnlessEqual(len(allowed), 4)
+        self.failUnless('/about' in allowed)
+        self.failUnlessEqual(detector.suppressed, {'/day/{n}': 7})
+        self.failUnlessEqual(detector.stats()['suppressed'], 7)
+
+    def test_suppressed_links_are_counted_once(self):
+        detector = TrapDetector(max_per_template=3)
+        links = ['/day/' + str(i) for i in range(10)]
+        detector.filter(links)
+
+        self.failUnlessEqual(detector.filter(links[3:]), set())
+        self.failUnlessEqual(detector.suppressed, {'/day/{n}': 7})
+        self.failUnlessEqual(detector.templates, {'/day/{n}': 10})
+        self.failUnlessEqual(detector.stats()['depths'], {2: 10})
+
+    def test_sample(self):
+        detector = TrapDetector(max_per_template=10, policy='sample', sample_rate=0.1)
+        links = ['/day/' + str(i) for i in range(10010)]
+        allowed = detector.filter(links)
+
+        # The first 10, then about 10% of the rest; the same links every time.
+        self.failUnless(900 < len(allowed) < 1100)
+        self.failUnlessEqual(TrapDetector(max_per_template=10, policy='sample', sample_rate=0.1).filter(links),
+                             allowed)
+
+    def test_max_depth(self):
+        detector = TrapDetector(max_depth=3)
+        self.failUnless(detector.allow('/a/b/c'))
+        self.failIf(detector.allow('/a/b/c/d'))
+        self.failUnlessEqual(detector.stats()['depths'], {3: 1, 4: 1})
+
+    def test_unknown_policy(self):
+        self.failUnlessRaises(ValueError, TrapDetector, policy='drop')
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from do_crawler.crawler import Crawler
+from do_crawler.page_fetcher import (
+    FetchSession,
+    PageFetcher
+)
+from do_crawler.warc import (
+    ReplaySession,
+    WarcIndex,
+    WarcWriter,
+    iter_records,
+    warc_paths
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    ThreadingHTTPServer
+)
+from unittest.mock import patch
+from urllib.error import URLError
+from urllib.request import Request
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    """ A small site: / links to /a, /b and /missing; /a and /b link back to /; /missing is a 404. """
+
+    pages = {
+        '/': b"<html><body><a href='/a'></a><a href='/b'></a><a href='/missing'></a></body></html>",
+        '/a': b"<html><body><a href='/'></a>a</body></html>",
+        '/b': b"<html><body><a href='/'></a>b</body></html>",
+    }
+
+    def do_GET(self):
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        time.sleep(0.02)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _SeededSiteHandler(_SiteHandler):
+    """ The same site, with a robots.txt that lists a sitemap of /a and /c (which no page links to). """
+
+    def do_GET(self):
+        root = 'http://127.0.0.1:' + str(self.server.server_address[1])
+        documents = {
+            '/robots.txt': ('Sitemap: ' + root + '/sitemap.xml\n').encode('ascii'),
+            '/sitemap.xml': ('<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                             '<url><loc>' + root + '/a</loc></url><url><loc>' + root + '/c</loc></url>'
+                             '</urlset>').encode('ascii'),
+            '/c': b"<html><body>c</body></html>",
+        }
+        body = documents.get(self.path)
+        if body is None:
+            super().do_GET()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html' if self.path == '/c' else 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class WarcTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'crawl.warc.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_pages(self, writer: WarcWriter, count: int):
+        for i in range(count):
+            writer.write_exchange('http://test.domain/' + str(i), {'User-Agent': 'test'}, 200, 'OK',
+                                  [('Content-Type', 'text/html'), ('Transfer-Encoding', 'chunked')],
+                                  b'<p>' + str(i).encode('ascii') * 100 + b'</p>', 0.01 * i)
+        writer.close()
+
+    def test_write_and_look_up(self):
+        """ Test that recorded responses are indexed, and read back by offset. """
+
+        writer = WarcWriter(self.path)
+        self.write_pages(writer, 10)
+
+        self.failUnlessEqual(warc_paths(self.path), [os.path.join(self.directory, 'crawl-00000.warc.gz')])
+        records = list(iter_records(writer.paths[0]))
+        self.failUnlessEqual([fields['WARC-Type'] for _, _, fields, _ in records[:3]],
+                             ['warcinfo', 'response', 'request'])
+        self.failUnless(records[2][3].startswith(b'GET /0 HTTP/1.1\r\nHost: test.domain\r\n'))
+
+        index = WarcIndex(self.path)
+        self.failUnlessEqual(len(index), 10)
+        block, latency = index.get('http://test.domain/7')
+        self.failUnlessAlmostEqual(latency, 0.07)
+        self.failUnless(block.startswith(b'HTTP/1.1 200 OK\r\n'))
+        self.failIf(b'chunked' in block)
+        self.failUnless(block.endswith(b'\r\n\r\n<p>' + b'7' * 100 + b'</p>'))
+        self.failUnlessEqual(index.get('http://test.domain/missing'), None)
+
+    def test_rotation(self):
+        """ Test that files are rotated at the maximum size, and all of them are indexed. """
+
+        writer = WarcWriter(self.path, max_size=1000)
+        self.write_pages(writer, 20)
+
+        self.failUnless(len(writer.paths) > 2)
+        self.failUnlessEqual(warc_paths(self.path), writer.paths)
+        self.failUnlessEqual(len(WarcIndex(self.path)), 20)
+
+    def test_index_rebuilt_by_scanning(self):
+        """ Test that a WARC without its sidecar index can still be replayed. """
+
+        writer = WarcWriter(self.path)
+        self.write_pages(writer, 5)
+        os.remove(writer.paths[0] + '.idx')
+
+        index = WarcIndex(writer.paths[0])
+        self.failUnlessEqual(len(index), 5)
+        self.failUnlessAlmostEqual(index.get('http://test.domain/3')[1], 0.03)
+
+    def test_scan_in_small_chunks(self):
+        """ Test that records spanning many read chunks (and chunks spanning records) are scanned alike. """
+
+        writer = WarcWriter(self.path)
+        self.write_pages(writer, 5)
+
+        records = list(iter_records(writer.paths[0]))
+        with patch('do_crawler.warc.READ_CHUNK_SIZE', 7):
+            self.failUnlessEqual(list(iter_records(writer.paths[0])), records)
+        self.failUnlessEqual(sum(length for _, length, _, _ in records), os.path.getsize(writer.paths[0]))
+
+    def test_record_and_replay_crawl(self):
+        """ Test that a replayed crawl gives the same sitemap as the recorded one, without the site. """
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _SiteHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        root = 'http://127.0.0.1:' + str(server.server_address[1])
+
+        recorded = Crawler(root, session=FetchSession(recorder=WarcWriter(self.path)))
+        recorded.parallel_crawl()
+        recorded.close()
+        recorded.session.close()
+        server.shutdown()
+        server.server_close()
+
+        index = WarcIndex(self.path)
+        self.failUnlessEqual(len(index), 4)
+
+        replay = ReplaySession(self.path)
+        replayed = Crawler(root, session=replay)
+        replayed.parallel_crawl()
+        replayed.close()
+
+        self.failUnlessEqual(set(replayed.sitemap.pages), {'/', '/a', '/b'})
+        for url, page in recorded.sitemap.pages.items():
+            self.failUnlessEqual(replayed.sitemap.pages[url].page_hash, page.page_hash)
+        self.failUnlessEqual(replayed.failed_links, recorded.failed_links)
+        self.failUnlessEqual(replay.stats()['replay'], {'hits': 4, 'misses': 0, 'recorded': 4})
+
+    def test_record_and_replay_seeded_crawl(self):
+        """ Test that robots.txt and sitemaps are recorded too, so a seeded crawl replays the same frontier. """
+
+        server = ThreadingHTTPServer(('127.0.0.1', 0), _SeededSiteHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        root = 'http://127.0.0.1:' + str(server.server_address[1])
+
+        recorded = Crawler(root, seed_sitemaps=True, session=FetchSession(recorder=WarcWriter(self.path)))
+        recorded.parallel_crawl()
+        recorded.close()
+        recorded.session.close()
+        server.shutdown()
+        server.server_close()
+
+        self.failUnless(root + '/robots.txt' in WarcIndex(self.path))
+
+        replayed = Crawler(root, seed_sitemaps=True, session=ReplaySession(self.path))
+        replayed.parallel_crawl()
+        replayed.close()
+
+        self.failUnlessEqual(set(recorded.seed_entries), {'/a', '/c'})
+        self.failUnlessEqual(set(replayed.seed_entries), set(recorded.seed_entries))
+        self.failUnlessEqual(set(replayed.sitemap.pages), {'/', '/a', '/b', '/c'})
+        self.failUnlessEqual(replayed.session.stats()['replay']['misses'], 0)
+
+    def test_read_warc_1_0(self):
+        """ Test that WARC/1.0 records (from other tools) can be scanned and replayed. """
+
+        block = b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\nContent-Length: 9\r\n\r\n<p>ok</p>'
+        record = (b'WARC/1.0\r\nWARC-Type: response\r\nWARC-Target-URI: http://test.domain/\r\n'
+                  b'Content-Length: ' + str(len(block)).encode('ascii') + b'\r\n\r\n' + block + b'\r\n\r\n')
+        with open(self.path, 'wb') as f:
+            f.write(gzip.compress(record))
+
+        pf = PageFetcher('http://test.domain/', ReplaySession(self.path))
+        self.failUnlessEqual(pf.content, str(b'<p>ok</p>'))
+
+    def test_replay_latency(self):
+        """ Test that recorded latency is simulated, or removed. """
+
+        writer = WarcWriter(self.path)
+        writer.write_exchange('http://test.domain/', {}, 200, 'OK', [('Content-Type', 'text/html')],
+                              b'<p>slow</p>', 0.2)
+        writer.close()
+
+        for latency, slow in [('simulate', True), ('none', False)]:
+            start = time.monotonic()
+            pf = PageFetcher('http://test.domain/', ReplaySession(self.path, latency=latency))
+            self.failUnlessEqual(pf.content, str(b'<p>slow</p>'))
+            self.failUnlessEqual(time.monotonic() - start >= 0.2, slow)
+
+        pf = PageFetcher('http://test.domain/other', ReplaySession(self.path))
+        self.failIf(pf.is_valid())
+
+    def test_replay_stats_from_threads(self):
+        """ Test that hits and misses counted from concurrent fetches add up. """
+
+        writer = WarcWriter(self.path)
+        self.write_pages(writer, 5)
+        session = ReplaySession(self.path)
+
+        def fetch():
+            for i in range(200):
+                try:
+                    session.open(Request('http://test.domain/' + str(i % 10))).close()
+                except URLError:
+                    pass
+
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.failUnlessEqual(session.stats()['replay'], {'hits': 800, 'misses': 800, 'recorded': 5})
+
+    def test_unknown_latency_mode(self):
+        writer = WarcWriter(self.path)
+        self.write_pages(writer, 1)
+        self.failUnlessRaises(ValueError, ReplaySession, self.path, latency='fast')
+
+
+def main():
+    unittest.main()
+
+
+if __name__ == '__main__':
+    main()
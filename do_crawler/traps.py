@@ -0,0 +1,172 @@
+import logging
+import re
+import sys
+import zlib
+
+from functools import lru_cache
+
+
+logger = logging.getLogger(__name__)
+
+TRAP_POLICIES = ('cap', 'sample')
+
+# Segment patterns, most specific first; each match is replaced by its placeholder.
+_SEGMENT_PATTERNS = re.compile(
+    r'(?P<date>(?<![0-9])(?:19|20)[0-9]{2}[-_/.]?(?:0[1-9]|1[0-2])[-_/.]?(?:0[1-9]|[12][0-9]|3[01])(?![0-9]))'
+    r'|(?P<hex>(?<![0-9a-z])(?=[0-9a-f-]*[0-9])(?=[0-9a-f-]*[a-f])[0-9a-f]{8,}(?:-[0-9a-f]{4,})*(?![0-9a-z]))'
+    r'|(?P<n>[0-9]+)',
+    re.IGNORECASE
+)
+
+# Path parameters that carry a session id (e.g. /cart;jsessionid=0A1B2C).
+_PATH_PARAMS = re.compile(r';[^/]*')
+
+
+def _template_segment(segment: str) -> str:
+    """ Replace the dates, hex ids and numbers of a path segment (or query value) with placeholders. """
+
+    return _SEGMENT_PATTERNS.sub(lambda match: '{' + match.lastgroup + '}', segment)
+
+
+@lru_cache(maxsize=1 << 16)
+def path_template(link: str) -> str:
+    """
+    Turn a relative link into the template of the URLs it's one of, e.g.:
+
+        /events/2024-05-31/day       ->  /events/{date}/day
+        /item/3f2a9c1d7e/reviews?p=4 ->  /item/{hex}/reviews?p={n}
+        /a/b/a/b/a/b                 ->  /a/b/{repeat}
+
+    Path parameters (;jsessionid=...) are dropped, query values are templated like path segments,
+    and a path that revisits a segment it already passed through is cut at the first repetition.
+    """
+    path, _, query = link.partition('?')
+    path = _PATH_PARAMS.sub('', path.partition('#')[0])
+
+    segments = []
+    seen = set()
+    for segment in path.split('/'):
+        if segment and segment in seen:
+            segments.append('{repeat}')
+            break
+        seen.add(segment)
+        segments.append(_template_segment(segment))
+
+    template = '/'.join(segments)
+    if query:
+        params = [param.partition('=') for param in query.split('&') if param]
+        template += '?' + '&'.join(name + eq + _template_segment(value) for name, eq, value in params)
+    return template
+
+
+def path_depth(link: str) -> int:
+    """ The number of segments in the path of a relative link. """
+
+    path = link.partition('?')[0].partition('#')[0]
+    return path.count('/') - path.endswith('/')
+
+
+# --- TrapDetector:
+
+
+class TrapDetector(object):
+    """
+    Detects crawler traps (calendars, endlessly nested relative links, session ids in URLs) from the
+    links a crawl discovers, and suppresses them before they reach the frontier.
+
+    Each new link is counted under its path template (see path_template) and its path depth. Once a
+    template has admitted `max_per_template` links, its further links are:
+
+        - 'cap': all suppressed.
+        - 'sample': admitted at `sample_rate` (the same links every time, by hash of the URL).
+
+    Links with more than `max_depth` path segments are always suppressed. Paths that repeat a segment
+    (/a/b/a/b/...) share one template, so endlessly nested relative links are capped like calendars.
+    Each suppressed link is logged with its template, and remembered: when it's found again, it's
+    suppressed without being counted (or logged) again.
+
+    The detector isn't thread-safe: the crawler checks links under its own lock.
+    """
+
+    def __init__(self, max_per_template: int = 1000, max_depth: int = 16, policy: str = 'cap',
+                 sample_rate: float = 0.01):
+        """
+        :param max_per_template: the number of links a template admits before it's capped
+        :type max_per_template: int
+        :param max_depth: the maximum number of path segments (None for no limit)
+        :type max_depth: int
+        :param policy: what to do with the links of capped templates, one of TRAP_POLICIES
+        :type policy: str
+        :param sample_rate: the fraction of links of capped templates to admit, for the 'sample' policy
+        :type sample_rate: float
+        """
+        if policy not in TRAP_POLICIES:
+            raise ValueError('policy must be one of: ' + ', '.join(TRAP_POLICIES))
+
+        self.max_per_template = max_per_template
+        self.max_depth = max_depth
+        self.policy = policy
+        self._sample_threshold = int(sample_rate * 0xffffffff) if policy == 'sample' else 0
+
+        self.templates = {}
+        self.depths = {}
+        self.suppressed = {}
+        self._suppressed_links = set()
+
+    def _suppress(self, link: str, template: str) -> bool:
+        """ Count, log and remember a suppressed link. """
+
+        self._suppressed_links.add(link)
+        self.suppressed[template] = self.suppressed.get(template, 0) + 1
+        logger.info('Suppressed ' + link + ' (trap template ' + template + ')')
+        return False
+
+    def allow(self, link: str) -> bool:
+        """ Count a new (relative) link, and check whether it may be added to the frontier. """
+
+        if link in self._suppressed_links:
+            return False
+
+        depth = path_depth(link)
+        self.depths[depth] = self.depths.get(depth, 0) + 1
+
+        template = path_template(link)
+        if self.max_depth is not None and depth > self.max_depth:
+            return self._suppress(link, template)
+
+        count = self.templates.get(template, 0) + 1
+        self.templates[template] = count
+        if count <= self.max_per_template:
+            return True
+
+        if zlib.crc32(link.encode('utf-8', 'surrogatepass')) < self._sample_threshold:
+            return True
+        return self._suppress(link, template)
+
+    def filter(self, links) -> set:
+        """ Return the links that may be added to the frontier. """
+
+        return {link for link in links if self.allow(link)}
+
+    def stats(self, top: int = 10) -> dict:
+        """ Return the trap counters, with the most suppressed templates. """
+
+        capped = sorted(self.suppressed.items(), key=lambda item: -item[1])[:top]
+        return {
+            'templates': len(self.templates),
+            'suppressed': sum(self.suppressed.values()),
+            'capped_templates': dict(capped),
+            'depths': dict(sorted(self.depths.items())),
+        }
+
+
+# --- Main function:
+
+
+def main():
+    for link in sys.argv[1:]:
+        print(path_template(link))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,426 @@
+import glob
+import io
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+from datetime import (
+    datetime,
+    timezone
+)
+from do_crawler.page_fetcher import FetchSession
+from http.client import HTTPResponse
+from urllib.error import (
+    HTTPError,
+    URLError
+)
+from urllib.parse import urlsplit
+from urllib.request import Request
+
+
+logger = logging.getLogger(__name__)
+
+WARC_VERSION = b'WARC/1.1'
+# The versions that can be read (WARC/1.0 files are written by many other tools).
+READABLE_WARC_VERSIONS = {'WARC/1.0', 'WARC/1.1'}
+LATENCY_HEADER = 'WARC-X-Fetch-Latency'
+INDEX_SUFFIX = '.idx'
+READ_CHUNK_SIZE = 1 << 16
+REPLAY_LATENCY_MODES = ('simulate', 'none')
+
+# Headers that describe the transfer rather than the body (which is stored decoded).
+_HOP_HEADERS = {'transfer-encoding', 'connection', 'keep-alive'}
+
+
+# --- WARC helper functions:
+
+
+def _record_id() -> str:
+    return '<urn:uuid:' + str(uuid.uuid4()) + '>'
+
+
+def _warc_date() -> str:
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _build_record(warc_type: str, headers: list, block: bytes) -> bytes:
+    """ Serialize a WARC record: the version line, the named fields, then the block. """
+
+    lines = [WARC_VERSION, b'WARC-Type: ' + warc_type.encode('ascii')]
+    lines.extend((name + ': ' + value).encode('utf-8') for name, value in headers)
+    lines.append(b'Content-Length: ' + str(len(block)).encode('ascii'))
+    return b'\r\n'.join(lines) + b'\r\n\r\n' + block + b'\r\n\r\n'
+
+
+def _parse_record(data: bytes) -> tuple:
+    """ Split an (uncompressed) WARC record into a dict of its fields and its block. """
+
+    head, _, rest = data.partition(b'\r\n\r\n')
+    lines = head.decode('utf-8').split('\r\n')
+    if lines[0] not in READABLE_WARC_VERSIONS:
+        raise ValueError('Not a WARC/1.0 or WARC/1.1 record: ' + lines[0])
+
+    fields = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        fields[name.strip()] = value.strip()
+    return fields, rest[:int(fields['Content-Length'])]
+
+
+def http_request_block(url: str, headers: dict) -> bytes:
+    """ The HTTP/1.1 GET request for a URL, as a WARC request record block. """
+
+    parts = urlsplit(url)
+    target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+    lines = ['GET ' + target + ' HTTP/1.1', 'Host: ' + parts.netloc]
+    lines.extend(name + ': ' + value for name, value in headers.items() if name.lower() != 'host')
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+def http_response_block(status: int, reason: str, headers: list, body: bytes, version: int = 11) -> bytes:
+    """
+    An HTTP response, as a WARC response record block. The body is stored decoded, so transfer
+    headers are dropped and Content-Length is set to the size of the body.
+    """
+    lines = ['HTTP/%d.%d %d %s' % (version // 10, version % 10, status, reason)]
+    lines.extend(name + ': ' + value for name, value in headers
+                 if name.lower() not in _HOP_HEADERS and name.lower() != 'content-length')
+    lines.append('Content-Length: ' + str(len(body)))
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+def iter_records(path: str):
+    """
+    Scan a .warc.gz file, record by record (each record is a gzip member).
+
+    The file is read in chunks of READ_CHUNK_SIZE, each fed to the decompressor of the current
+    member; the bytes past the end of a member start the next one.
+
+    :return: an iterator of (offset, length, fields, block) tuples
+    """
+    with open(path, 'rb') as f:
+        offset = 0
+        data = f.read(READ_CHUNK_SIZE)
+        while data:
+            decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+            parts = []
+            length = 0
+            while True:
+                parts.append(decompressor.decompress(data))
+                length += len(data) - len(decompressor.unused_data)
+                if decompressor.eof:
+                    data = decompressor.unused_data or f.read(READ_CHUNK_SIZE)
+                    break
+                data = f.read(READ_CHUNK_SIZE)
+                if not data:
+                    raise EOFError('Truncated WARC record at offset %d of %s' % (offset, path))
+
+            fields, block = _parse_record(b''.join(parts))
+            yield offset, length, fields, block
+            offset += length
+
+
+# --- WarcWriter:
+
+
+class WarcWriter(object):
+    """
+    Writes fetched requests and responses to WARC files (WARC/1.1, one gzip member per record, so any
+    record can be read from its offset alone).
+
+    Files are named <prefix>-00000.warc.gz, <prefix>-00001.warc.gz, ..., from a path like
+    prefix.warc.gz, and a new file is started once one reaches `max_size` bytes. Next to each file,
+    an index (<file>.idx) lists one line per response: the URL, the offset and length of the record,
+    the HTTP status and the fetch latency. Records are written as they arrive, and are thread-safe.
+    """
+
+    def __init__(self, path: str, max_size: int = 1 << 30):
+        """
+        :param path: the file name prefix, e.g. crawl.warc.gz
+        :type path: str
+        :param max_size: the size at which to start a new file
+        :type max_size: int
+        """
+        self.prefix = _warc_prefix(path)
+        self.max_size = max_size
+        self.serial = -1
+        self.records = 0
+        self.paths = []
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._index = None
+
+    def _rotate(self):
+        """ Close the current file (if any), and start the next one with a warcinfo record. Needs self._lock. """
+
+        self._close_files()
+        self.serial += 1
+        path = '%s-%05d.warc.gz' % (self.prefix, self.serial)
+        self.paths.append(path)
+
+        self._file = open(path, 'wb')
+        self._index = open(path + INDEX_SUFFIX, 'w', encoding='utf-8')
+        info = b'software: do_crawler\r\nformat: WARC File Format 1.1\r\n'
+        self._write([('WARC-Record-ID', _record_id()), ('WARC-Date', _warc_date()),
+                     ('WARC-Filename', os.path.basename(path)), ('Content-Type', 'application/warc-fields')],
+                    'warcinfo', info)
+
+    def _write(self, headers: list, warc_type: str, block: bytes) -> tuple:
+        """
+        Compress and append a record. Needs self._lock.
+
+        :return: the (offset, length) of the record in the file
+        """
+        member = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        data = member.compress(_build_record(warc_type, headers, block)) + member.flush()
+
+        offset = self._file.tell()
+        self._file.write(data)
+        self.records += 1
+        return offset, len(data)
+
+    def write_exchange(self, url: str, request_headers: dict, status: int, reason: str, headers: list,
+                       body: bytes, latency: float, aliases=(), version: int = 11, truncated: bool = False):
+        """
+        Record a request and its response.
+
+        :param url: the final URL of the response
+        :param request_headers: the headers the request was sent with
+        :param headers: the response headers, as (name, value) pairs
+        :param body: the (decoded) response body
+        :param latency: seconds from sending the request to receiving the whole body
+        :param aliases: other URLs to index the response under (e.g. the URL that redirected to it)
+        :param truncated: whether the body wasn't read (e.g. it wasn't HTML), and is left out
+        """
+        response_id = _record_id()
+        date = _warc_date()
+        response_block = http_response_block(status, reason, headers, body, version)
+        request_block = http_request_block(url, request_headers)
+
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.max_size:
+                self._rotate()
+
+            fields = [('WARC-Record-ID', response_id), ('WARC-Date', date), ('WARC-Target-URI', url),
+                      (LATENCY_HEADER, '%.6f' % latency), ('Content-Type', 'application/http;msgtype=response')]
+            if truncated:
+                fields.append(('WARC-Truncated', 'unspecified'))
+            offset, length = self._write(fields, 'response', response_block)
+            self._write(
+                [('WARC-Record-ID', _record_id()), ('WARC-Date', date), ('WARC-Target-URI', url),
+                 ('WARC-Concurrent-To', response_id), ('Content-Type', 'application/http;msgtype=request')],
+                'request', request_block
+            )
+
+            for indexed_url in (url,) + tuple(aliases):
+                self._index.write('%s\t%d\t%d\t%d\t%.6f\n' % (indexed_url, offset, length, status, latency))
+            self._file.flush()
+            self._index.flush()
+
+    def record(self, url: str, response, body: bytes, latency: float):
+        """
+        Record a response from the urllib opener (or an HTTPError), fetched for a URL.
+
+        :param body: the response body; None, if it wasn't read
+        """
+        final_url = response.geturl() or url
+        self.write_exchange(
+            final_url, {'User-Agent': 'do_crawler'}, response.status, response.reason or '',
+            list(response.headers.items()), body or b'', latency,
+            aliases=(url,) if url != final_url else (), version=getattr(response, 'version', 11),
+            truncated=body is None
+        )
+
+    def _close_files(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = self._index = None
+
+    def close(self):
+        """ Close the current file. """
+
+        with self._lock:
+            self._close_files()
+
+
+def _warc_prefix(path: str) -> str:
+    """ The file name prefix of a WARC path (crawl.warc.gz -> crawl). """
+
+    for suffix in ('.warc.gz', '.warc', '.gz'):
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def warc_paths(path: str) -> list:
+    """ The files of a (possibly rotated) WARC: the path itself, if it exists, or its numbered files. """
+
+    if os.path.isfile(path):
+        return [path]
+    return sorted(glob.glob(glob.escape(_warc_prefix(path)) + '-[0-9]*.warc.gz'))
+
+
+# --- WarcIndex:
+
+
+class WarcIndex(object):
+    """
+    Looks up recorded responses by URL. The sidecar indexes are loaded into memory (or rebuilt by
+    scanning the WARC, for files without one), so each lookup is a dict lookup and one read at a
+    known offset.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: a WARC file, or the path given to WarcWriter (to load all of its files)
+        :type path: str
+        """
+        self.paths = warc_paths(path)
+        if not self.paths:
+            raise FileNotFoundError('No WARC files at ' + path)
+
+        self.entries = {}
+        for file_id, warc_path in enumerate(self.paths):
+            if os.path.isfile(warc_path + INDEX_SUFFIX):
+                self._load_index(file_id, warc_path + INDEX_SUFFIX)
+            else:
+                self._scan(file_id, warc_path)
+
+        self._local = threading.local()
+
+    def _load_index(self, file_id: int, index_path: str):
+        with open(index_path, encoding='utf-8') as f:
+            for line in f:
+                url, offset, length, status, latency = line.rstrip('\n').split('\t')
+                self.entries[url] = (file_id, int(offset), int(length), float(latency))
+
+    def _scan(self, file_id: int, warc_path: str):
+        logger.info('No index for ' + warc_path + ', scanning it')
+        for offset, length, fields, _ in iter_records(warc_path):
+            if fields.get('WARC-Type') == 'response':
+                self.entries[fields['WARC-Target-URI']] = (file_id, offset, length,
+                                                           float(fields.get(LATENCY_HEADER, 0)))
+
+    def _file(self, file_id: int):
+        """ This thread's handle on a WARC file (so concurrent lookups don't share a file position). """
+
+        files = getattr(self._local, 'files', None)
+        if files is None:
+            files = self._local.files = {}
+        if file_id not in files:
+            files[file_id] = open(self.paths[file_id], 'rb')
+        return files[file_id]
+
+    def __contains__(self, url: str) -> bool:
+        return url in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, url: str) -> tuple:
+        """
+        Read the recorded response for a URL.
+
+        :return: the (HTTP response block, latency) pair; None, if the URL wasn't recorded
+        """
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+
+        file_id, offset, length, latency = entry
+        f = self._file(file_id)
+        f.seek(offset)
+        _, block = _parse_record(zlib.decompress(f.read(length), zlib.MAX_WBITS | 16))
+        return block, latency
+
+
+# --- ReplaySession:
+
+
+class _RecordedSocket(object):
+    """ Just enough of a socket for HTTPResponse to parse a recorded response from. """
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def makefile(self, mode: str):
+        # Buffered, like a real socket's file, so the response supports peek() (e.g. for gzip sniffing).
+        return io.BufferedReader(io.BytesIO(self._data))
+
+
+class ReplaySession(FetchSession):
+    """
+    A fetch session that serves responses from a recorded WARC instead of the network, so a crawl can
+    be repeated offline, with the same output every time. URLs that weren't recorded fail as if the
+    host were unreachable.
+
+    With latency='simulate', each response takes as long as it took when it was recorded; with 'none',
+    responses are served as fast as they can be read.
+    """
+
+    def __init__(self, path: str, latency: str = 'none', **kwargs):
+        """
+        :param path: the WARC file, or the path given to WarcWriter
+        :type path: str
+        :param latency: 'simulate' or 'none' (see REPLAY_LATENCY_MODES)
+        :type latency: str
+        """
+        if latency not in REPLAY_LATENCY_MODES:
+            raise ValueError('latency must be one of: ' + ', '.join(REPLAY_LATENCY_MODES))
+
+        super().__init__(**kwargs)
+        self.index = WarcIndex(path)
+        self.latency = latency
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def open(self, req: Request, started: float = None):
+        """ Serve the recorded response for a request (see FetchSession.open). """
+
+        recorded = self.index.get(req.full_url)
+        with self._lock:
+            if recorded is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if recorded is None:
+            raise URLError('Not in the archive: ' + req.full_url)
+
+        block, latency = recorded
+        if self.latency == 'simulate':
+            time.sleep(latency)
+
+        response = HTTPResponse(_RecordedSocket(block), method='GET')
+        response.begin()
+        response.url = req.full_url
+        if response.status >= 400:
+            raise HTTPError(req.full_url, response.status, response.reason, response.headers, response)
+        return response
+
+    def prefetch(self, urls):
+        """ Nothing to resolve when replaying. """
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        with self._lock:
+            stats['replay'] = {'hits': self.hits, 'misses': self.misses, 'recorded': len(self.index)}
+        return stats
+
+
+# --- Main function:
+
+
+def main():
+    for offset, length, fields, block in iter_records(sys.argv[1]):
+        print(offset, length, fields.get('WARC-Type'), fields.get('WARC-Target-URI', ''))
+
+
+if __name__ == '__main__':
+    main()